@@ -0,0 +1,221 @@
+import math
+from datetime import datetime
+from typing import List, Optional
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app.database import db
+from app.gpa import GRADE_POINTS, calculate_cgpa, field_key, rebuild_totals
+
+# Cohort aggregates live in cohort_stats, one small document per cohort:
+#   grades.<grade>            graded subject results
+#   subjects.<code>.attempts  graded attempts of a subject
+#   subjects.<code>.fails     attempts graded F
+#   cgpa_histogram.<bucket>   students per 0.1 CGPA bucket (bucket = floor(cgpa * 10))
+#   applied                   keys of the latest completions counted, see record_completion
+# The histogram is of the CGPA over completed semesters: grades entered during
+# the current semester move a student's stored cgpa, not their bucket, until
+# the semester is completed.
+# A background job after complete_semester keeps them current with $inc;
+# rebuild_cohort_stats recomputes them from the student documents.
+#
+# Each student document records in COUNTED_FIELD the last semester counted
+# into the cohorts, so the job counts exactly the completed semesters after it.
+# A student without it (imported, or created before cohort stats existed) has
+# not been counted at all: the job starts from their first semester, and never
+# takes them out of a CGPA bucket they were never added to.
+
+ALL_STUDENTS = "all"
+PERCENTILES = (10, 25, 50, 75, 90)
+# Completion keys remembered per cohort; far more than can be retried at once
+APPLIED_KEYS_KEPT = 1000
+COUNTED_FIELD = "cohort_counted"
+# Students whose markers rebuild_cohort_stats writes per bulk request
+MARKER_BATCH_SIZE = 1000
+
+def cgpa_bucket(cgpa: Optional[float]) -> Optional[int]:
+    return None if cgpa is None else math.floor(round(cgpa * 10, 6))
+
+def _cohorts(batch: Optional[str]) -> List[str]:
+    return [ALL_STUDENTS, batch] if batch else [ALL_STUDENTS]
+
+async def record_completion(student: dict, graded_subjects: List[dict], old_cgpa: Optional[float],
+                            new_cgpa: Optional[float], key: str):
+    # Counts one completed semester, once per key: the job running this is
+    # retried after failures, possibly after some cohorts were already updated.
+    # A cohort that has the key does not match the filter.
+    inc = {}
+    for sub in graded_subjects:
+        grade = sub.get("grade")
+        if grade is None:
+            continue
+        code = field_key(sub["code"])
+        inc[f"grades.{field_key(grade)}"] = inc.get(f"grades.{field_key(grade)}", 0) + 1
+        inc[f"subjects.{code}.attempts"] = inc.get(f"subjects.{code}.attempts", 0) + 1
+        if grade == "F":
+            inc[f"subjects.{code}.fails"] = inc.get(f"subjects.{code}.fails", 0) + 1
+
+    old_bucket, new_bucket = cgpa_bucket(old_cgpa), cgpa_bucket(new_cgpa)
+    if old_bucket != new_bucket:
+        if old_bucket is not None:
+            inc[f"cgpa_histogram.{old_bucket}"] = -1
+        if new_bucket is not None:
+            inc[f"cgpa_histogram.{new_bucket}"] = 1
+
+    if not inc:
+        return
+    update = {
+        "$inc": inc,
+        "$set": {"updated_at": datetime.utcnow()},
+        "$push": {"applied": {"$each": [key], "$slice": -APPLIED_KEYS_KEPT}},
+    }
+    for cohort in _cohorts(student.get("batch")):
+        query = {"_id": cohort, "applied": {"$ne": key}}
+        try:
+            await db.cohort_stats.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # Already counted, or another completion created the cohort document
+            # first; without the upsert only the second case matches
+            await db.cohort_stats.update_one(query, update)
+
+async def mark_counted(student_id: ObjectId, semester_number: int):
+    # $max, so a job that read the student before another one ran cannot move it back
+    await db.students.update_one({"_id": student_id}, {"$max": {COUNTED_FIELD: semester_number}})
+
+def _percentile(histogram: dict, total: int, p: int) -> Optional[float]:
+    if not total:
+        return None
+    rank = math.ceil(p / 100 * total)
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return int(bucket) / 10
+    return None
+
+def summarize(stats: Optional[dict], cohort: str) -> dict:
+    stats = stats or {}
+    # A negative bucket means the counters drifted; it stays in, so the totals
+    # show it instead of hiding it, until a rebuild
+    histogram = {bucket: n for bucket, n in stats.get("cgpa_histogram", {}).items() if n}
+    students = sum(histogram.values())
+
+    subjects = []
+    for code, counts in stats.get("subjects", {}).items():
+        attempts = counts.get("attempts", 0)
+        fails = counts.get("fails", 0)
+        subjects.append({
+            "code": code,
+            "attempts": attempts,
+            "fails": fails,
+            "fail_rate": round(fails / attempts, 4) if attempts else 0.0
+        })
+    subjects.sort(key=lambda s: s["fail_rate"], reverse=True)
+
+    grades = stats.get("grades", {})
+    return {
+        "cohort": cohort,
+        "students": students,
+        "grade_distribution": {grade: grades.get(grade, 0) for grade in GRADE_POINTS if grades.get(grade)},
+        "subjects": subjects,
+        "cgpa_percentiles": {f"p{p}": _percentile(histogram, students, p) for p in PERCENTILES},
+        "updated_at": stats.get("updated_at"),
+    }
+
+async def get_cohort_stats(cohort: str) -> dict:
+    # applied is bookkeeping for record_completion and can hold APPLIED_KEYS_KEPT keys
+    return summarize(await db.cohort_stats.find_one({"_id": cohort}, {"applied": 0}), cohort)
+
+# Graded subjects of completed semesters, grouped by batch, subject and grade
+GRADES_PIPELINE = [
+    {"$project": {"batch": 1, "current_semester": 1, "semesters": 1}},
+    {"$unwind": "$semesters"},
+    {"$match": {"$expr": {"$lt": ["$semesters.semester_number", "$current_semester"]}}},
+    {"$unwind": "$semesters.subjects"},
+    {"$match": {"semesters.subjects.grade": {"$ne": None}}},
+    {"$group": {
+        "_id": {"batch": "$batch", "code": "$semesters.subjects.code", "grade": "$semesters.subjects.grade"},
+        "count": {"$sum": 1}
+    }},
+]
+
+# The same for students whose semesters are in the semesters collection
+SPLIT_GRADES_PIPELINE = [
+    {"$lookup": {"from": "students", "localField": "student_id", "foreignField": "_id", "as": "student"}},
+    {"$unwind": "$student"},
+    {"$match": {"$expr": {"$lt": ["$semester_number", "$student.current_semester"]}}},
+    {"$unwind": "$subjects"},
+    {"$match": {"subjects.grade": {"$ne": None}}},
+    {"$group": {
+        "_id": {"batch": "$student.batch", "code": "$subjects.code", "grade": "$subjects.grade"},
+        "count": {"$sum": 1}
+    }},
+]
+
+# Completed semesters per student, for replaying the CGPA the histogram counts
+COMPLETED_PIPELINE = [
+    {"$project": {"batch": 1, "semesters": {"$filter": {
+        "input": "$semesters", "cond": {"$lt": ["$$this.semester_number", "$current_semester"]}
+    }}}},
+]
+
+SPLIT_COMPLETED_PIPELINE = [
+    {"$lookup": {"from": "students", "localField": "student_id", "foreignField": "_id", "as": "student"}},
+    {"$unwind": "$student"},
+    {"$match": {"$expr": {"$lt": ["$semester_number", "$student.current_semester"]}}},
+    {"$group": {
+        "_id": "$student_id",
+        "batch": {"$first": "$student.batch"},
+        "semesters": {"$push": {"semester_number": "$semester_number", "subjects": "$subjects"}}
+    }},
+]
+
+async def rebuild_cohort_stats() -> int:
+    # Full recomputation, for backfills or if the incremental counters drift.
+    # Grade counts are grouped in the database; the CGPA histogram replays each
+    # student's completed semesters, as record_cohort_stats does, and each
+    # student's COUNTED_FIELD is set to the last semester included here.
+    # Completions counted while this runs may be lost, so run it when few are.
+    cohorts = {}
+    counted = {}
+
+    def cohort_docs(batch):
+        for cohort in _cohorts(batch):
+            yield cohorts.setdefault(cohort, {"_id": cohort, "grades": {}, "subjects": {}, "cgpa_histogram": {}})
+
+    # Either semester layout, or both while a migration is under way
+    for grades in (db.students.aggregate(GRADES_PIPELINE), db.semesters.aggregate(SPLIT_GRADES_PIPELINE)):
+        async for row in grades:
+            key = row["_id"]
+            for doc in cohort_docs(key.get("batch")):
+                grade = field_key(key["grade"])
+                doc["grades"][grade] = doc["grades"].get(grade, 0) + row["count"]
+                subject = doc["subjects"].setdefault(field_key(key["code"]), {"attempts": 0, "fails": 0})
+                subject["attempts"] += row["count"]
+                if key["grade"] == "F":
+                    subject["fails"] += row["count"]
+
+    for students in (db.students.aggregate(COMPLETED_PIPELINE), db.semesters.aggregate(SPLIT_COMPLETED_PIPELINE)):
+        async for student in students:
+            semesters = student.get("semesters") or []
+            if semesters:
+                last = max(sem["semester_number"] for sem in semesters)
+                counted[student["_id"]] = max(counted.get(student["_id"], 0), last)
+            bucket = cgpa_bucket(calculate_cgpa(rebuild_totals(semesters)))
+            if bucket is None:
+                continue
+            for doc in cohort_docs(student.get("batch")):
+                doc["cgpa_histogram"][str(bucket)] = doc["cgpa_histogram"].get(str(bucket), 0) + 1
+
+    now = datetime.utcnow()
+    for doc in cohorts.values():
+        doc["updated_at"] = now
+    if cohorts:
+        await db.cohort_stats.bulk_write(
+            [ReplaceOne({"_id": cohort}, doc, upsert=True) for cohort, doc in cohorts.items()],
+            ordered=False
+        )
+    markers = [UpdateOne({"_id": student_id}, {"$set": {COUNTED_FIELD: last}}) for student_id, last in counted.items()]
+    for start in range(0, len(markers), MARKER_BATCH_SIZE):
+        await db.students.bulk_write(markers[start:start + MARKER_BATCH_SIZE], ordered=False)
+    return len(cohorts)
@@ -1,54 +1,260 @@
 import os
+import copy
+import hmac
+import hashlib
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
-from fastapi import Depends, HTTPException, status
-from app.database import db
-from app.models import TokenData, StudentModel
+from fastapi import Depends, Header, HTTPException, status
+from app.repositories import get_student_repository
+from app.models import TokenData
+from app.cache import LRUCache
+from app.revocation import get_revocation_list
+from app.metrics import register_cache, PASSWORD_HASH_SECONDS, PASSWORD_HASH_QUEUE_SECONDS
 
 # Load environment variables
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key_here")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 1024))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+# Threads hashing imported passwords, kept apart from the login pool
+PASSWORD_HASH_IMPORT_WORKERS = int(os.getenv("PASSWORD_HASH_IMPORT_WORKERS", max(1, PASSWORD_HASH_WORKERS // 2)))
+# Admin endpoints are disabled unless a key is configured
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+# Bearer token for Prometheus scrapes of /metrics; the admin key works too
+METRICS_API_KEY = os.getenv("METRICS_API_KEY")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Pinning min/max rounds to the configured cost makes passlib flag hashes made
+# with any other cost, so they are transparently rehashed on the next login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Student documents keyed by (reg_no, projection). Writes in this process
+# invalidate them; the TTL bounds staleness from writes made by other workers.
+principal_cache = LRUCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+register_cache("principal", principal_cache.stats)
+
+# Claims of tokens whose signature has already been verified, keyed by the
+# token's digest and kept until the token expires. Revocation is still checked
+# on every request, so a cached token stops working as soon as it is revoked.
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+register_cache("token", token_cache.stats)
+
+# Other per-student caches register here to be dropped together with the principal
+_invalidation_listeners = []
+
+def on_user_invalidated(listener):
+    _invalidation_listeners.append(listener)
+    return listener
+
+# Cache slots of every projection in use, so invalidate_user can clear them all
+_projection_keys = set()
+
+def invalidate_user(reg_no: str):
+    for projection_key in _projection_keys:
+        principal_cache.pop((reg_no, projection_key))
+    for listener in _invalidation_listeners:
+        listener(reg_no)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+# A batch of imports queues here, not ahead of logins in _hash_pool
+_import_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_IMPORT_WORKERS, thread_name_prefix="bcrypt-import")
+
+def _timed(operation: str, func):
+    # Splits each call into time queued for a worker and bcrypt time proper
+    submitted = time.perf_counter()
+
+    def run(*args):
+        started = time.perf_counter()
+        PASSWORD_HASH_QUEUE_SECONDS.observe(started - submitted, operation=operation)
+        try:
+            return func(*args)
+        finally:
+            PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, operation=operation)
+    return run
+
+async def _run_in_hash_pool(operation: str, func, *args):
+    global _hash_pending
+    # Reject fast instead of queueing logins behind an unbounded backlog
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_pool, _timed(operation, func), *args)
+    finally:
+        _hash_pending -= 1
+
+async def hash_password(password: str) -> str:
+    return await _run_in_hash_pool("hash", pwd_context.hash, password)
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    # Bulk imports hash a whole batch on their own pool. The batch size bounds
+    # the work, so these wait for a worker instead of being rejected like
+    # logins, and never sit in front of a login in _hash_pool's queue.
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(
+        loop.run_in_executor(_import_hash_pool, _timed("import", pwd_context.hash), password) for password in passwords
+    ))
+
+async def check_password(plain_password: str, hashed_password: str):
+    # Returns (valid, new_hash); new_hash is set when the stored hash should be replaced
+    return await _run_in_hash_pool("verify", pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # iat lets a password change revoke every token issued before it
+    to_encode.update({"exp": expire, "iat": time.time()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+# Fields only the password check may load
+PRIVATE_FIELDS = {"hashed_password": 0}
+# Aggregation expression (MongoDB 4.4+) keeping only the semester being studied
+CURRENT_SEMESTER_ONLY = {
+    "$filter": {
+        "input": "$semesters",
+        "cond": {"$eq": ["$$this.semester_number", "$current_semester"]}
+    }
+}
+
+class CurrentUser:
+    # Dependency resolving the authenticated student, loading only the fields
+    # the route declares. reg_no and _id are always included.
+
+    def __init__(self, projection: Optional[dict] = None):
+        if projection is None:
+            projection = PRIVATE_FIELDS
+        elif not all(value == 0 for value in projection.values()):
+            projection = {"reg_no": 1, **projection}
+        self.projection = projection
+        self.cache_key = repr(sorted(projection.items()))
+        _projection_keys.add(self.cache_key)
+
+    async def __call__(self, token: str = Depends(oauth2_scheme)):
+        return await self.load((await verify_token(token)).username)
+
+    async def load(self, username: str, min_version: Optional[int] = None):
+        key = (username, self.cache_key)
+        user = principal_cache.get(key)
+        if user is not None and (min_version is None or user.get("version", 0) >= min_version):
+            # Each request gets its own copy, nested semesters and subjects
+            # included, so one cannot leak changes into another
+            return copy.deepcopy(user)
+
+        # We are using reg_no as the username for login
+        user = await get_student_repository().get_by_reg_no(username, self.projection)
+        if user is None:
+            raise _credentials_exception()
+        # String form of _id, computed once per cache fill rather than per response
+        user["id"] = str(user["_id"])
+        principal_cache.set(key, user)
+        return copy.deepcopy(user)
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def _decode_token(token: str) -> TokenData:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    # We are using reg_no as the username for login
-    user = await db.students.find_one({"reg_no": token_data.username})
-    if user is None:
-        raise credentials_exception
-    return user
+            raise _credentials_exception()
+        # Tokens issued before iat was added count as issued at the epoch
+        token_data = TokenData(username=username, issued_at=payload.get("iat", 0), expires_at=payload["exp"])
+    except (JWTError, KeyError):
+        raise _credentials_exception()
+    return token_data
+
+async def verify_token(token: str) -> TokenData:
+    digest = token_digest(token)
+    token_data = token_cache.get(digest)
+    if token_data is None:
+        token_data = _decode_token(token)
+        token_cache.set(digest, token_data, ttl=token_data.expires_at - time.time())
+
+    revocation_list = get_revocation_list()
+    if revocation_list is not None and await revocation_list.is_revoked(digest, token_data.username, token_data.issued_at):
+        raise _credentials_exception()
+    return token_data
+
+def etag_for(student: dict) -> str:
+    # Every write to a student document bumps its version; older documents count as 0
+    return f'"{student["_id"]}-{student.get("version", 0)}"'
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Strong comparison: only the exact tag we sent matches, a weak W/ one never does
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+class VersionedUser(CurrentUser):
+    # CurrentUser for conditional GETs. With If-None-Match, only the version is
+    # read; a matching ETag ends the request with 304 before the document is
+    # loaded or serialized. The projection must include "version".
+
+    async def __call__(self, token: str = Depends(oauth2_scheme), if_none_match: Optional[str] = Header(default=None)):
+        username = (await verify_token(token)).username
+        if if_none_match is None:
+            return await self.load(username)
+
+        current = await get_student_repository().get_by_reg_no(username, {"version": 1})
+        if current is None:
+            raise _credentials_exception()
+        etag = etag_for(current)
+        if _etag_matches(if_none_match, etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        # The client is behind; make sure it is not answered from a stale cached principal
+        return await self.load(username, min_version=current.get("version", 0))
+
+# Whole student document apart from the password hash
+get_current_user = CurrentUser()
+
+def require_admin(x_admin_key: Optional[str] = Header(default=None)):
+    if not ADMIN_API_KEY or not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+def require_metrics_access(authorization: Optional[str] = Header(default=None), x_admin_key: Optional[str] = Header(default=None)):
+    # Prometheus sends its credentials as "Authorization: Bearer <key>"
+    scheme, _, token = (authorization or "").partition(" ")
+    if METRICS_API_KEY and scheme.lower() == "bearer" and hmac.compare_digest(token.strip(), METRICS_API_KEY):
+        return
+    require_admin(x_admin_key)
@@ -0,0 +1,133 @@
+import os
+import logging
+from datetime import datetime
+from typing import List, Optional
+from pymongo.errors import DuplicateKeyError
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+# Tokens of prior conversation (summary + verbatim turns) sent with each message
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 2000))
+# Upper bound for the rolling summary of turns that fell out of the window
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", 400))
+# Most recent unsummarized turns read per request
+CHAT_RECENT_TURNS_LIMIT = int(os.getenv("CHAT_RECENT_TURNS_LIMIT", 50))
+# Oldest unsummarized turns folded into the summary per message
+CHAT_SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", 50))
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a student and their academic advisor. "
+    "Given the current summary and the turns that follow it, return an updated summary. "
+    "Keep facts the student shared, advice already given and open questions. "
+    f"Plain prose, at most {CHAT_SUMMARY_MAX_TOKENS * 3 // 4} words."
+)
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; cheap and good enough for budgeting
+    return len(text) // 4 + 1
+
+def _clip(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars]
+
+async def load_context(student_id):
+    # Returns (summary_doc, window, overflow).
+    # window: newest unsummarized turns that fit the budget, oldest first.
+    # overflow: the oldest unsummarized turns before the window, at most
+    # CHAT_SUMMARY_BATCH_TURNS, to be folded into the summary. Turns beyond
+    # that are folded by the following messages.
+    summary_doc = await db.chat_summaries.find_one({"student_id": student_id})
+
+    query = {"student_id": student_id}
+    if summary_doc and summary_doc.get("summarized_until"):
+        query["_id"] = {"$gt": summary_doc["summarized_until"]}
+    recent = await db.chat_messages.find(query).sort("_id", -1).limit(CHAT_RECENT_TURNS_LIMIT).to_list(CHAT_RECENT_TURNS_LIMIT)
+
+    budget = CHAT_CONTEXT_TOKEN_BUDGET
+    if summary_doc:
+        budget -= estimate_tokens(summary_doc["summary"])
+
+    window = []
+    for turn in recent:
+        cost = estimate_tokens(turn["text"])
+        if cost > budget:
+            break
+        window.append(turn)
+        budget -= cost
+
+    # Gemini expects a conversation to open with a user turn
+    while window and window[-1]["role"] != "user":
+        window.pop()
+    window.reverse()
+
+    if len(recent) < CHAT_RECENT_TURNS_LIMIT:
+        # Every unsummarized turn was read
+        overflow = recent[len(window):][::-1][:CHAT_SUMMARY_BATCH_TURNS]
+    else:
+        # Older unsummarized turns may not have been read; page up from the summary
+        if window:
+            query["_id"] = {**query.get("_id", {}), "$lt": window[0]["_id"]}
+        overflow = await db.chat_messages.find(query).sort("_id", 1).limit(CHAT_SUMMARY_BATCH_TURNS).to_list(CHAT_SUMMARY_BATCH_TURNS)
+    return summary_doc, window, overflow
+
+def build_contents(summary_doc: Optional[dict], window: List[dict], message: str) -> List[dict]:
+    contents = []
+    if summary_doc:
+        contents.append({"role": "user", "parts": [f"Summary of our earlier conversation: {summary_doc['summary']}"]})
+        contents.append({"role": "model", "parts": ["Noted."]})
+    for turn in window:
+        contents.append({"role": turn["role"], "parts": [turn["text"]]})
+    contents.append({"role": "user", "parts": [message]})
+    return contents
+
+async def append_turns(student_id, user_text: str, model_text: str):
+    now = datetime.utcnow()
+    await db.chat_messages.insert_many([
+        {"student_id": student_id, "role": "user", "text": user_text, "created_at": now},
+        {"student_id": student_id, "role": "model", "text": model_text, "created_at": now},
+    ])
+
+async def fold_into_summary(student_id, summary_doc: Optional[dict], overflow: List[dict], llm):
+    # Incremental: only the turns that just left the window are sent, together
+    # with the previous summary, never the whole conversation.
+    if not overflow:
+        return
+
+    previous = summary_doc["summary"] if summary_doc else "(empty)"
+    transcript = "\n".join(f"{turn['role']}: {turn['text']}" for turn in overflow)
+    prompt = f"Current summary:\n{previous}\n\nNew turns:\n{transcript}"
+
+    try:
+        model = await llm.get_cached_model(SUMMARY_INSTRUCTION)
+        summary = await llm.generate(model, prompt)
+    except Exception as e:
+        # The turns stay unsummarized and are retried on the next message
+        logger.error(f"Chat summary update failed: {e}")
+        return
+
+    fields = {
+        "summary": _clip(summary, CHAT_SUMMARY_MAX_TOKENS),
+        "summarized_until": overflow[-1]["_id"],
+        "updated_at": datetime.utcnow()
+    }
+    # Only over the summary this fold started from: when two messages fold the
+    # same turns at once, the second write finds the summary moved on and is dropped
+    if summary_doc is None:
+        try:
+            await db.chat_summaries.insert_one({"student_id": student_id, **fields})
+        except DuplicateKeyError:
+            pass
+    else:
+        await db.chat_summaries.update_one(
+            {"student_id": student_id, "summarized_until": summary_doc.get("summarized_until")},
+            {"$set": fields}
+        )
+
+async def get_history_page(student_id, limit: int, before=None):
+    query = {"student_id": student_id}
+    if before is not None:
+        query["_id"] = {"$lt": before}
+    turns = await db.chat_messages.find(query).sort("_id", -1).limit(limit).to_list(limit)
+    turns.reverse()
+    return turns
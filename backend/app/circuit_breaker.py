@@ -0,0 +1,98 @@
+import time
+from contextlib import contextmanager
+from typing import Callable
+from app.metrics import Counter, Gauge
+
+BREAKER_STATE = Gauge("advisr_circuit_breaker_state", "0 closed, 1 half-open, 2 open", ["breaker"])
+BREAKER_TRANSITIONS = Counter("advisr_circuit_breaker_transitions_total", "Breaker state changes, by new state", ["breaker", "state"])
+BREAKER_REJECTED = Counter("advisr_circuit_breaker_rejected_total", "Calls failed fast without reaching the dependency", ["breaker"])
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpen(Exception):
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    # Stops calling a dependency that keeps failing, so callers give up at once
+    # instead of each waiting out its own timeout.
+    #
+    #   closed     calls go through; failure_threshold failures in a row open it
+    #   open       calls raise CircuitOpen for reset_seconds
+    #   half-open  one trial call goes through; success closes, failure reopens
+    #
+    # Per process and only touched from the event loop, so no locking.
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None
+        BREAKER_STATE.set(0, breaker=name)
+
+    def _transition(self, state: str):
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], breaker=self.name)
+        BREAKER_TRANSITIONS.inc(breaker=self.name, state=state)
+
+    def allow(self):
+        # Raises CircuitOpen; otherwise the caller must report success or failure
+        if self.failure_threshold <= 0:
+            return
+        now = time.monotonic()
+        if self.state == OPEN:
+            waited = now - self._opened_at
+            if waited < self.reset_seconds:
+                BREAKER_REJECTED.inc(breaker=self.name)
+                raise CircuitOpen(self.name, self.reset_seconds - waited)
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # A trial that never reported back (e.g. cancelled) stops blocking after reset_seconds
+            if self._trial_started is not None and now - self._trial_started < self.reset_seconds:
+                BREAKER_REJECTED.inc(breaker=self.name)
+                raise CircuitOpen(self.name, self.reset_seconds - (now - self._trial_started))
+            self._trial_started = now
+
+    def success(self):
+        self._failures = 0
+        self._trial_started = None
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def failure(self):
+        self._failures += 1
+        self._trial_started = None
+        if self.failure_threshold <= 0:
+            return
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            if self.state != OPEN:
+                self._transition(OPEN)
+
+    def release(self):
+        # The call ended without telling us anything about the dependency
+        self._trial_started = None
+
+    @contextmanager
+    def guard(self, is_failure: Callable[[Exception], bool] = lambda e: True):
+        # Wraps one call; errors for which is_failure is False (e.g. bad input)
+        # and cancellations leave the breaker as it was
+        self.allow()
+        try:
+            yield
+        except Exception as e:
+            if is_failure(e):
+                self.failure()
+            else:
+                self.release()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.success()
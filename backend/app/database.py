@@ -1,13 +1,148 @@
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import logging
+import threading
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from dotenv import load_dotenv
+from app.metrics import MongoCommandMetrics, MongoPoolMetrics
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+DATABASE_NAME = os.getenv("MONGODB_DATABASE", "advisr_db")
+
+# Connection pool, per worker process. A worker serves every request on one
+# event loop, so the pool caps its concurrent MongoDB operations; requests
+# beyond that wait up to MONGO_WAIT_QUEUE_TIMEOUT_MS for a connection.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = os.getenv("MONGO_MAX_IDLE_TIME_MS")
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000))
+# How long an operation waits for a usable server (pymongo's default is 30s);
+# while the primary is unreachable requests fail after this instead of hanging
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = os.getenv("MONGO_SOCKET_TIMEOUT_MS")
+# The routes read their own writes (version checks, guarded updates), so
+# anything but primary is only safe for read-only replicas of reporting data
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# Write concern: unset uses the server's default (majority on replica sets)
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN")
+MONGO_JOURNAL = os.getenv("MONGO_JOURNAL")
+
+def client_options() -> dict:
+    # Keyword arguments for AsyncIOMotorClient; unset options keep the driver's defaults
+    options = {
+        "appname": "advisr-backend",
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+    }
+    for name, value in (
+        ("maxIdleTimeMS", MONGO_MAX_IDLE_TIME_MS),
+        ("waitQueueTimeoutMS", MONGO_WAIT_QUEUE_TIMEOUT_MS),
+        ("socketTimeoutMS", MONGO_SOCKET_TIMEOUT_MS),
+    ):
+        if value is not None:
+            options[name] = int(value)
+    if MONGO_WRITE_CONCERN is not None:
+        options["w"] = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    if MONGO_JOURNAL is not None:
+        options["journal"] = MONGO_JOURNAL.lower() == "true"
+    return options
+
+# One client per worker process, normally created by the app lifespan. Motor
+# is imported on first use, so importing the app stays cheap and opens no
+# connections. A client is not fork-safe: a process that inherits one (e.g.
+# forked after a preloaded import) creates its own instead.
+client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def _create_client():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(
+        MONGODB_URL, event_listeners=[MongoCommandMetrics(), MongoPoolMetrics()], **client_options()
+    )
+
+def get_client():
+    global client, _client_pid
+    with _client_lock:
+        if client is None or _client_pid != os.getpid():
+            client = _create_client()
+            _client_pid = os.getpid()
+    return client
+
+def use_client(new_client, database_name: str = None):
+    # Points db at another client (and database), e.g. a benchmark's throwaway
+    # store or the in-process one in benchmarks/memory_mongo.py
+    global client, _client_pid, DATABASE_NAME
+    with _client_lock:
+        client, _client_pid = new_client, os.getpid()
+        if database_name is not None:
+            DATABASE_NAME = database_name
+
+def close_client():
+    global client
+    with _client_lock:
+        if client is not None and _client_pid == os.getpid():
+            client.close()
+        client = None
+
+class LazyDatabase:
+    # Module-level stand-in for client[DATABASE_NAME]; modules import it once
+    # and every access resolves against the current process's client.
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return get_client()[DATABASE_NAME][name]
+
+    def __getitem__(self, name):
+        return get_client()[DATABASE_NAME][name]
+
+db = LazyDatabase()
+
+# Every query the routes issue should be served by one of these
+# (verify_indexes.py fails on any collection scan)
+INDEXES = {
+    "students": [
+        IndexModel([("reg_no", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        # Outbox sweep (app/jobs.py); only students with pending jobs are indexed
+        IndexModel([("pending_jobs.at", ASCENDING)], partialFilterExpression={"pending_jobs.at": {"$exists": True}}),
+    ],
+    "chat_messages": [
+        IndexModel([("student_id", ASCENDING), ("_id", DESCENDING)]),
+    ],
+    "chat_summaries": [
+        IndexModel([("student_id", ASCENDING)], unique=True),
+    ],
+    # Used when SEMESTER_STORAGE=split
+    "semesters": [
+        IndexModel([("student_id", ASCENDING), ("semester_number", ASCENDING)], unique=True),
+    ],
+    # Background jobs (app/jobs.py): one waiting job per key, claimed by due time
+    "jobs": [
+        IndexModel([("key", ASCENDING)], unique=True, partialFilterExpression={"state": "queued"}),
+        IndexModel([("state", ASCENDING), ("run_at", ASCENDING)]),
+        IndexModel([("state", ASCENDING), ("lease_until", ASCENDING)]),
+    ],
+}
 
-client = AsyncIOMotorClient(MONGODB_URL)
-db = client.advisr_db
+async def ensure_indexes():
+    # create_indexes is a no-op for indexes that already exist. Failures (e.g.
+    # existing duplicate reg_no/email values) are raised: the unique indexes are
+    # what settle concurrent registrations, so the app must not serve without them.
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except Exception as e:
+            logger.error(f"Could not ensure indexes on {collection}: {e}")
+            raise
 
 async def get_database():
     return db
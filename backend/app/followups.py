@@ -0,0 +1,81 @@
+import logging
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from app.jobs import JobQueue, job_handler
+from app.repositories import get_student_repository
+from app.analytics import COUNTED_FIELD, mark_counted, rebuild_cohort_stats, record_completion
+from app.database import db
+from app.gpa import apply_subjects, calculate_cgpa, empty_totals
+from app import semesters as semester_store
+
+logger = logging.getLogger(__name__)
+
+# Work that follows a write to a student but is not needed for the response.
+# complete_semester adds a cohort stats job to the student's outbox in the same
+# update that completes the semester (add_to_outbox in app/jobs.py), and
+# dispatches it once the response is sent; a job worker runs it later. Handlers
+# work from the stored documents rather than from what the request saw, so a
+# retried or merged job still does the right thing.
+
+COHORT_STATS = "cohort_stats"
+COHORT_REBUILD = "cohort_rebuild"
+# db.migrations entry set once a rebuild has given every student its counted marker
+COHORT_BACKFILL = "cohort_stats:counted"
+
+async def _enqueue(queue: JobQueue, job_type: str, student_id: Optional[ObjectId], merge: Optional[dict] = None):
+    try:
+        await queue.enqueue(job_type, student_id, merge)
+    except Exception as e:
+        # Only jobs with no outbox come here; a cohort rebuild recovers what they would have done
+        logger.error(f"Could not enqueue {job_type} for {student_id}: {e}")
+
+async def dispatch_followups(queue: JobQueue, student_id: ObjectId):
+    # Runs after the response. A failure leaves the jobs in the outbox for the sweep.
+    try:
+        await queue.dispatch(student_id)
+    except Exception as e:
+        logger.warning(f"Could not dispatch jobs of {student_id}, leaving them to the outbox sweep: {e}")
+
+@job_handler(COHORT_STATS)
+async def record_cohort_stats(student_id: ObjectId, payload: dict):
+    # Counts the completed semesters after the student's COUNTED_FIELD. Each
+    # semester is counted once per cohort (keyed by student and semester), with
+    # the CGPA before and after it replayed from the history.
+    student = await get_student_repository().get(
+        student_id, {"batch": 1, "current_semester": 1, "semesters": 1, COUNTED_FIELD: 1}
+    )
+    if student is None:
+        return
+    counted = student.get(COUNTED_FIELD, 0)
+    totals = empty_totals()
+    last = None
+    for sem in sorted(await semester_store.get_history(student), key=lambda s: s["semester_number"]):
+        if sem["semester_number"] >= student.get("current_semester", 1):
+            break
+        old_cgpa = calculate_cgpa(totals)
+        totals = apply_subjects(totals, sem["subjects"], sem["semester_number"])
+        if sem["semester_number"] > counted:
+            await record_completion(
+                student, sem["subjects"], old_cgpa, calculate_cgpa(totals), key=f"{student_id}:{sem['semester_number']}"
+            )
+            last = sem["semester_number"]
+    if last is not None:
+        await mark_counted(student_id, last)
+
+async def after_import(queue: JobQueue):
+    # Imported students arrive with completed semesters and no counted marker.
+    # Imports are rare and large, so one rebuild counts them all.
+    await _enqueue(queue, COHORT_REBUILD, None)
+
+async def backfill_cohort_stats(queue: JobQueue):
+    # Run at startup: until one rebuild has finished, students counted before
+    # markers existed have none, and their next completion would count them again
+    if await db.migrations.find_one({"_id": COHORT_BACKFILL}) is None:
+        await _enqueue(queue, COHORT_REBUILD, None)
+
+@job_handler(COHORT_REBUILD)
+async def rebuild_cohorts(student_id: Optional[ObjectId], payload: dict):
+    # Not about one student: enqueued with student_id None, so one job waits at a time
+    await rebuild_cohort_stats()
+    await db.migrations.update_one({"_id": COHORT_BACKFILL}, {"$set": {"done_at": datetime.utcnow()}}, upsert=True)
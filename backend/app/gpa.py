@@ -0,0 +1,110 @@
+from typing import Optional, List
+
+# Same scale as getGradePoint in frontend/src/lib/calculations.js
+GRADE_POINTS = {
+    "O": 10,
+    "A+": 9,
+    "A": 8,
+    "B+": 7,
+    "B": 6,
+    "C": 5,
+    "F": 0,
+}
+
+def field_key(value: str) -> str:
+    # Subject codes and grades become field names, which may not contain "." or start with "$"
+    return str(value).replace(".", "_").replace("$", "_")
+
+def grade_point(grade: Optional[str]) -> int:
+    return GRADE_POINTS.get(grade, 0)
+
+def calculate_sgpa(subjects: List[dict]) -> Optional[float]:
+    # Only graded subjects count; an F still counts its credits. calculateSGPA
+    # in frontend/src/lib/calculations.js applies the same rule.
+    total_points = 0
+    total_credits = 0
+    for sub in subjects:
+        if sub.get("grade") is None:
+            continue
+        total_points += grade_point(sub["grade"]) * sub["credits"]
+        total_credits += sub["credits"]
+
+    if total_credits == 0:
+        return None
+    return round(total_points / total_credits, 2)
+
+def empty_totals() -> dict:
+    return {"credits": 0, "points": 0, "subjects": {}}
+
+def apply_subjects(totals: dict, subjects: List[dict], semester_number: Optional[int] = None) -> dict:
+    # Fold newly graded subjects into the running CGPA totals.
+    # Mirrors calculateCGPA: failed attempts are ignored and the latest passing
+    # attempt of a subject code replaces any earlier one. Only the subjects passed
+    # in are touched, so the cost does not grow with the length of the history.
+    # totals["subjects"] is stored on the student, so codes are keyed with field_key.
+    # Each entry records its semester and the earlier semester's pass it replaced,
+    # so a grade changed within a semester (including to F) undoes its own entry
+    # and the totals stay what rebuild_totals gives for the final grades.
+    credits = totals.get("credits", 0)
+    points = totals.get("points", 0)
+    by_code = dict(totals.get("subjects", {}))
+
+    for sub in subjects:
+        grade = sub.get("grade")
+        if grade is None:
+            continue
+
+        code = field_key(sub["code"])
+        previous = by_code.get(code)
+        same_semester = previous is not None and semester_number is not None and previous.get("semester") == semester_number
+        if grade == "F" and not same_semester:
+            continue
+
+        replaced = None
+        if previous:
+            credits -= previous["credits"]
+            points -= previous["points"]
+            replaced = previous.get("replaced") if same_semester else _attempt(previous)
+
+        if grade == "F":
+            # The semester's earlier grade is withdrawn; any earlier pass counts again
+            if replaced:
+                by_code[code] = replaced
+                credits += replaced["credits"]
+                points += replaced["points"]
+            else:
+                del by_code[code]
+            continue
+
+        entry = {"credits": sub["credits"], "points": grade_point(grade) * sub["credits"], "semester": semester_number}
+        if replaced:
+            entry["replaced"] = replaced
+        by_code[code] = entry
+        credits += entry["credits"]
+        points += entry["points"]
+
+    return {"credits": credits, "points": points, "subjects": by_code}
+
+def _attempt(entry: dict) -> dict:
+    # An entry without what it replaced; earlier semesters are not graded again
+    return {key: value for key, value in entry.items() if key != "replaced"}
+
+def calculate_cgpa(totals: dict) -> Optional[float]:
+    if not totals.get("credits"):
+        return None
+    return round(totals["points"] / totals["credits"], 2)
+
+def rebuild_totals(semesters: List[dict]) -> dict:
+    # Full recomputation, used for documents written before totals were stored
+    totals = empty_totals()
+    for sem in sorted(semesters, key=lambda s: s["semester_number"]):
+        totals = apply_subjects(totals, sem.get("subjects", []), sem["semester_number"])
+    return totals
+
+def gpa_fields(totals: dict, last_sgpa: Optional[float]) -> dict:
+    # Fields stored on the student document so /users/me/gpa is a plain read
+    return {
+        "gpa_totals": totals,
+        "cgpa": calculate_cgpa(totals),
+        "last_sgpa": last_sgpa,
+    }
@@ -0,0 +1,242 @@
+import os
+import csv
+import json
+import codecs
+from collections import deque
+from typing import AsyncIterator, List, Optional
+from pydantic import ValidationError
+from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+from app.auth import hash_passwords
+from app.database import db
+from app.gpa import calculate_sgpa, rebuild_totals, gpa_fields
+from app.models import StudentCreate, Semester
+from app import semesters as semester_store
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 200))
+
+# CSV layout: one row per subject, a student's rows next to each other.
+# A student without subjects is a single row with the subject columns empty.
+CSV_STUDENT_COLUMNS = ("reg_no", "name", "email", "password", "current_semester", "batch")
+CSV_SUBJECT_COLUMNS = ("semester_number", "subject_code", "subject_name", "credits", "grade")
+
+class ImportRowError(Exception):
+    pass
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Splits a byte stream into lines, each with its "\n", without buffering
+    # more than one chunk
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def ndjson_records(lines: AsyncIterator[str]):
+    # One student per line, in the same shape as StudentCreate plus "semesters"
+    row = 0
+    async for line in lines:
+        row += 1
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line)
+        except ValueError as e:
+            yield row, ImportRowError(f"Invalid JSON: {e}")
+
+class _BufferedLines:
+    # Input for csv.reader that runs dry instead of blocking for more lines
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+async def csv_rows(lines: AsyncIterator[str]):
+    # Runs one csv.reader over the stream and yields (first line, values), or
+    # (first line, ImportRowError) for malformed CSV. Lines are handed to the
+    # reader a whole record at a time: a quoted field with a line break is held
+    # back until its closing quote arrives.
+    buffered = _BufferedLines()
+    reader = csv.reader(buffered)
+    record = ""
+    line_number = first_line = 0
+    async for line in lines:
+        line_number += 1
+        if not record:
+            first_line = line_number
+        record += line
+        if record.count('"') % 2:
+            continue
+        buffered.lines.append(record)
+        record = ""
+        while buffered.lines:
+            try:
+                values = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                yield first_line, ImportRowError(f"Invalid CSV: {e}")
+                continue
+            if any(value.strip() for value in values):
+                yield first_line, values
+    if record:
+        yield first_line, ImportRowError("Invalid CSV: unterminated quoted field")
+
+def _semester_number(value):
+    # CSV values are strings; "1" and 1 must land in the same semester
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        # Left for the Semester model to reject
+        return value
+
+async def csv_records(lines: AsyncIterator[str]):
+    header = None
+    record = None
+    record_row = 0
+    async for row, values in csv_rows(lines):
+        if isinstance(values, Exception):
+            yield row, values
+            continue
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+
+        values = {column: value.strip() for column, value in zip(header, values) if value.strip() != ""}
+        if record is None or values.get("reg_no") != record.get("reg_no"):
+            if record is not None:
+                yield record_row, record
+            record = {column: values[column] for column in CSV_STUDENT_COLUMNS if column in values}
+            record["semesters"] = {}
+            record_row = row
+
+        if "subject_code" in values:
+            semesters = record["semesters"]
+            number = _semester_number(values.get("semester_number", record.get("current_semester", 1)))
+            semesters.setdefault(number, {"semester_number": number, "subjects": []})["subjects"].append({
+                "code": values["subject_code"],
+                "name": values.get("subject_name", values["subject_code"]),
+                "credits": values.get("credits"),
+                "grade": values.get("grade"),
+            })
+
+    if record is not None:
+        yield record_row, record
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors()
+    )
+
+def build_student(record: dict):
+    # Validates an import record with the API models and returns (document, password)
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ImportRowError("Expected an object per student")
+
+    semesters = record.get("semesters") or []
+    if isinstance(semesters, dict):
+        semesters = list(semesters.values())
+
+    try:
+        student = StudentCreate(**{k: v for k, v in record.items() if k != "semesters"})
+        semesters = [Semester(**sem).model_dump() for sem in semesters]
+    except (ValidationError, TypeError) as e:
+        message = _validation_message(e) if isinstance(e, ValidationError) else str(e)
+        raise ImportRowError(message)
+
+    last_sgpa = None
+    for sem in semesters:
+        sem["sgpa"] = calculate_sgpa(sem["subjects"])
+        if sem["semester_number"] == student.current_semester - 1:
+            last_sgpa = sem["sgpa"]
+
+    document = student.model_dump()
+    password = document.pop("password")
+    document["semesters"] = sorted(semesters, key=lambda s: s["semester_number"])
+    document.update(gpa_fields(rebuild_totals(semesters), last_sgpa))
+    document["version"] = 1
+    return document, password
+
+async def _write_batch(batch: List[tuple], report: dict):
+    # batch: (row, reg_no, document, password)
+    hashes = await hash_passwords([password for _, _, _, password in batch])
+    requests = []
+    semesters = []
+    for (_, _, document, _), hashed_password in zip(batch, hashes):
+        document["hashed_password"] = hashed_password
+        if semester_store.SPLIT_STORAGE:
+            document["_id"] = ObjectId()
+            semesters.append(semester_store.semester_documents(document["_id"], document.pop("semesters")))
+        requests.append(InsertOne(document))
+
+    failed = {}
+    try:
+        # Unordered so one duplicate does not stop the rest of the batch
+        await db.students.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            message = "Student with this Reg No or Email already exists" if error.get("code") == 11000 else error.get("errmsg")
+            failed[error["index"]] = message
+
+    # Semesters of the students that were inserted, once their student exists.
+    # A student is only counted once its semesters are stored too; one whose
+    # semesters fail is removed again so the row can simply be re-imported.
+    owners = [index for index, docs in enumerate(semesters) if index not in failed for _ in docs]
+    semester_requests = [InsertOne(doc) for index, docs in enumerate(semesters) if index not in failed for doc in docs]
+    if semester_requests:
+        incomplete = {}
+        try:
+            await db.semesters.bulk_write(semester_requests, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                incomplete.setdefault(owners[error["index"]], f"Could not write semesters: {error.get('errmsg')}")
+        if incomplete:
+            student_ids = [batch[index][2]["_id"] for index in incomplete]
+            await db.semesters.delete_many({"student_id": {"$in": student_ids}})
+            await db.students.delete_many({"_id": {"$in": student_ids}})
+            failed.update(incomplete)
+
+    for index, (row, reg_no, _, _) in enumerate(batch):
+        if index in failed:
+            report["errors"].append({"row": row, "reg_no": reg_no, "error": failed[index]})
+        else:
+            report["inserted"] += 1
+
+async def import_students(records, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    # records: async iterable of (row, record) from ndjson_records/csv_records
+    report = {"processed": 0, "inserted": 0, "errors": []}
+    batch = []
+    async for row, record in records:
+        report["processed"] += 1
+        reg_no: Optional[str] = record.get("reg_no") if isinstance(record, dict) else None
+        try:
+            document, password = build_student(record)
+        except ImportRowError as e:
+            report["errors"].append({"row": row, "reg_no": reg_no, "error": str(e)})
+            continue
+
+        batch.append((row, reg_no, document, password))
+        if len(batch) >= batch_size:
+            await _write_batch(batch, report)
+            batch = []
+
+    if batch:
+        await _write_batch(batch, report)
+    report["failed"] = len(report["errors"])
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
@@ -0,0 +1,280 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.database import db
+from app.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Follow-up work after a write, run off the request path by workers inside
+# each backend process. Jobs live in the jobs collection, so they survive
+# restarts and any worker can run them:
+#
+#   {key: "<type>:<student_id>", type, student_id, payload, state: queued | running | failed,
+#    run_at, enqueued_at, attempts, lease_id, lease_until, last_error}
+#
+# Delivery is at least once: a job whose worker dies is picked up again when
+# its lease runs out, and a failing job is retried with backoff until
+# JOB_MAX_ATTEMPTS, then kept as "failed". Handlers must therefore be
+# idempotent. At most one job per (type, student) waits in the queue; enqueueing
+# another merges into it, so a burst of writes costs one run. Jobs about no one
+# student (e.g. a cohort rebuild) use student_id None.
+#
+# A write that needs a job records it in the student's outbox within the same
+# update (add_to_outbox), so the job is stored if and only if the write is:
+#
+#   pending_jobs: [{_id, type, at}]
+#
+# dispatch() moves a student's entries into the jobs collection once the
+# response has been sent; the outbox sweep does the same for entries a crash
+# or a failed dispatch left behind.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1.0))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+# First retry delay; doubles with each attempt
+JOB_RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", 2))
+JOB_METRICS_SECONDS = float(os.getenv("JOB_METRICS_SECONDS", 15))
+# How often the sweep runs, and how old an outbox entry must be before it takes
+# over from the dispatch after the response
+JOB_OUTBOX_SWEEP_SECONDS = float(os.getenv("JOB_OUTBOX_SWEEP_SECONDS", 30))
+JOB_OUTBOX_BATCH = 100
+
+OUTBOX_FIELD = "pending_jobs"
+
+JOBS_ENQUEUED = Counter("advisr_jobs_enqueued_total", "Jobs enqueued, or merged into one already waiting", ["type", "outcome"])
+JOBS_PROCESSED = Counter("advisr_jobs_processed_total", "Job runs by outcome (done, retry, failed)", ["type", "outcome"])
+JOB_SECONDS = Histogram("advisr_job_duration_seconds", "Time spent running a job handler", ["type"])
+JOB_LAG_SECONDS = Histogram(
+    "advisr_job_lag_seconds", "From enqueue (or retry time) to a worker starting the job", ["type"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 15.0, 60.0, 300.0)
+)
+JOB_QUEUE_DEPTH = Gauge("advisr_job_queue_depth", "Jobs in the jobs collection by state", ["state"])
+JOB_QUEUE_OLDEST_SECONDS = Gauge("advisr_job_queue_oldest_seconds", "How long the oldest runnable queued job has waited")
+
+Handler = Callable[[Optional[ObjectId], dict], Awaitable[None]]
+_handlers: Dict[str, Handler] = {}
+
+def job_handler(job_type: str):
+    # Registers the function that runs jobs of this type: handler(student_id, payload)
+    def register(func: Handler) -> Handler:
+        _handlers[job_type] = func
+        return func
+    return register
+
+def job_key(job_type: str, student_id: Optional[ObjectId]) -> str:
+    return f"{job_type}:{student_id}"
+
+def add_to_outbox(update: dict, *job_types: str) -> dict:
+    # Adds the jobs to a student update. Each entry has its own _id, so a
+    # dispatch only removes the entries it has enqueued.
+    now = datetime.utcnow()
+    update.setdefault("$push", {})[OUTBOX_FIELD] = {
+        "$each": [{"_id": ObjectId(), "type": job_type, "at": now} for job_type in job_types]
+    }
+    return update
+
+class JobQueue:
+
+    def __init__(self, workers: int = JOB_WORKERS, poll_seconds: float = JOB_POLL_SECONDS,
+                 lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_seconds: float = JOB_RETRY_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self._tasks = []
+        self._wake = None
+
+    @property
+    def collection(self):
+        return db.jobs
+
+    async def enqueue(self, job_type: str, student_id: Optional[ObjectId], merge: Optional[dict] = None) -> None:
+        # merge: payload fields, combined with $min into a job that is already waiting
+        now = datetime.utcnow()
+        update = {"$setOnInsert": {
+            "type": job_type, "student_id": student_id, "attempts": 0, "enqueued_at": now, "run_at": now
+        }}
+        if merge:
+            update["$min"] = {f"payload.{field}": value for field, value in merge.items()}
+        key = job_key(job_type, student_id)
+        for attempt in range(2):
+            try:
+                result = await self.collection.update_one({"key": key, "state": "queued"}, update, upsert=True)
+                break
+            except DuplicateKeyError:
+                # Another process inserted the waiting job first; merge into it.
+                # Losing twice means the waiting job keeps being claimed and
+                # replaced as fast as we retry: give up and let the caller decide.
+                if attempt:
+                    raise
+        JOBS_ENQUEUED.inc(type=job_type, outcome="new" if result.upserted_id else "merged")
+        if self._wake is not None:
+            self._wake.set()
+
+    async def dispatch(self, student_id: ObjectId) -> int:
+        # Moves the student's outbox entries into the jobs collection. Raises if
+        # an enqueue fails; the entries stay in the outbox for the sweep.
+        student = await db.students.find_one({"_id": student_id}, {OUTBOX_FIELD: 1})
+        entries = (student or {}).get(OUTBOX_FIELD) or []
+        for job_type in {entry["type"] for entry in entries}:
+            await self.enqueue(job_type, student_id)
+        if entries:
+            await db.students.update_one(
+                {"_id": student_id}, {"$pull": {OUTBOX_FIELD: {"_id": {"$in": [entry["_id"] for entry in entries]}}}}
+            )
+        return len(entries)
+
+    async def sweep_outbox(self, older_than: float = JOB_OUTBOX_SWEEP_SECONDS) -> int:
+        # Dispatches outboxes with entries older than older_than seconds
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+        swept = 0
+        while True:
+            students = await db.students.find(
+                {f"{OUTBOX_FIELD}.at": {"$lte": cutoff}}, {"_id": 1}
+            ).limit(JOB_OUTBOX_BATCH).to_list(JOB_OUTBOX_BATCH)
+            for student in students:
+                swept += await self.dispatch(student["_id"])
+            if len(students) < JOB_OUTBOX_BATCH:
+                return swept
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"state": "queued", "run_at": {"$lte": now}},
+                # Its worker died or stalled; the lease has run out
+                {"state": "running", "lease_until": {"$lte": now}},
+            ]},
+            {
+                "$set": {"state": "running", "lease_id": ObjectId(), "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _release(self, job: dict, error: Exception):
+        lease = {"_id": job["_id"], "lease_id": job["lease_id"]}
+        if job["attempts"] >= self.max_attempts:
+            JOBS_PROCESSED.inc(type=job["type"], outcome="failed")
+            logger.error(f"Job {job['key']} failed after {job['attempts']} attempts: {error}")
+            await self.collection.update_one(lease, {
+                "$set": {"state": "failed", "last_error": repr(error)}, "$unset": {"lease_until": ""}
+            })
+            return
+
+        JOBS_PROCESSED.inc(type=job["type"], outcome="retry")
+        logger.warning(f"Job {job['key']} attempt {job['attempts']} failed, retrying: {error}")
+        retry_at = datetime.utcnow() + timedelta(seconds=self.retry_seconds * 2 ** (job["attempts"] - 1))
+        try:
+            await self.collection.update_one(lease, {
+                "$set": {"state": "queued", "run_at": retry_at, "last_error": repr(error)},
+                "$unset": {"lease_id": "", "lease_until": ""}
+            })
+        except DuplicateKeyError:
+            # A newer job for the same student is already waiting and covers this one
+            if job.get("payload"):
+                await self.enqueue(job["type"], job["student_id"], job["payload"])
+            await self.collection.delete_one(lease)
+
+    async def run_one(self) -> bool:
+        # Claims and runs one due job; False when there was none
+        job = await self._claim()
+        if job is None:
+            return False
+        started = datetime.utcnow()
+        JOB_LAG_SECONDS.observe(max((started - job["run_at"]).total_seconds(), 0), type=job["type"])
+
+        handler = _handlers.get(job["type"])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job type {job['type']}")
+            with JOB_SECONDS.time(type=job["type"]):
+                await handler(job["student_id"], job.get("payload", {}))
+        except asyncio.CancelledError:
+            # Shutting down: the lease runs out and another worker retries it
+            raise
+        except Exception as e:
+            await self._release(job, e)
+            return True
+
+        JOBS_PROCESSED.inc(type=job["type"], outcome="done")
+        await self.collection.delete_one({"_id": job["_id"], "lease_id": job["lease_id"]})
+        return True
+
+    async def _work(self):
+        while True:
+            try:
+                if await self.run_one():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # e.g. MongoDB unreachable; back off and try again
+                logger.error(f"Job worker error: {e}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def refresh_metrics(self):
+        depth = {"queued": 0, "running": 0, "failed": 0}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$state", "count": {"$sum": 1}}}]):
+            depth[row["_id"]] = row["count"]
+        for state, count in depth.items():
+            JOB_QUEUE_DEPTH.set(count, state=state)
+
+        now = datetime.utcnow()
+        oldest = await self.collection.find(
+            {"state": "queued", "run_at": {"$lte": now}}, {"run_at": 1}
+        ).sort("run_at", 1).limit(1).to_list(1)
+        JOB_QUEUE_OLDEST_SECONDS.set((now - oldest[0]["run_at"]).total_seconds() if oldest else 0)
+
+    async def _monitor(self):
+        while True:
+            try:
+                await self.refresh_metrics()
+            except Exception as e:
+                logger.error(f"Job queue metrics failed: {e}")
+            await asyncio.sleep(JOB_METRICS_SECONDS)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(JOB_OUTBOX_SWEEP_SECONDS)
+            try:
+                swept = await self.sweep_outbox()
+                if swept:
+                    logger.warning(f"Outbox sweep dispatched {swept} jobs")
+            except Exception as e:
+                logger.error(f"Outbox sweep failed: {e}")
+
+    def start(self):
+        # Called from the app lifespan, once per worker process
+        if self._tasks or self.workers <= 0:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._monitor()))
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wake = None
+
+_job_queue = JobQueue()
+
+def get_job_queue() -> JobQueue:
+    return _job_queue
@@ -0,0 +1,321 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import AsyncIterator, Optional
+from dotenv import load_dotenv
+from app.cache import LRUCache
+from app.circuit_breaker import CircuitBreaker, CircuitOpen
+from app.metrics import (
+    LLM_REQUEST_SECONDS, LLM_FIRST_TOKEN_SECONDS, LLM_ERRORS, LLM_CALLS, LLM_HEDGES, LLM_HEDGE_DELAY_SECONDS
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Seconds to keep the system instruction in Gemini's server-side context cache.
+# 0 disables it; the provider also rejects instructions below its minimum size.
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 0))
+# Another Gemini-compatible endpoint, spoken to over REST, e.g. the fault
+# injecting server in benchmarks/fake_gemini.py
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# Deadline for a whole generate call, hedge included
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+# Longest wait for the first chunk of a stream, and between chunks
+LLM_STREAM_IDLE_SECONDS = float(os.getenv("LLM_STREAM_IDLE_SECONDS", 15))
+# A generate call still running at this percentile of recent latencies gets a
+# second, identical request and takes whichever answers first. It costs an
+# extra Gemini request per hedge, so it is off (0) by default.
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 0))
+LLM_HEDGE_MIN_SECONDS = float(os.getenv("LLM_HEDGE_MIN_SECONDS", 1.0))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", 200))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+# Failures in a row that open the breaker (0 disables it), and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+
+# google.generativeai accounts for about half of the app's import time, so it is
+# imported on first use (or preloaded in the background after startup)
+_genai = None
+_genai_lock = threading.Lock()
+
+def load_sdk():
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if GEMINI_API_ENDPOINT:
+                genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+            else:
+                genai.configure(api_key=GEMINI_API_KEY)
+            _genai = genai
+    return _genai
+
+# Deadlines and retries belong to ResilientLLMClient: by default the SDK retries
+# 503s for up to 10 minutes, hiding an outage behind one slow call
+def _request_options(timeout: Optional[float] = None) -> dict:
+    options = {"retry": None}
+    if timeout:
+        options["timeout"] = timeout
+    return options
+
+async def _in_thread(iterable):
+    # Iterates a blocking iterator without blocking the event loop
+    iterator = iter(iterable)
+    end = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, end)
+        if item is end:
+            return
+        yield item
+
+class GeminiClient:
+    # Thin async wrapper around the Gemini SDK. Routes depend on get_llm_client
+    # so the client can be swapped out (e.g. for a fake) without touching them.
+
+    def __init__(self, model_name: str = GEMINI_MODEL, context_cache_ttl: int = GEMINI_CONTEXT_CACHE_TTL):
+        self.model_name = model_name
+        self.context_cache_ttl = context_cache_ttl
+
+    async def get_model(self, system_instruction: str):
+        # Returns a reusable model handle bound to the system instruction
+        genai = _genai or await asyncio.to_thread(load_sdk)
+        if self.context_cache_ttl:
+            try:
+                with LLM_REQUEST_SECONDS.time(operation="context_cache"):
+                    cached_content = await asyncio.to_thread(
+                        genai.caching.CachedContent.create,
+                        model=f"models/{self.model_name}",
+                        system_instruction=system_instruction,
+                        ttl=timedelta(seconds=self.context_cache_ttl)
+                    )
+                return genai.GenerativeModel.from_cached_content(cached_content)
+            except Exception as e:
+                logger.warning(f"Gemini context caching unavailable, sending instruction inline: {e}")
+
+        return genai.GenerativeModel(
+            model_name=self.model_name,
+            system_instruction=system_instruction
+        )
+
+    # contents is a single message or a list of {"role", "parts"} turns
+    async def generate(self, model, contents) -> str:
+        try:
+            with LLM_REQUEST_SECONDS.time(operation="generate"):
+                if GEMINI_API_ENDPOINT:
+                    # The SDK's async client has no REST transport
+                    response = await asyncio.to_thread(
+                        model.generate_content, contents, request_options=_request_options(LLM_TIMEOUT_SECONDS)
+                    )
+                else:
+                    response = await model.generate_content_async(
+                        contents, request_options=_request_options(LLM_TIMEOUT_SECONDS)
+                    )
+                return response.text
+        except Exception:
+            LLM_ERRORS.inc(operation="generate")
+            raise
+
+    async def stream(self, model, contents) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        first = True
+        try:
+            if GEMINI_API_ENDPOINT:
+                response = _in_thread(await asyncio.to_thread(
+                    model.generate_content, contents, stream=True, request_options=_request_options()
+                ))
+            else:
+                response = await model.generate_content_async(contents, stream=True, request_options=_request_options())
+            async for chunk in response:
+                # Chunks carrying only safety/finish metadata have no text parts
+                if chunk.parts:
+                    if first:
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                        first = False
+                    yield chunk.text
+        except Exception:
+            LLM_ERRORS.inc(operation="stream")
+            raise
+        finally:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, operation="stream")
+
+class FakeLLMClient:
+    # Offline stand-in with the GeminiClient interface for tests and benchmarks
+
+    def __init__(self, reply: str = "This is a canned advisor reply.", latency: float = 0.0):
+        self.reply = reply
+        self.latency = latency
+        self.calls = 0
+
+    async def get_model(self, system_instruction: str):
+        return system_instruction
+
+    async def generate(self, model, contents) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.reply
+
+    async def stream(self, model, contents) -> AsyncIterator[str]:
+        self.calls += 1
+        words = self.reply.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+def _is_provider_failure(error: Exception) -> bool:
+    # The SDK raises ValueError for a blocked or empty answer: the provider is fine
+    return not isinstance(error, (ValueError, CircuitOpen))
+
+class ResilientLLMClient:
+    # What the routes call Gemini through. Wraps a client with the GeminiClient
+    # interface and adds a deadline per call, optional hedging of slow generate
+    # calls, and a circuit breaker: after LLM_BREAKER_FAILURES failures in a row
+    # calls raise CircuitOpen at once, and the chat routes answer with their
+    # fallback message instead of piling up behind an unhealthy provider.
+
+    def __init__(
+        self,
+        client,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        stream_idle_timeout: float = LLM_STREAM_IDLE_SECONDS,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_seconds: float = LLM_HEDGE_MIN_SECONDS,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.client = client
+        self.timeout = timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker("gemini", LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        # Recent successful generate latencies, for the hedge delay
+        self._latencies = deque(maxlen=LLM_HEDGE_WINDOW)
+        # Handles for fixed instructions, expiring before Gemini's cached copy
+        self._models = LRUCache(
+            maxsize=16, ttl=GEMINI_CONTEXT_CACHE_TTL * 0.9 if GEMINI_CONTEXT_CACHE_TTL else None
+        )
+
+    async def get_model(self, system_instruction: str):
+        return await self.client.get_model(system_instruction)
+
+    async def get_cached_model(self, system_instruction: str):
+        # For instructions shared by every request, e.g. the chat summarizer;
+        # per-student instructions are cached by the chat routes
+        model = self._models.get(system_instruction)
+        if model is None:
+            model = await self.get_model(system_instruction)
+            self._models.set(system_instruction, model)
+        return model
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge_percentile or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        rank = max(1, -(-self.hedge_percentile * len(ordered) // 100))
+        delay = max(ordered[int(rank) - 1], self.hedge_min_seconds)
+        LLM_HEDGE_DELAY_SECONDS.set(delay)
+        return delay
+
+    async def _attempt(self, model, contents) -> str:
+        started = time.perf_counter()
+        text = await self.client.generate(model, contents)
+        self._latencies.append(time.perf_counter() - started)
+        return text
+
+    async def _hedged(self, model, contents) -> str:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._attempt(model, contents)
+
+        first = asyncio.ensure_future(self._attempt(model, contents))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                # Errors are not hedged; only slowness is
+                return first.result()
+            LLM_HEDGES.inc(outcome="sent")
+            hedge = asyncio.ensure_future(self._attempt(model, contents))
+            pending = {first, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            LLM_HEDGES.inc(outcome="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The slower request is cancelled, which also ends its RPC
+            for task in (first, hedge):
+                if task is not None:
+                    task.cancel()
+
+    async def generate(self, model, contents) -> str:
+        outcome = "error"
+        try:
+            with self.breaker.guard(_is_provider_failure):
+                text = await asyncio.wait_for(self._hedged(model, contents), self.timeout)
+            outcome = "ok"
+            return text
+        except CircuitOpen:
+            outcome = "short_circuit"
+            raise
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise TimeoutError(f"No answer from Gemini within {self.timeout}s") from None
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            LLM_CALLS.inc(operation="generate", outcome=outcome)
+
+    async def stream(self, model, contents) -> AsyncIterator[str]:
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            LLM_CALLS.inc(operation="stream", outcome="short_circuit")
+            raise
+        tokens = self.client.stream(model, contents)
+        try:
+            while True:
+                try:
+                    text = await asyncio.wait_for(tokens.__anext__(), self.stream_idle_timeout)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    LLM_CALLS.inc(operation="stream", outcome="timeout")
+                    self.breaker.failure()
+                    raise TimeoutError(f"Gemini stream stalled for {self.stream_idle_timeout}s") from None
+                except Exception as e:
+                    LLM_CALLS.inc(operation="stream", outcome="error")
+                    if _is_provider_failure(e):
+                        self.breaker.failure()
+                    else:
+                        self.breaker.release()
+                    raise
+                yield text
+        except GeneratorExit:
+            # The consumer stopped early (e.g. the client went away)
+            self.breaker.release()
+            raise
+        finally:
+            await tokens.aclose()
+        LLM_CALLS.inc(operation="stream", outcome="ok")
+        self.breaker.success()
+
+_client = ResilientLLMClient(GeminiClient())
+
+def get_llm_client() -> ResilientLLMClient:
+    return _client
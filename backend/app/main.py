@@ -1,8 +1,56 @@
-from fastapi import FastAPI
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import auth, users, chat
+from fastapi.responses import PlainTextResponse
+from app.auth import require_metrics_access
+from app.database import get_client, close_client, ensure_indexes
+from app.llm import load_sdk
+from app.retrieval import get_retriever
+from app.jobs import get_job_queue
+from app.followups import backfill_cohort_stats
+from app.metrics import MetricsMiddleware, render as render_metrics
+from app.serialization import FastJSONResponse
+from app.routes import auth, users, chat, admin, analytics
 
-app = FastAPI(title="Advisr Backend")
+logger = logging.getLogger(__name__)
+
+# Import the Gemini SDK in the background once the app is up, so the first chat
+# does not pay for it. Off, it is imported by the first chat request.
+GEMINI_PRELOAD = os.getenv("GEMINI_PRELOAD", "true").lower() == "true"
+
+def _log_failure(what: str):
+    # Done-callback for background work nothing awaits, whose errors would otherwise go unseen
+    def callback(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"{what} failed: {future.exception()!r}")
+    return callback
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Each worker process opens its own client (and connection pool) here
+    get_client()
+    # A no-op after the first deploy. Startup fails if the unique indexes are
+    # missing, rather than serving registrations nothing deduplicates.
+    await ensure_indexes()
+    if GEMINI_PRELOAD:
+        # A failed preload is retried by the first chat request
+        preload = asyncio.get_running_loop().run_in_executor(None, load_sdk)
+        preload.add_done_callback(_log_failure("Gemini SDK preload"))
+    # Opening the resource index means importing numpy; it is cheap enough to always do in the background
+    index = asyncio.get_running_loop().run_in_executor(None, get_retriever().load)
+    index.add_done_callback(_log_failure("Resource index load"))
+    # Queues the one-off cohort stats rebuild if it has not run yet
+    await backfill_cohort_stats(get_job_queue())
+    get_job_queue().start()
+    yield
+    # Jobs cut short here keep their lease and are retried once it runs out
+    await get_job_queue().stop()
+    close_client()
+
+app = FastAPI(title="Advisr Backend", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Configure CORS
 origins = [
@@ -20,11 +68,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it is outermost and times CORS handling as well
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router, tags=["Authentication"])
 app.include_router(users.router, tags=["Users"])
 app.include_router(chat.router, tags=["Chat"])
+app.include_router(admin.router, tags=["Admin"])
+app.include_router(analytics.router, tags=["Analytics"])
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to Advisr Backend"}
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+async def metrics():
+    # Prometheus exposition format; request and cache figures are not public
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
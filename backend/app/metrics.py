@@ -0,0 +1,424 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this (seconds) get their stacks sampled and logged; 0 disables
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 0))
+SLOW_REQUEST_SAMPLE_INTERVAL = float(os.getenv("SLOW_REQUEST_SAMPLE_INTERVAL", 0.05))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Minimal Prometheus text-format registry (exposition format 0.0.4), kept
+# dependency free. Metric objects are safe to update from worker threads.
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    out.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+                out.append((f"{self.name}_sum", labels, total))
+                out.append((f"{self.name}_count", labels, count))
+        return out
+
+_registry: List[Metric] = []
+# Callables run at scrape time, returning (name, type, help, [(labels, value)])
+_collectors: List[Callable] = []
+
+def register_collector(collector: Callable):
+    _collectors.append(collector)
+    return collector
+
+_caches: Dict[str, Callable[[], dict]] = {}
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    # stats: LRUCache.stats-like callable; exported as cache_* series labelled by name
+    _caches[name] = stats
+
+@register_collector
+def _cache_metrics():
+    series = {
+        "hits": ("advisr_cache_hits_total", "counter", "Cache lookups that found an entry"),
+        "misses": ("advisr_cache_misses_total", "counter", "Cache lookups that found nothing"),
+        "evictions": ("advisr_cache_evictions_total", "counter", "Entries evicted to respect maxsize"),
+        "size": ("advisr_cache_entries", "gauge", "Entries currently cached"),
+        "hit_ratio": ("advisr_cache_hit_ratio", "gauge", "hits / (hits + misses) since start"),
+    }
+    stats = {name: fn() for name, fn in _caches.items()}
+    for field, (metric, kind, documentation) in series.items():
+        yield metric, kind, documentation, [({"cache": name}, s[field]) for name, s in stats.items() if field in s]
+
+def render() -> str:
+    lines = []
+
+    def emit(name, kind, documentation, samples):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+    for metric in _registry:
+        emit(metric.name, metric.type, metric.documentation, metric.samples())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            emit(name, kind, documentation, [(name, labels, value) for labels, value in samples])
+    return "\n".join(lines) + "\n"
+
+# ---- HTTP
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "advisr_http_request_duration_seconds", "Time to complete a request, body included",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("advisr_http_requests_in_flight", "Requests being processed", ["method"])
+
+def route_template(scope) -> str:
+    # Routing records the matched route in the scope; its path template keeps
+    # label cardinality bounded (/chat/history, not raw URLs with query strings)
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+class MetricsMiddleware:
+    # Pure ASGI middleware, so streamed (SSE) responses are timed to the last byte
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc(method=method)
+        started = time.perf_counter()
+        token = slow_request_profiler.begin() if slow_request_profiler else None
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = route_template(scope)
+            HTTP_REQUESTS_IN_FLIGHT.dec(method=method)
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=status_code)
+            if token is not None:
+                slow_request_profiler.end(token, elapsed, f"{method} {route}")
+
+# ---- MongoDB
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "advisr_mongo_command_duration_seconds", "MongoDB command round trips",
+    ["collection", "command"]
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "advisr_mongo_command_failures_total", "MongoDB commands that returned an error",
+    ["collection", "command"]
+)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    # Registered on the Motor client; pymongo calls it from its own threads
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else "-"
+            )
+
+    def _collection(self, event) -> str:
+        with self._lock:
+            return self._collections.pop((event.connection_id, event.request_id), "-")
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(
+            event.duration_micros / 1e6, collection=self._collection(event), command=event.command_name
+        )
+
+    def failed(self, event):
+        collection = self._collection(event)
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        MONGO_COMMAND_FAILURES.inc(collection=collection, command=event.command_name)
+
+MONGO_POOL_CONNECTIONS = Gauge(
+    "advisr_mongo_pool_connections", "Open connections in this worker's MongoDB pool"
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "advisr_mongo_pool_checked_out", "Pool connections currently in use by an operation"
+)
+MONGO_POOL_CHECKOUT_SECONDS = Histogram(
+    "advisr_mongo_pool_checkout_seconds", "Time an operation waited for a pool connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "advisr_mongo_pool_checkout_failures_total", "Operations that could not get a pool connection",
+    ["reason"]
+)
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    # Pool pressure, for sizing MONGO_MAX_POOL_SIZE: a checkout histogram that
+    # moves away from zero means operations are queueing for connections
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.inc(reason=event.reason)
+        if event.duration is not None:
+            MONGO_POOL_CHECKOUT_SECONDS.observe(event.duration)
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.inc()
+        if event.duration is not None:
+            MONGO_POOL_CHECKOUT_SECONDS.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec()
+
+# ---- bcrypt and Gemini
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "advisr_password_hash_seconds", "bcrypt work per call, excluding time queued for a worker",
+    ["operation"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+PASSWORD_HASH_QUEUE_SECONDS = Histogram(
+    "advisr_password_hash_queue_seconds", "Time a bcrypt call waited for a free worker",
+    ["operation"]
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "advisr_llm_request_duration_seconds", "Gemini calls, to the full response",
+    ["operation"], buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "advisr_llm_first_token_seconds", "Time to the first streamed Gemini chunk",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+LLM_ERRORS = Counter("advisr_llm_errors_total", "Gemini calls that raised", ["operation"])
+LLM_CALLS = Counter(
+    "advisr_llm_calls_total", "Calls through the resilient Gemini client (ok, error, timeout, short_circuit)",
+    ["operation", "outcome"]
+)
+LLM_HEDGES = Counter("advisr_llm_hedges_total", "Second requests sent for a slow call, and how many won", ["outcome"])
+LLM_HEDGE_DELAY_SECONDS = Gauge("advisr_llm_hedge_delay_seconds", "Current wait before a hedged second request")
+
+# ---- slow request profiler
+
+class SlowRequestProfiler:
+    # A daemon thread samples the event loop thread's stack every interval while
+    # a request is over the threshold. When such a request finishes, the folded
+    # stacks (most frequent first) are logged, showing where it spent its time,
+    # including synchronous code that blocked the loop.
+
+    def __init__(self, threshold: float, interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._next_token = 0
+        self._loop_thread_id = None
+        self._thread = None
+
+    def begin(self):
+        if self._thread is None:
+            self._loop_thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+        with self._lock:
+            self._next_token += 1
+            token = self._next_token
+            self._active[token] = {
+                "started": time.perf_counter(),
+                "task": asyncio.current_task(),
+                "stacks": StackCounter(),
+            }
+        return token
+
+    def end(self, token, elapsed: float, name: str):
+        with self._lock:
+            request = self._active.pop(token, None)
+            # The sampler thread updates the counts under the same lock
+            top = request["stacks"].most_common(10) if request is not None else []
+        if request is None or elapsed < self.threshold:
+            return
+        lines = [f"Slow request {name} took {elapsed:.3f}s; sampled stacks:"]
+        for stack, count in top:
+            lines.append(f"  {count:>4}  {stack}")
+        logger.warning("\n".join(lines))
+
+    @staticmethod
+    def _fold(frames, depth: int = 12) -> str:
+        # Innermost frames only; the outer ones are the same ASGI plumbing every time
+        return ";".join(f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}" for f in list(frames)[-depth:])
+
+    @staticmethod
+    def _coroutine_stack(task):
+        # Follows the await chain from the task's coroutine down to where it is suspended
+        frames = []
+        coro = task.get_coro()
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+            if frame is not None:
+                frames.append(traceback.FrameSummary(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+        return frames
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                slow = [r for r in self._active.values() if now - r["started"] >= self.threshold]
+            if not slow:
+                continue
+            # What the loop thread is executing; an idle loop sits in the selector
+            loop_frame = sys._current_frames().get(self._loop_thread_id)
+            busy = None
+            if loop_frame is not None:
+                stack = traceback.extract_stack(loop_frame)
+                if not any(os.path.basename(f.filename) == "selectors.py" for f in stack[-3:]):
+                    busy = self._fold(stack)
+            for request in slow:
+                # Where the request's coroutine currently is
+                task = request["task"]
+                try:
+                    frames = self._coroutine_stack(task) if task is not None and not task.done() else []
+                except (RuntimeError, AttributeError):
+                    # The chain changed under us; skip this sample
+                    continue
+                sample = f"request {self._fold(frames)}"
+                with self._lock:
+                    request["stacks"][sample] += 1
+                    if busy:
+                        request["stacks"][f"loop busy {busy}"] += 1
+
+slow_request_profiler: Optional[SlowRequestProfiler] = (
+    SlowRequestProfiler(SLOW_REQUEST_SECONDS, SLOW_REQUEST_SAMPLE_INTERVAL) if SLOW_REQUEST_SECONDS > 0 else None
+)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, ConfigDict, BeforeValidator
-from typing import Optional, List, Annotated
+from typing import Optional, List, Dict, Annotated
+from datetime import datetime
 from bson import ObjectId
 
 # Pydantic v2 compatible ObjectId
@@ -22,7 +23,13 @@ class StudentModel(BaseModel):
     reg_no: str = Field(...)
     email: EmailStr = Field(...)
     current_semester: int = Field(default=1)
+    batch: Optional[str] = None
     semesters: List[Semester] = Field(default_factory=list)
+    cgpa: Optional[float] = None
+    last_sgpa: Optional[float] = None
+    gpa_totals: Optional[dict] = None
+    # Incremented by every write; GET routes derive their ETags from it
+    version: int = 0
     hashed_password: str = Field(...)
 
     model_config = ConfigDict(
@@ -46,6 +53,7 @@ class StudentCreate(BaseModel):
     reg_no: str
     email: EmailStr
     current_semester: int = 1
+    batch: Optional[str] = None
     password: str
 
 class StudentLogin(BaseModel):
@@ -58,7 +66,10 @@ class StudentResponse(BaseModel):
     reg_no: str
     email: EmailStr
     current_semester: int
+    batch: Optional[str] = None
     semesters: List[Semester] = []
+    cgpa: Optional[float] = None
+    last_sgpa: Optional[float] = None
 
     model_config = ConfigDict(
         populate_by_name=True,
@@ -66,15 +77,71 @@ class StudentResponse(BaseModel):
         arbitrary_types_allowed=True
     )
 
+class GPAResponse(BaseModel):
+    cgpa: Optional[float] = None
+    last_sgpa: Optional[float] = None
+    total_credits: int = 0
+
+class PlanRequest(BaseModel):
+    target_cgpa: float = Field(..., ge=0, le=10)
+    # What-if subjects; defaults to the current semester's
+    subjects: Optional[List[Subject]] = None
+    limit: int = Field(default=3, ge=1, le=20)
+
+class GradePlan(BaseModel):
+    cgpa: Optional[float] = None
+    grades: Dict[str, str] = {}
+
+class PlanResponse(BaseModel):
+    target_cgpa: float
+    current_cgpa: Optional[float] = None
+    achievable: bool
+    min_cgpa: Optional[float] = None
+    max_cgpa: Optional[float] = None
+    plans: List[GradePlan] = []
+
+class SubjectStats(BaseModel):
+    code: str
+    attempts: int
+    fails: int
+    fail_rate: float
+
+class CohortAnalyticsResponse(BaseModel):
+    cohort: str
+    students: int
+    grade_distribution: dict = {}
+    subjects: List[SubjectStats] = []
+    cgpa_percentiles: dict = {}
+    updated_at: Optional[datetime] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    issued_at: float = 0
+    expires_at: float = 0
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
 
 class ChatMessage(BaseModel):
     message: str
+    bypass_cache: bool = False
 
 class ChatResponse(BaseModel):
     response: str
+
+class ChatTurn(BaseModel):
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    role: str
+    text: str
+    created_at: datetime
+
+    model_config = ConfigDict(populate_by_name=True)
+
+class ChatHistoryResponse(BaseModel):
+    messages: List[ChatTurn] = []
+    next_before: Optional[str] = None
@@ -0,0 +1,137 @@
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.gpa import GRADE_POINTS, apply_subjects, calculate_cgpa, field_key
+
+# What-if planning: the least demanding grades for this semester's ungraded
+# subjects that bring the CGPA to a target. CGPA follows apply_subjects
+# (calculateCGPA): failed attempts do not count and a passing grade replaces
+# any earlier grade for the same code, so plans only use passing grades.
+#
+# Each subject contributes grade_point * credits, so the search runs over
+# credit-weighted point totals rather than grade combinations. For subjects
+# i..n-1, the reachable totals form a set stored as the bits of one Python
+# int; folding in a subject ORs together that set shifted by each grade's
+# points. That is at most 6 shifts per subject, instead of 6^n combinations.
+
+PASSING_GRADES = sorted((grade for grade in GRADE_POINTS if grade != "F"), key=GRADE_POINTS.get)
+PLAN_LIMIT = 3
+
+def _baseline(totals: dict, subjects: List[dict]) -> Tuple[int, int, List[dict]]:
+    # Credits and points that stay fixed, and the subjects left to plan
+    graded = [sub for sub in subjects if sub.get("grade") is not None]
+    base = apply_subjects(totals, graded)
+    planned = list({sub["code"]: sub for sub in subjects if sub.get("grade") is None}.values())
+
+    credits, points = base.get("credits", 0), base.get("points", 0)
+    for sub in planned:
+        # A pass this semester will replace an earlier pass of the same code
+        previous = base.get("subjects", {}).get(field_key(sub["code"]))
+        if previous:
+            credits -= previous["credits"]
+            points -= previous["points"]
+    return credits, points, planned
+
+def _reachable(planned: List[dict], grades: List[str]) -> List[int]:
+    # reachable[i]: bit t is set when subjects i.. can total exactly t points
+    reachable = [1]
+    for sub in reversed(planned):
+        following = reachable[0]
+        mask = 0
+        for grade in grades:
+            mask |= following << (GRADE_POINTS[grade] * sub["credits"])
+        reachable.insert(0, mask)
+    return reachable
+
+def _totals(mask: int) -> Iterator[int]:
+    # Set bits of mask, lowest first
+    total = 0
+    while mask:
+        if mask & 1:
+            yield total
+        mask >>= 1
+        total += 1
+
+def _assignments(planned: List[dict], grades: List[str], reachable: List[int], total: int, limit: int) -> List[Dict[str, str]]:
+    # Grade assignments adding up to exactly `total`; reachable prunes every
+    # branch that cannot, so each result costs O(subjects * grades)
+    found = []
+    chosen = []
+
+    def walk(i: int, remaining: int):
+        if len(found) >= limit:
+            return
+        if i == len(planned):
+            found.append({sub["code"]: grade for sub, grade in zip(planned, chosen)})
+            return
+        for grade in grades:
+            points = GRADE_POINTS[grade] * planned[i]["credits"]
+            if points <= remaining and reachable[i + 1] >> (remaining - points) & 1:
+                chosen.append(grade)
+                walk(i + 1, remaining - points)
+                chosen.pop()
+
+    walk(0, total)
+    return found
+
+def plan_grades(totals: dict, subjects: List[dict], target_cgpa: float, limit: int = PLAN_LIMIT) -> dict:
+    # totals: the student's gpa_totals; subjects: this semester's, as in Semester.subjects
+    base_credits, base_points, planned = _baseline(totals, subjects)
+    credits = base_credits + sum(sub["credits"] for sub in planned)
+
+    def cgpa(total: int) -> Optional[float]:
+        return calculate_cgpa({"credits": credits, "points": base_points + total})
+
+    plan = {
+        "target_cgpa": target_cgpa,
+        "current_cgpa": calculate_cgpa(totals),
+        "min_cgpa": cgpa(sum(GRADE_POINTS[PASSING_GRADES[0]] * sub["credits"] for sub in planned)),
+        "max_cgpa": cgpa(sum(GRADE_POINTS[PASSING_GRADES[-1]] * sub["credits"] for sub in planned)),
+        "achievable": False,
+        "plans": [],
+    }
+    reachable = _reachable(planned, PASSING_GRADES)
+    # Least effort: the smallest point total whose CGPA, rounded as stored, meets
+    # the target. With no credits at all there is no CGPA, so nothing meets it.
+    best = next((total for total in _totals(reachable[0]) if cgpa(total) is not None and cgpa(total) >= target_cgpa), None)
+    if best is None:
+        return plan
+
+    # Among plans with that total, prefer those whose highest grade is lowest
+    for top in range(len(PASSING_GRADES)):
+        grades = PASSING_GRADES[:top + 1]
+        capped = _reachable(planned, grades)
+        if capped[0] >> best & 1:
+            break
+    plan["achievable"] = True
+    plan["plans"] = [
+        {"cgpa": cgpa(best), "grades": grades_by_code}
+        for grades_by_code in _assignments(planned, grades, capped, best, limit)
+    ]
+    return plan
+
+# A question about reaching a CGPA, e.g. "what do I need to get an 8.5 CGPA?"
+_gpa_goal = re.compile(r"\b(?:need|get|reach|target|achieve|score|maintain|keep|make|above|raise|improve)\b", re.I)
+_gpa_word = re.compile(r"\b(?:c\.?g\.?p\.?a|gpa|cg|pointer)\b", re.I)
+_gpa_value = re.compile(r"(?<![\d.])(10(?:\.0+)?|\d(?:\.\d{1,2})?)(?![\d.])")
+
+def target_from_message(message: str) -> Optional[float]:
+    if not (_gpa_word.search(message) and _gpa_goal.search(message)):
+        return None
+    match = _gpa_value.search(message)
+    return float(match.group(1)) if match else None
+
+def describe_plan(plan: dict, subjects: List[dict]) -> str:
+    # Plain-text result for the chat prompt
+    names = {sub["code"]: sub.get("name") or sub["code"] for sub in subjects}
+    current = plan['current_cgpa'] if plan['current_cgpa'] is not None else "not yet available"
+    lines = [f"Target CGPA {plan['target_cgpa']}, current CGPA {current}."]
+    if all(sub.get("grade") is not None for sub in subjects):
+        lines.append("There are no ungraded subjects this semester to plan with.")
+    elif not plan["achievable"]:
+        lines.append(f"Not reachable this semester: all O grades give at most {plan['max_cgpa']}.")
+    else:
+        for n, option in enumerate(plan["plans"], 1):
+            grades = ", ".join(f"{names.get(code, code)}: {grade}" for code, grade in option["grades"].items())
+            lines.append(f"Option {n} (CGPA {option['cgpa']}): {grades}")
+        lines.append(f"Range this semester: {plan['min_cgpa']} with all C to {plan['max_cgpa']} with all O.")
+    return "\n".join(lines)
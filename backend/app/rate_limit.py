@@ -0,0 +1,104 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException, status
+from app.cache import LRUCache
+from app.metrics import Counter
+
+# Token buckets in front of Gemini. Rates are per minute; burst is the bucket size. 0 disables a bucket.
+CHAT_USER_RATE_PER_MINUTE = float(os.getenv("CHAT_USER_RATE_PER_MINUTE", 10))
+CHAT_USER_BURST = int(os.getenv("CHAT_USER_BURST", 5))
+CHAT_GLOBAL_RATE_PER_MINUTE = float(os.getenv("CHAT_GLOBAL_RATE_PER_MINUTE", 300))
+CHAT_GLOBAL_BURST = int(os.getenv("CHAT_GLOBAL_BURST", 30))
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 100000))
+
+RATE_LIMITED = Counter("advisr_rate_limited_total", "Requests rejected by a token bucket", ["bucket"])
+
+class Bucket(NamedTuple):
+    name: str        # "user" or "global", reported on rejection
+    key: str
+    rate: float      # tokens per second
+    capacity: int
+
+class RateLimitBackend(ABC):
+    # Storage interface for token buckets. acquire takes one token from every
+    # bucket or from none, so a request rejected globally does not also spend
+    # its user's allowance. A shared store (e.g. Redis running the same
+    # arithmetic in a script) lets several workers enforce one limit.
+
+    @abstractmethod
+    async def acquire(self, buckets: List[Bucket]) -> Optional[Tuple[str, float]]:
+        # None when allowed, else (bucket name, seconds until a token is available)
+        ...
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    # Per-process buckets. An idle bucket is simply full, so evicting it is harmless.
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_BUCKETS):
+        self._buckets = LRUCache(maxsize=maxsize)
+
+    async def acquire(self, buckets: List[Bucket]) -> Optional[Tuple[str, float]]:
+        # No awaits below, so the check and the update are atomic on the event loop
+        now = time.monotonic()
+        levels = []
+        for bucket in buckets:
+            tokens, updated = self._buckets.peek(bucket.key) or (bucket.capacity, now)
+            tokens = min(bucket.capacity, tokens + (now - updated) * bucket.rate)
+            if tokens < 1:
+                return bucket.name, (1 - tokens) / bucket.rate
+            levels.append(tokens)
+        for bucket, tokens in zip(buckets, levels):
+            self._buckets.set(bucket.key, (tokens - 1, now))
+        return None
+
+class ChatRateLimiter:
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        user_rate_per_minute: float = CHAT_USER_RATE_PER_MINUTE,
+        user_burst: int = CHAT_USER_BURST,
+        global_rate_per_minute: float = CHAT_GLOBAL_RATE_PER_MINUTE,
+        global_burst: int = CHAT_GLOBAL_BURST,
+    ):
+        self.backend = backend
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self.global_rate = global_rate_per_minute / 60
+        self.global_burst = global_burst
+
+    def _buckets(self, user_key: str) -> List[Bucket]:
+        buckets = []
+        if self.user_rate > 0:
+            buckets.append(Bucket("user", f"chat:user:{user_key}", self.user_rate, self.user_burst))
+        if self.global_rate > 0:
+            buckets.append(Bucket("global", "chat:global", self.global_rate, self.global_burst))
+        return buckets
+
+    async def check(self, user_key: str):
+        # Raises 429 with Retry-After when the user or the whole service is over its rate
+        buckets = self._buckets(user_key)
+        if not buckets:
+            return
+        denied = await self.backend.acquire(buckets)
+        if denied is None:
+            return
+
+        bucket, wait = denied
+        RATE_LIMITED.inc(bucket=bucket)
+        retry_after = max(1, int(wait + 0.999))
+        if bucket == "user":
+            detail = f"You are sending messages too quickly. Please wait {retry_after} seconds and try again."
+        else:
+            detail = f"The advisor is handling too many conversations right now. Please try again in {retry_after} seconds."
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+_chat_rate_limiter = ChatRateLimiter(InMemoryRateLimitBackend())
+
+def get_chat_rate_limiter() -> ChatRateLimiter:
+    return _chat_rate_limiter
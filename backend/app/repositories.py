@@ -0,0 +1,169 @@
+import copy
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from app.database import db
+
+class DuplicateStudent(Exception):
+    # reg_no or email already belongs to another student
+    pass
+
+class StudentRepository(ABC):
+    # Student documents looked up or updated as a whole: the auth and account
+    # routes, GPA backfills and the follow-up jobs. Writes that depend on the
+    # semester layout (app/semesters.py), the importer's bulk upserts and the
+    # analytics pipelines work on the students collection directly. Every
+    # change to a student bumps "version", which ETags and the principal cache
+    # rely on, unless bump_version is False.
+
+    @abstractmethod
+    async def get_by_reg_no(self, reg_no: str, projection: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def get(self, student_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def find_for_login(self, username: str) -> Optional[dict]:
+        # username is a reg_no or an email; a reg_no match wins if both match
+        ...
+
+    @abstractmethod
+    async def exists(self, reg_no: str, email: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def create(self, student: dict) -> ObjectId:
+        # Raises DuplicateStudent
+        ...
+
+    @abstractmethod
+    async def update(self, student_id: ObjectId, fields: dict, bump_version: bool = True,
+                     version: Optional[int] = None) -> bool:
+        # With version, only applies while the document is still at that version
+        ...
+
+class MongoStudentRepository(StudentRepository):
+    # Works against any Motor-compatible database
+
+    def __init__(self, database=db):
+        self.database = database
+
+    @property
+    def collection(self):
+        return self.database.students
+
+    async def get_by_reg_no(self, reg_no: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"reg_no": reg_no}, projection)
+
+    async def get(self, student_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"_id": student_id}, projection)
+
+    async def find_for_login(self, username: str) -> Optional[dict]:
+        # One indexed query for reg_no or email
+        candidates = await self.collection.find(
+            {"$or": [{"reg_no": username}, {"email": username}]}
+        ).limit(2).to_list(2)
+        user = next((c for c in candidates if c['reg_no'] == username), None)
+        if not user and candidates:
+            user = candidates[0]
+        return user
+
+    async def exists(self, reg_no: str, email: str) -> bool:
+        existing = await self.collection.find_one({"$or": [{"reg_no": reg_no}, {"email": email}]}, {"_id": 1})
+        return existing is not None
+
+    async def create(self, student: dict) -> ObjectId:
+        try:
+            result = await self.collection.insert_one(student)
+        except DuplicateKeyError:
+            raise DuplicateStudent()
+        return result.inserted_id
+
+    async def update(self, student_id: ObjectId, fields: dict, bump_version: bool = True,
+                     version: Optional[int] = None) -> bool:
+        query = {"_id": student_id}
+        if version is not None:
+            query["version"] = version
+        update = {"$set": fields}
+        if bump_version:
+            update["$inc"] = {"version": 1}
+        result = await self.collection.update_one(query, update)
+        return result.matched_count == 1
+
+def _project(student: dict, projection: Optional[dict]) -> dict:
+    # Top-level inclusion or exclusion. Dotted fields and fields projected with
+    # an expression (e.g. auth.CURRENT_SEMESTER_ONLY) come back whole, a
+    # superset of what MongoDB would return.
+    student = copy.deepcopy(student)
+    if not projection:
+        return student
+    if all(value == 0 for value in projection.values()):
+        return {k: v for k, v in student.items() if projection.get(k) != 0}
+    keep = {field.split(".")[0] for field, value in projection.items() if value != 0}
+    if projection.get("_id", 1) != 0:
+        keep.add("_id")
+    return {k: v for k, v in student.items() if k in keep}
+
+class InMemoryStudentRepository(StudentRepository):
+    # Per-process students with the same uniqueness rules as the MongoDB
+    # indexes, for tests and offline runs of code that only needs the repository
+
+    def __init__(self):
+        self._students: Dict[ObjectId, dict] = {}
+
+    def _by_reg_no(self, reg_no: str) -> Optional[dict]:
+        return next((s for s in self._students.values() if s.get("reg_no") == reg_no), None)
+
+    async def get_by_reg_no(self, reg_no: str, projection: Optional[dict] = None) -> Optional[dict]:
+        student = self._by_reg_no(reg_no)
+        return _project(student, projection) if student else None
+
+    async def get(self, student_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        student = self._students.get(student_id)
+        return _project(student, projection) if student else None
+
+    async def find_for_login(self, username: str) -> Optional[dict]:
+        student = self._by_reg_no(username) or next(
+            (s for s in self._students.values() if s.get("email") == username), None
+        )
+        return copy.deepcopy(student) if student else None
+
+    async def exists(self, reg_no: str, email: str) -> bool:
+        return any(s.get("reg_no") == reg_no or s.get("email") == email for s in self._students.values())
+
+    async def create(self, student: dict) -> ObjectId:
+        if await self.exists(student.get("reg_no"), student.get("email")):
+            raise DuplicateStudent()
+        student = copy.deepcopy(student)
+        student.setdefault("_id", ObjectId())
+        self._students[student["_id"]] = student
+        return student["_id"]
+
+    async def update(self, student_id: ObjectId, fields: dict, bump_version: bool = True,
+                     version: Optional[int] = None) -> bool:
+        student = self._students.get(student_id)
+        if student is None or (version is not None and student.get("version") != version):
+            return False
+        for path, value in copy.deepcopy(fields).items():
+            *parents, name = path.split(".")
+            target = student
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[name] = value
+        if bump_version:
+            student["version"] = student.get("version", 0) + 1
+        return True
+
+_student_repository: StudentRepository = MongoStudentRepository()
+
+def get_student_repository() -> StudentRepository:
+    return _student_repository
+
+def use_student_repository(repository: StudentRepository):
+    # For callers that resolve the repository directly (the auth dependencies,
+    # follow-up jobs) as well as routes that depend on it
+    global _student_repository
+    _student_repository = repository
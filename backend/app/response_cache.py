@@ -0,0 +1,88 @@
+import os
+import re
+import time
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Optional
+from app.cache import LRUCache
+from app.metrics import register_cache
+
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 2048))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", 3600))
+
+class ResponseCacheBackend(ABC):
+    # Storage interface for cached chat responses. Entries are plain dicts so a
+    # Redis-like store can keep them as hashes (HSET / HINCRBY / EXPIRE).
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, entry: dict, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def record_hit(self, key: str) -> None:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+class InMemoryResponseCacheBackend(ResponseCacheBackend):
+
+    def __init__(self, maxsize: int = CHAT_CACHE_SIZE):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    async def get(self, key: str) -> Optional[dict]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, entry: dict, ttl: float) -> None:
+        self._cache.set(key, entry, ttl=ttl)
+
+    async def record_hit(self, key: str) -> None:
+        # Entries are stored by reference, so bump the counter in place
+        entry = self._cache.peek(key)
+        if entry is not None:
+            entry["hits"] += 1
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+_punctuation = re.compile(r"[^\w\s]")
+_whitespace = re.compile(r"\s+")
+
+def normalize_message(message: str) -> str:
+    # "How do I raise my CGPA??" and "how do i raise my cgpa" share an entry
+    message = _punctuation.sub(" ", message.lower())
+    return _whitespace.sub(" ", message).strip()
+
+class ResponseCache:
+
+    def __init__(self, backend: ResponseCacheBackend, ttl: float = CHAT_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, message: str, fingerprint: str) -> str:
+        # The fingerprint names what the answer was generated from (for chat, the
+        # student's batch and semester), so only those who share it share answers
+        raw = f"{fingerprint}:{normalize_message(message)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, message: str, fingerprint: str) -> Optional[str]:
+        key = self.key(message, fingerprint)
+        entry = await self.backend.get(key)
+        if entry is None:
+            return None
+        await self.backend.record_hit(key)
+        return entry["response"]
+
+    async def set(self, message: str, fingerprint: str, response: str) -> None:
+        entry = {"response": response, "hits": 0, "created_at": time.time()}
+        await self.backend.set(self.key(message, fingerprint), entry, self.ttl)
+
+_response_cache = ResponseCache(InMemoryResponseCacheBackend())
+register_cache("chat_response", _response_cache.backend.stats)
+
+def get_response_cache() -> ResponseCache:
+    return _response_cache
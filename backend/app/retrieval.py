@@ -0,0 +1,96 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import List, Optional
+from app.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Resource catalog retrieval for the chat prompt. The index is built offline by
+# build_rag_index.py; without one, chat runs without retrieved resources.
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "rag_index"))
+RAG_EMBEDDER = os.getenv("RAG_EMBEDDER", "hashing")
+RAG_DIMENSIONS = int(os.getenv("RAG_DIMENSIONS", 2048))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 3))
+# Cosine similarity below which a resource is not worth sending
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", 0.1))
+RAG_SNIPPET_CHARS = int(os.getenv("RAG_SNIPPET_CHARS", 280))
+
+RETRIEVAL_SECONDS = Histogram(
+    "advisr_rag_retrieval_seconds", "Embedding a chat message and searching the resource index",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+class Retriever:
+    # Looks up the catalog entries relevant to a message. numpy and the index
+    # are loaded on first use (or preloaded after startup), like the Gemini SDK.
+
+    def __init__(self, directory: str = RAG_INDEX_DIR, embedder: str = RAG_EMBEDDER, dimensions: int = RAG_DIMENSIONS,
+                 top_k: int = RAG_TOP_K, min_score: float = RAG_MIN_SCORE):
+        self.directory = directory
+        self.embedder_spec = embedder
+        self.dimensions = dimensions
+        self.top_k = top_k
+        self.min_score = min_score
+        self._index = None
+        self._embedder = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return self._index
+            self._loaded = True
+            if not os.path.exists(os.path.join(self.directory, "manifest.json")):
+                logger.warning(f"No resource index in {self.directory}; chat answers will not be grounded in the catalog")
+                return None
+            from app.vector_index import VectorIndex, load_embedder
+            try:
+                index = VectorIndex(self.directory)
+                embedder = load_embedder(self.embedder_spec, self.dimensions)
+                if embedder.name != index.manifest["embedder"]:
+                    raise ValueError(f"index was built with {index.manifest['embedder']}, not {embedder.name}")
+            except Exception as e:
+                logger.error(f"Resource index unavailable: {e}")
+                return None
+            self._index, self._embedder = index, embedder
+            return index
+
+    def search(self, message: str) -> List[dict]:
+        index = self.load()
+        if index is None:
+            return []
+        with RETRIEVAL_SECONDS.time():
+            indices, scores = index.search(self._embedder.embed([message]), self.top_k)
+        return [
+            {**index.documents[i], "score": round(float(score), 3)}
+            for i, score in zip(indices[0], scores[0]) if score >= self.min_score
+        ]
+
+    async def retrieve(self, message: str) -> List[dict]:
+        # In a worker thread: a local model embedder can take milliseconds, and
+        # numpy releases the GIL for the matrix product
+        return await asyncio.to_thread(self.search, message)
+
+def format_resources(resources: List[dict], snippet_chars: int = RAG_SNIPPET_CHARS) -> str:
+    lines = []
+    for resource in resources:
+        description = resource.get("description") or ""
+        if len(description) > snippet_chars:
+            description = description[:snippet_chars].rsplit(" ", 1)[0] + "..."
+        link = f" <{resource['url']}>" if resource.get("url") else ""
+        lines.append(f"- {resource['title']} ({resource.get('provider', 'catalog')}){link}: {description}")
+    return "\n".join(lines)
+
+def resource_context(resources: List[dict]) -> Optional[str]:
+    # The block placed in front of the student's message for Gemini
+    if not resources:
+        return None
+    return f"Vetted resources relevant to this question:\n{format_resources(resources)}"
+
+_retriever = Retriever()
+
+def get_retriever() -> Retriever:
+    return _retriever
@@ -0,0 +1,70 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+# Server-side logout and password-change revocation. When disabled, tokens stay
+# valid until they expire and logout only clears the client.
+TOKEN_REVOCATION = os.getenv("TOKEN_REVOCATION", "true").lower() in ("1", "true", "yes")
+
+class RevocationList(ABC):
+    # Storage interface for revoked access tokens. Single tokens are revoked
+    # on logout; on password change, every token a student was issued before
+    # that moment is revoked. Entries only need to outlive the tokens they cover,
+    # so a shared store with expiring keys (e.g. Redis SET ... EXAT) can back
+    # several workers.
+
+    @abstractmethod
+    async def revoke_token(self, digest: bytes, expires_at: float) -> None:
+        ...
+
+    @abstractmethod
+    async def revoke_user(self, reg_no: str, issued_before: float, expires_at: float) -> None:
+        ...
+
+    @abstractmethod
+    async def is_revoked(self, digest: bytes, reg_no: str, issued_at: float) -> bool:
+        ...
+
+class InMemoryRevocationList(RevocationList):
+    # Per-process entries, dropped once the tokens they cover have expired.
+    # Not LRU-bounded: evicting a revocation would make its token valid again.
+
+    def __init__(self):
+        self._tokens: Dict[bytes, float] = {}
+        self._users: Dict[str, Tuple[float, float]] = {}
+        self._next_purge = 0.0
+
+    def _purge(self, now: float):
+        if now < self._next_purge:
+            return
+        self._tokens = {digest: exp for digest, exp in self._tokens.items() if exp > now}
+        self._users = {reg_no: entry for reg_no, entry in self._users.items() if entry[1] > now}
+        self._next_purge = now + 60
+
+    async def revoke_token(self, digest: bytes, expires_at: float) -> None:
+        now = time.time()
+        self._purge(now)
+        self._tokens[digest] = expires_at
+
+    async def revoke_user(self, reg_no: str, issued_before: float, expires_at: float) -> None:
+        now = time.time()
+        self._purge(now)
+        previous = self._users.get(reg_no)
+        if previous is not None:
+            issued_before = max(issued_before, previous[0])
+            expires_at = max(expires_at, previous[1])
+        self._users[reg_no] = (issued_before, expires_at)
+
+    async def is_revoked(self, digest: bytes, reg_no: str, issued_at: float) -> bool:
+        if not self._tokens and not self._users:
+            return False
+        if digest in self._tokens:
+            return True
+        entry = self._users.get(reg_no)
+        return entry is not None and issued_at < entry[0]
+
+_revocation_list = InMemoryRevocationList() if TOKEN_REVOCATION else None
+
+def get_revocation_list() -> Optional[RevocationList]:
+    return _revocation_list
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Request, Query
+from app.auth import require_admin
+from app.importer import iter_lines, ndjson_records, csv_records, import_students
+from app.jobs import JobQueue, get_job_queue
+from app.followups import after_import
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.post("/admin/import")
+async def import_cohort(
+    request: Request,
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    jobs: JobQueue = Depends(get_job_queue),
+):
+    # The body is consumed as a stream, so uploads of any size use constant memory
+    lines = iter_lines(request.stream())
+    records = ndjson_records(lines) if format == "ndjson" else csv_records(lines)
+    report = await import_students(records)
+    if report["inserted"]:
+        await after_import(jobs)
+    return report
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends, Query
+from app.auth import require_admin
+from app.analytics import ALL_STUDENTS, get_cohort_stats, rebuild_cohort_stats
+from app.models import CohortAnalyticsResponse
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/analytics/cohort", response_model=CohortAnalyticsResponse)
+async def cohort_analytics(batch: str = Query(default=ALL_STUDENTS)):
+    # One read of the cohort's aggregate document, whatever the number of students
+    return await get_cohort_stats(batch)
+
+@router.post("/analytics/cohort/rebuild")
+async def rebuild_cohort_analytics():
+    cohorts = await rebuild_cohort_stats()
+    return {"message": "Cohort analytics rebuilt", "cohorts": cohorts}
@@ -1,45 +1,99 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import time
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
-from app.auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.database import db
-from app.models import StudentCreate, StudentModel, Token, StudentResponse
+from app.auth import (
+    hash_password, check_password, create_access_token, invalidate_user, verify_token, token_digest,
+    oauth2_scheme, CurrentUser, ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from app.revocation import get_revocation_list
+from app.repositories import StudentRepository, DuplicateStudent, get_student_repository
+from app.models import StudentCreate, Token, StudentResponse, PasswordChange
+from app.gpa import empty_totals, gpa_fields
 
 router = APIRouter()
 
-@router.post("/register", response_model=StudentResponse)
-async def register(student: StudentCreate):
-    # Check if student already exists (reg_no or email)
-    existing_student = await db.students.find_one({"$or": [{"reg_no": student.reg_no}, {"email": student.email}]})
-    if existing_student:
+password_user = CurrentUser({"reg_no": 1})
+
+def _issue_token(reg_no: str) -> dict:
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # Use reg_no as the subject for the token
+    access_token = create_access_token(
+        data={"sub": reg_no}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/register", response_model=StudentResponse, status_code=status.HTTP_201_CREATED)
+async def register(student: StudentCreate, students: StudentRepository = Depends(get_student_repository)):
+    # Check if student already exists (reg_no or email). This only saves the bcrypt
+    # work for obvious duplicates; the unique indexes are what settle races.
+    if await students.exists(student.reg_no, student.email):
         raise HTTPException(status_code=400, detail="Student with this Reg No or Email already exists")
 
-    hashed_password = get_password_hash(student.password)
+    hashed_password = await hash_password(student.password)
     student_dict = student.dict()
     student_dict.pop("password")
     student_dict["hashed_password"] = hashed_password
+    student_dict.update(gpa_fields(empty_totals(), None))
+    student_dict["version"] = 1
     
-    new_student = await db.students.insert_one(student_dict)
-    created_student = await db.students.find_one({"_id": new_student.inserted_id})
-    return created_student
+    try:
+        student_dict["_id"] = await students.create(student_dict)
+    except DuplicateStudent:
+        raise HTTPException(status_code=400, detail="Student with this Reg No or Email already exists")
+
+    return student_dict
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    # Try finding by reg_no
-    user = await db.students.find_one({"reg_no": form_data.username})
-    # If not found, try by email
-    if not user:
-         user = await db.students.find_one({"email": form_data.username})
-         
-    if not user or not verify_password(form_data.password, user['hashed_password']):
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    students: StudentRepository = Depends(get_student_repository)
+):
+    user = await students.find_for_login(form_data.username)
+
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await check_password(form_data.password, user['hashed_password'])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    # Use reg_no as the subject for the token
-    access_token = create_access_token(
-        data={"sub": user['reg_no']}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+
+    # Upgrade hashes made with a different bcrypt cost
+    if new_hash:
+        await students.update(user["_id"], {"hashed_password": new_hash}, bump_version=False)
+        invalidate_user(user['reg_no'])
+
+    return _issue_token(user['reg_no'])
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(oauth2_scheme), revocation_list = Depends(get_revocation_list)):
+    token_data = await verify_token(token)
+    if revocation_list is not None:
+        await revocation_list.revoke_token(token_digest(token), token_data.expires_at)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/users/me/password", response_model=Token)
+async def change_password(
+    change: PasswordChange,
+    current_user: dict = Depends(password_user),
+    revocation_list = Depends(get_revocation_list),
+    students: StudentRepository = Depends(get_student_repository),
+):
+    stored = await students.get(current_user["_id"], {"hashed_password": 1})
+    valid, _ = await check_password(change.current_password, stored["hashed_password"])
+    if not valid:
+        raise HTTPException(status_code=400, detail="Current password is incorrect")
+
+    hashed_password = await hash_password(change.new_password)
+    await students.update(current_user["_id"], {"hashed_password": hashed_password})
+    invalidate_user(current_user["reg_no"])
+
+    # Sign out every other session; the token returned below is issued after the cut-off
+    if revocation_list is not None:
+        await revocation_list.revoke_user(
+            current_user["reg_no"], time.time(), time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        )
+    return _issue_token(current_user["reg_no"])
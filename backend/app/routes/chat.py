@@ -1,13 +1,27 @@
-from fastapi import APIRouter, Depends
-from app.auth import get_current_user
-from app.models import ChatMessage, ChatResponse
+from fastapi import APIRouter, Depends, Request, BackgroundTasks, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.auth import CurrentUser, on_user_invalidated
+from app.cache import LRUCache
+from app.metrics import register_cache
+from app.llm import ResilientLLMClient, get_llm_client, GEMINI_CONTEXT_CACHE_TTL
+from app.circuit_breaker import CircuitOpen
+from app.chat_history import load_context, build_contents, append_turns, fold_into_summary, get_history_page
+from app.models import ChatMessage, ChatResponse, ChatHistoryResponse
+from app.response_cache import ResponseCache, get_response_cache
+from app.rate_limit import ChatRateLimiter, get_chat_rate_limiter
+from app.singleflight import SingleFlight, StreamFlight
+from app.semesters import is_split, get_history
+from app.retrieval import Retriever, get_retriever, resource_context
+from app.planner import plan_grades, target_from_message, describe_plan
+from app.gpa import rebuild_totals
+from bson import ObjectId
+from bson.errors import InvalidId
+from typing import Optional
+from datetime import datetime, timedelta
+import json
 import logging
 import os
-import google
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
+import re
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,15 +29,59 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Configure Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+# Everything the prompt is built from
+chat_user = CurrentUser({"name": 1, "batch": 1, "current_semester": 1, "semesters": 1, "gpa_totals": 1, "version": 1})
+# Only the identity is needed to page through stored turns
+chat_history_user = CurrentUser({"reg_no": 1})
 
+FALLBACK_RESPONSE = "I'm sorry, I'm currently unable to respond. Please try again later."
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage, current_user: dict = Depends(get_current_user)):
-    user_input = message.message
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", 512))
+# After this long without messages a new question is treated as standalone and
+# may be answered from the response cache
+CHAT_SESSION_IDLE_SECONDS = int(os.getenv("CHAT_SESSION_IDLE_SECONDS", 1800))
+
+# Rendered system instruction and model handle per student, and per cohort for
+# shared answers. An entry is rebuilt when its fingerprint changes; student
+# entries are also dropped whenever the users routes write to the student. With
+# server-side context caching it must expire before Gemini's copy.
+prompt_cache = LRUCache(
+    maxsize=PROMPT_CACHE_SIZE,
+    ttl=GEMINI_CONTEXT_CACHE_TTL * 0.9 if GEMINI_CONTEXT_CACHE_TTL else None
+)
+on_user_invalidated(prompt_cache.pop)
+register_cache("chat_prompt", prompt_cache.stats)
+
+ADVISOR_RULES = (
+    "ROLE: Provide accurate, honest, and practical academic guidance. "
+    "Be direct. Do not sugarcoat. Do not give false hope. "
+    "Be concise and professional. "
+
+    "RESPONSE RULES: "
+    "- Maximum 200 words unless deeper explanation is absolutely necessary. "
+    "- Use clear headings and bullet points. "
+    "- Keep sentences short. "
+    "- Avoid long paragraphs. "
+    "- Do not repeat information. "
+    "- For simple queries (e.g., greetings), respond in 1–2 lines only. "
+    "- When a GPA planner result is given with the message, use its grades and CGPA values exactly; never work out grades or GPA yourself. "
+
+    "STRUCTURE FORMAT (use when giving academic explanations): "
+    "1) Topic "
+    "2) Concept (short explanation) "
+    "3) Why It Matters "
+    "4) Resources "
+    "5) Action Step "
 
+    "RESOURCE POLICY: "
+    "- Prefer the vetted resources listed with the student's message, and only give URLs that appear there. "
+    "- Otherwise name a trusted platform (official documentation, NPTEL, GeeksforGeeks) without a URL. "
+    "- Never fabricate URLs. "
+
+    "If information is missing or uncertain, clearly say you do not know."
+)
+
+def build_system_instruction(current_user: dict) -> str:
     # Context Construction
     student_name = current_user.get('name', 'Student')
     current_sem = current_user.get('current_semester', 1)
@@ -43,47 +101,266 @@ async def chat(message: ChatMessage, current_user: dict = Depends(get_current_us
         f"You are the Student Advisor and Personal Mentor of {student_name}. "
         f"He is currently in semester {current_sem}. "
         f"Academic record (absolute truth): {history_summary}. "
+    ) + ADVISOR_RULES
+    return system_instruction
+
+def build_cohort_instruction(current_user: dict) -> str:
+    # For answers shared through the response cache: only what cohort_fingerprint
+    # covers goes in, never the name or the academic record
+    batch = current_user.get('batch')
+    cohort = f"the {batch} batch" if batch else "the university"
+    return (
+        f"You are the Student Advisor for students of {cohort} in semester {current_user.get('current_semester', 1)}. "
+        "You do not know which student is asking; never assume their name, grades or history. "
+    ) + ADVISOR_RULES
+
+async def with_history(current_user: dict) -> dict:
+    # With split semester storage the history is not on the student document
+    if is_split(current_user):
+        return {**current_user, "semesters": await get_history(current_user)}
+    return current_user
+
+def plan_context(current_user: dict, message: str) -> Optional[str]:
+    # Questions about reaching a CGPA are answered from the planner, not from Gemini's arithmetic
+    target = target_from_message(message)
+    if target is None:
+        return None
+    semesters = current_user.get('semesters') or []
+    current_sem = current_user.get('current_semester', 1)
+    current = next((sem for sem in semesters if sem['semester_number'] == current_sem), None)
+    subjects = current['subjects'] if current else []
+    totals = current_user.get('gpa_totals') or rebuild_totals(semesters)
+    plan = plan_grades(totals, subjects, target)
+    return f"GPA planner result (exact, computed from the academic record):\n{describe_plan(plan, subjects)}"
+
+def grounded_message(message: str, current_user: dict, resources: list) -> str:
+    # The student's message as sent to Gemini, after the facts looked up or computed for it
+    context = [block for block in (plan_context(current_user, message), resource_context(resources)) if block]
+    if not context:
+        return message
+    return "\n\n".join(context + [f"Student's message: {message}"])
+
+def record_fingerprint(current_user: dict) -> str:
+    # Every write to a student bumps its version, so (id, version) changes
+    # whenever anything build_system_instruction reads does
+    return f"{current_user['_id']}:{current_user.get('version', 0)}"
+
+def cohort_fingerprint(current_user: dict) -> str:
+    # Everything build_cohort_instruction reads; students with the same batch
+    # and semester share cached answers
+    return f"{current_user.get('batch')}:{current_user.get('current_semester', 1)}"
+
+async def _model(key, fingerprint: str, build_instruction, current_user: dict, llm: ResilientLLMClient):
+    entry = prompt_cache.get(key)
+    if entry is None or entry['fingerprint'] != fingerprint:
+        system_instruction = build_instruction(current_user)
+        entry = {
+            "fingerprint": fingerprint,
+            "system_instruction": system_instruction,
+            "model": await llm.get_model(system_instruction)
+        }
+        prompt_cache.set(key, entry)
+    return entry['model']
+
+async def get_student_model(current_user: dict, llm: ResilientLLMClient):
+    return await _model(current_user['reg_no'], record_fingerprint(current_user), build_system_instruction, current_user, llm)
+
+async def get_cohort_model(current_user: dict, llm: ResilientLLMClient):
+    # Keyed apart from reg_no entries, so student invalidations leave it alone
+    fingerprint = cohort_fingerprint(current_user)
+    return await _model(("cohort", fingerprint), fingerprint, build_cohort_instruction, current_user, llm)
+
+async def _prompt(message: ChatMessage, current_user: dict, summary_doc, window: list, shared: bool, llm, retriever):
+    # Model and contents for Gemini. Shared answers go out without the student's
+    # record or conversation, so they are safe to serve to the whole cohort.
+    resources = await retriever.retrieve(message.message)
+    if shared:
+        model = await get_cohort_model(current_user, llm)
+        return model, build_contents(None, [], grounded_message(message.message, current_user, resources))
+    model = await get_student_model(current_user, llm)
+    return model, build_contents(summary_doc, window, grounded_message(message.message, current_user, resources))
+
+def _is_standalone(window: list) -> bool:
+    # Cached answers ignore conversation context, so only use them when there is
+    # no recent conversation the new message could be following up on
+    if not window:
+        return True
+    idle = datetime.utcnow() - window[-1]["created_at"]
+    return idle > timedelta(seconds=CHAT_SESSION_IDLE_SECONDS)
+
+# Questions about the student's own record ("my grades", "my CGPA") need it in the prompt
+_personal = re.compile(r"\b(?:my|mine)\b", re.I)
+
+def _is_shareable(message: ChatMessage, window: list) -> bool:
+    # Answers from the shared cache are written for the cohort, not the student,
+    # so only standalone questions that need nothing from the record qualify
+    if message.bypass_cache or not _is_standalone(window):
+        return False
+    return not _personal.search(message.message) and target_from_message(message.message) is None
 
-        "ROLE: Provide accurate, honest, and practical academic guidance. "
-        "Be direct. Do not sugarcoat. Do not give false hope. "
-        "Be concise and professional. "
-
-        "RESPONSE RULES: "
-        "- Maximum 200 words unless deeper explanation is absolutely necessary. "
-        "- Use clear headings and bullet points. "
-        "- Keep sentences short. "
-        "- Avoid long paragraphs. "
-        "- Do not repeat information. "
-        "- For simple queries (e.g., greetings), respond in 1–2 lines only. "
-
-        "STRUCTURE FORMAT (use when giving academic explanations): "
-        "1) Topic "
-        "2) Concept (short explanation) "
-        "3) Why It Matters "
-        "4) Resources "
-        "5) Action Step "
-
-        "RESOURCE POLICY: "
-        "- Only recommend trusted platforms (official documentation, NPTEL, Coursera, edX, "
-        "GeeksforGeeks, university websites). "
-        "- Only provide links if confident they are valid and official. "
-        "- Never fabricate URLs. "
-        "- If unsure, mention the platform name without a URL. "
-
-        "If information is missing or uncertain, clearly say you do not know."
+# Identical concurrent messages from one student (double-clicks, client retries)
+chat_flight = SingleFlight("chat")
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(
+    message: ChatMessage,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(chat_user),
+    llm: ResilientLLMClient = Depends(get_llm_client),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    rate_limiter: ChatRateLimiter = Depends(get_chat_rate_limiter),
+    retriever: Retriever = Depends(get_retriever)
+):
+    current_user = await with_history(current_user)
+    # The duplicates share one Gemini call and the turn pair is stored once
+    key = (current_user["reg_no"], message.message, message.bypass_cache)
+    return await chat_flight.do(
+        key, lambda: _answer(message, background_tasks, current_user, llm, response_cache, rate_limiter, retriever)
     )
 
-    try:
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            system_instruction=system_instruction
-        )
-        response = model.generate_content(user_input)
-        bot_response = response.text
+async def _answer(message, background_tasks, current_user, llm, response_cache, rate_limiter, retriever):
+    student_id = current_user["_id"]
+    summary_doc, window, overflow = await load_context(student_id)
+    # Turns that fell out of the token budget are summarized after responding
+    background_tasks.add_task(fold_into_summary, student_id, summary_doc, overflow, llm)
 
-        return {"response": bot_response}
+    fingerprint = cohort_fingerprint(current_user)
+    use_cache = _is_shareable(message, window)
+    if use_cache:
+        cached = await response_cache.get(message.message, fingerprint)
+        if cached is not None:
+            await append_turns(student_id, message.message, cached)
+            return {"response": cached}
 
+    # Only calls that reach Gemini spend rate limit tokens
+    await rate_limiter.check(current_user["reg_no"])
+    try:
+        # Catalog entries matching this message go with it, not into the cached system instruction
+        model, contents = await _prompt(message, current_user, summary_doc, window, use_cache, llm, retriever)
+        bot_response = await llm.generate(model, contents)
+    except CircuitOpen:
+        # Gemini has been failing; answer at once rather than wait on it again
+        return {"response": FALLBACK_RESPONSE}
     except Exception as e:
         logger.error(f"Gemini API Error: {e}")
-        return {"response": "I'm sorry, I'm currently unable to respond. Please try again later."}
+        return {"response": FALLBACK_RESPONSE}
+
+    await append_turns(student_id, message.message, bot_response)
+    if use_cache:
+        await response_cache.set(message.message, fingerprint, bot_response)
+    return {"response": bot_response}
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events, background_tasks: BackgroundTasks) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks
+    )
+
+# The same for streamed answers: duplicates replay one Gemini stream
+chat_stream_flight = StreamFlight("chat_stream")
+
+@router.post("/chat/stream")
+async def chat_stream(
+    message: ChatMessage,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(chat_user),
+    llm: ResilientLLMClient = Depends(get_llm_client),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    rate_limiter: ChatRateLimiter = Depends(get_chat_rate_limiter),
+    retriever: Retriever = Depends(get_retriever)
+):
+    current_user = await with_history(current_user)
+    key = (current_user["reg_no"], message.message, message.bypass_cache)
+    # Setup errors such as a 429 reach every duplicate before its stream starts
+    tokens = await chat_stream_flight.join(
+        key, lambda: _answer_stream(message, background_tasks, current_user, llm, response_cache, rate_limiter, retriever)
+    )
+
+    async def event_stream():
+        try:
+            async for text in tokens:
+                # Stop pulling from Gemini as soon as the client goes away
+                if await request.is_disconnected():
+                    logger.info("Chat stream client disconnected, cancelling generation")
+                    break
+                yield _sse("token", {"text": text})
+            else:
+                yield _sse("done", {})
+        except CircuitOpen:
+            yield _sse("error", {"text": FALLBACK_RESPONSE})
+        except Exception as e:
+            logger.error(f"Gemini API Error: {e}")
+            yield _sse("error", {"text": FALLBACK_RESPONSE})
+        finally:
+            # Generation stops once every duplicate has gone
+            await tokens.aclose()
+
+    return _sse_response(event_stream(), background_tasks)
+
+async def _answer_stream(message, background_tasks, current_user, llm, response_cache, rate_limiter, retriever):
+    # Returns the answer's text chunks; runs once for a set of duplicates
+    student_id = current_user["_id"]
+    summary_doc, window, overflow = await load_context(student_id)
+    background_tasks.add_task(fold_into_summary, student_id, summary_doc, overflow, llm)
+
+    fingerprint = cohort_fingerprint(current_user)
+    use_cache = _is_shareable(message, window)
+    cached = None
+    if use_cache:
+        cached = await response_cache.get(message.message, fingerprint)
+
+    if cached is not None:
+        async def cached_tokens():
+            await append_turns(student_id, message.message, cached)
+            yield cached
+
+        return cached_tokens()
+
+    # Checked before the stream starts so the client gets a plain 429
+    await rate_limiter.check(current_user["reg_no"])
+
+    async def answer_tokens():
+        # Prompt setup runs inside the stream, so a failure there ends in the
+        # fallback event like a Gemini error rather than a 500
+        model, contents = await _prompt(message, current_user, summary_doc, window, use_cache, llm, retriever)
+        tokens = llm.stream(model, contents)
+        parts = []
+        try:
+            async for text in tokens:
+                parts.append(text)
+                yield text
+            # Only complete answers are stored and worth replaying
+            bot_response = "".join(parts)
+            await append_turns(student_id, message.message, bot_response)
+            if use_cache:
+                await response_cache.set(message.message, fingerprint, bot_response)
+        finally:
+            await tokens.aclose()
+
+    return answer_tokens()
+
+@router.get("/chat/history", response_model=ChatHistoryResponse)
+async def chat_history(
+    limit: int = Query(default=20, ge=1, le=100),
+    before: str = None,
+    current_user: dict = Depends(chat_history_user)
+):
+    # Pages backwards through the conversation; pass next_before to get older turns
+    before_id = None
+    if before is not None:
+        try:
+            before_id = ObjectId(before)
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
+    turns = await get_history_page(current_user["_id"], limit, before_id)
+    return {
+        "messages": turns,
+        "next_before": str(turns[0]["_id"]) if len(turns) == limit else None
+    }
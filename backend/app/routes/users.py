@@ -1,86 +1,102 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from app.auth import get_current_user
-from app.models import StudentResponse, Subject
-from app.database import db
-from typing import List
+import logging
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Body, Header
+from app.auth import get_current_user, invalidate_user, CurrentUser, VersionedUser, etag_for, CURRENT_SEMESTER_ONLY, PRIVATE_FIELDS
+from app.models import StudentResponse, Subject, Semester, GPAResponse, PlanRequest, PlanResponse
+from app.serialization import FastJSONResponse, student_payload
+from app.gpa import calculate_sgpa, apply_subjects, rebuild_totals, gpa_fields
+from app.planner import plan_grades
+from app.repositories import StudentRepository, get_student_repository
+from app.jobs import JobQueue, OUTBOX_FIELD, add_to_outbox, get_job_queue
+from app.followups import COHORT_STATS, dispatch_followups
+from app import semesters as semester_store
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Fields each route reads; everything else stays in MongoDB
+profile_user = VersionedUser({"hashed_password": 0, "gpa_totals": 0, "completed_requests": 0, OUTBOX_FIELD: 0})
+current_semester_user = VersionedUser({"current_semester": 1, "version": 1, "semesters": CURRENT_SEMESTER_ONLY})
+add_subject_user = CurrentUser({
+    "current_semester": 1,
+    "last_sgpa": 1,
+    "gpa_totals": 1,
+    "semesters": CURRENT_SEMESTER_ONLY
+})
+history_user = VersionedUser({"semesters": 1, "version": 1})
+gpa_user = CurrentUser({"current_semester": 1, "cgpa": 1, "last_sgpa": 1, "gpa_totals.credits": 1})
+plan_user = CurrentUser({"current_semester": 1, "gpa_totals": 1, "semesters": CURRENT_SEMESTER_ONLY})
+
+async def _gpa_totals(current_user: dict) -> dict:
+    # Documents created before totals were stored get them rebuilt once
+    totals = current_user.get("gpa_totals")
+    if totals is None:
+        totals = rebuild_totals(await semester_store.load_history(current_user["_id"]))
+    return totals
+
+def _versioned_response(content, student: dict) -> FastJSONResponse:
+    # Browsers revalidate with If-None-Match on every view and get a 304 while
+    # the document's version is unchanged
+    return FastJSONResponse(content, headers={"ETag": etag_for(student), "Cache-Control": "private, no-cache"})
+
+# The dashboard reads return their documents directly: response_model still
+# documents the schema, but the stored data is not re-validated on every read
 @router.get("/users/me", response_model=StudentResponse)
-async def read_users_me(current_user: dict = Depends(get_current_user)):
-    return current_user
+async def read_users_me(current_user: dict = Depends(profile_user)):
+    payload = student_payload(current_user)
+    payload["semesters"] = await semester_store.get_history(current_user)
+    return _versioned_response(payload, current_user)
 
 @router.get("/users/me/subjects", response_model=List[Subject])
-async def get_current_subjects(current_user: dict = Depends(get_current_user)):
+async def get_current_subjects(current_user: dict = Depends(current_semester_user)):
     # Find the current semester object in the user's semesters list
     # If it exists, return its subjects. Else return empty list.
-    
     current_sem_num = current_user.get("current_semester", 1)
-    semesters = current_user.get("semesters", [])
-    
-    for sem in semesters:
-        if sem['semester_number'] == current_sem_num:
-            return sem['subjects']
-            
+    sem = await semester_store.get_semester(current_user, current_sem_num)
+    if sem is not None:
+        return _versioned_response(sem['subjects'], current_user)
+
     # If current semester not found in list (e.g. new semester), return empty
-    return []
+    return _versioned_response([], current_user)
 
 @router.post("/users/me/subjects", response_model=List[Subject])
-async def add_subject(subject: Subject, current_user: dict = Depends(get_current_user)):
+async def add_subject(subject: Subject, current_user: dict = Depends(add_subject_user)):
     current_sem_num = current_user.get("current_semester", 1)
-    semesters = current_user.get("semesters", [])
-    
-    # Check if the current semester exists in the list
-    sem_index = -1
-    for i, sem in enumerate(semesters):
-        if sem['semester_number'] == current_sem_num:
-            sem_index = i
-            break
-            
-    if sem_index == -1:
-        # Create new semester entry if it doesn't exist
-        new_semester = {
-            "semester_number": current_sem_num,
-            "subjects": [subject.model_dump()],
-            "sgpa": None
-        }
-        await db.students.update_one(
-            {"_id": current_user["_id"]},
-            {"$push": {"semesters": new_semester}}
-        )
-        return [subject]
-    else:
-        # Append to existing semester
-        await db.students.update_one(
-            {"_id": current_user["_id"], "semesters.semester_number": current_sem_num},
-            {"$push": {"semesters.$.subjects": subject.model_dump()}}
-        )
-        
-        # Return updated list
-        # We need to fetch the updated user or just return what we expect
-        return semesters[sem_index]['subjects'] + [subject]
+    sem = await semester_store.get_semester(current_user, current_sem_num)
+    subjects = sem['subjects'] if sem is not None else []
+
+    # A subject added with a grade already counts towards SGPA/CGPA
+    totals = apply_subjects(await _gpa_totals(current_user), [subject.model_dump()], current_sem_num)
+    sgpa = calculate_sgpa(subjects + [subject.model_dump()])
+    await semester_store.add_subject(
+        current_user, current_sem_num, subject.model_dump(), sgpa, gpa_fields(totals, current_user.get("last_sgpa"))
+    )
+    invalidate_user(current_user["reg_no"])
+    return subjects + [subject]
+
+# Attempts before giving up when add_subject races with complete_semester
+COMPLETE_SEMESTER_ATTEMPTS = 3
+# Idempotency keys (and their responses) remembered per student
+COMPLETED_REQUESTS_KEPT = 10
+
+def _plan_completion(current: Optional[dict], following: Optional[dict], grades: dict, totals: dict):
+    # Computes the semester being completed after grading it and the next
+    # semester with failed subjects carried into it, without touching the
+    # database. Returns (graded, following, carried, sgpa, totals, result).
+    if current is None:
+        raise HTTPException(status_code=400, detail="No subjects found for current semester")
+    # Grades for subjects this semester does not have were meant for another
+    # state, e.g. a resubmit after the semester they were for was completed
+    if not set(grades) <= {sub['code'] for sub in current['subjects']}:
+        raise HTTPException(status_code=409, detail="Grades do not match the current semester's subjects")
 
-@router.post("/users/me/complete-semester")
-async def complete_semester(grades: dict = Body(...), current_user: dict = Depends(get_current_user)):
-    # grades is a dict of subject_code: grade
-    current_sem_num = current_user.get("current_semester", 1)
-    semesters = current_user.get("semesters", [])
-    
-    sem_index = -1
-    for i, sem in enumerate(semesters):
-        if sem['semester_number'] == current_sem_num:
-            sem_index = i
-            break
-            
-    if sem_index == -1:
-         raise HTTPException(status_code=400, detail="No subjects found for current semester")
-    
     # Update grades in the subjects of the current semester
-    current_subjects = semesters[sem_index]['subjects']
     updated_subjects = []
     failed_subjects = []
-    
-    for sub in current_subjects:
+
+    for sub in current['subjects']:
+        sub = dict(sub)
         if sub['code'] in grades:
             grade = grades[sub['code']]
             sub['grade'] = grade
@@ -90,54 +106,123 @@ async def complete_semester(grades: dict = Body(...), current_user: dict = Depen
                 failed_sub['grade'] = None
                 failed_subjects.append(failed_sub)
         updated_subjects.append(sub)
-        
-    # Update current semester with grades
-    await db.students.update_one(
-        {"_id": current_user["_id"], "semesters.semester_number": current_sem_num},
-        {"$set": {"semesters.$.subjects": updated_subjects}}
-    )
-    
-    next_semester_num = current_sem_num + 1
-
-    # If there are failed subjects, add them to the next semester immediately
-    # We also need to Initialize the next semester if it doesn't exist?
-    # Usually, the next semester starts empty until user adds subjects.
-    # But here we are forcing failed subjects into it.
-    
-    if failed_subjects:
-        # Check if next semester exists (unlikely if we just finished current, but possible if pre-planned)
-        next_sem_index = -1
-        for i, sem in enumerate(semesters):
-            if sem['semester_number'] == next_semester_num:
-                next_sem_index = i
-                break
-        
-        if next_sem_index != -1:
-            # Push failed subjects to existing next semester
-            await db.students.update_one(
-                {"_id": current_user["_id"], "semesters.semester_number": next_semester_num},
-                {"$push": {"semesters.$.subjects": {"$each": failed_subjects}}}
-            )
-        else:
-            # Create new semester with failed subjects
-            new_semester = {
-                "semester_number": next_semester_num,
-                "subjects": failed_subjects,
-                "sgpa": None
-            }
-            await db.students.update_one(
-                {"_id": current_user["_id"]},
-                {"$push": {"semesters": new_semester}}
-            )
-
-    # Increment current_semester
-    await db.students.update_one(
-        {"_id": current_user["_id"]},
-        {"$inc": {"current_semester": 1}}
-    )
-    
-    return {"message": "Semester completed successfully", "next_semester": next_semester_num, "failed_carried_forward": len(failed_subjects)}
 
-@router.get("/users/me/history")
-async def get_academic_history(current_user: dict = Depends(get_current_user)):
-    return current_user.get("semesters", [])
+    sgpa = calculate_sgpa(updated_subjects)
+    totals = apply_subjects(totals, updated_subjects, current["semester_number"])
+    next_semester_num = current['semester_number'] + 1
+
+    graded = {**current, "subjects": updated_subjects, "sgpa": sgpa}
+    if following is not None:
+        # Next semester was pre-planned: failed subjects join it
+        following = {**following, "subjects": following['subjects'] + failed_subjects}
+    elif failed_subjects:
+        # Create new semester with failed subjects
+        following = {
+            "semester_number": next_semester_num,
+            "subjects": failed_subjects,
+            "sgpa": None
+        }
+
+    result = {"message": "Semester completed successfully", "next_semester": next_semester_num, "failed_carried_forward": len(failed_subjects)}
+    return graded, following, failed_subjects, sgpa, totals, result
+
+def _completed_result(student: dict, idempotency_key: Optional[str]):
+    if idempotency_key is None:
+        return None
+    for request in student.get("completed_requests", []):
+        if request["key"] == idempotency_key:
+            return request["result"]
+    return None
+
+@router.post("/users/me/complete-semester")
+async def complete_semester(
+    background_tasks: BackgroundTasks,
+    grades: dict = Body(...),
+    idempotency_key: Optional[str] = Header(default=None),
+    current_user: dict = Depends(get_current_user),
+    students: StudentRepository = Depends(get_student_repository),
+    jobs: JobQueue = Depends(get_job_queue)
+):
+    # grades is a dict of subject_code: grade
+    # Grades, the carried-forward subjects, the GPA fields and the semester
+    # increment are committed by a single update guarded on the state the plan was
+    # computed from, so a crash or a double submit can never half-promote a student.
+    # The same update stores the cohort stats job in the student's outbox; it is
+    # moved to the job queue after the response.
+    student = current_user
+    for _ in range(COMPLETE_SEMESTER_ATTEMPTS):
+        replay = _completed_result(student, idempotency_key)
+        if replay is not None:
+            # The first attempt may have stopped before dispatching its jobs
+            background_tasks.add_task(dispatch_followups, jobs, student["_id"])
+            return replay
+
+        current_sem_num = student.get("current_semester", 1)
+        totals = await _gpa_totals(student)
+        current, following = await semester_store.completion_window(student, current_sem_num)
+        graded, following, carried, sgpa, totals, result = _plan_completion(current, following, grades, totals)
+
+        update = {
+            "$set": gpa_fields(totals, sgpa),
+            "$inc": {"current_semester": 1, "version": 1}
+        }
+        if idempotency_key is not None:
+            update["$push"] = {"completed_requests": {
+                "$each": [{"key": idempotency_key, "result": result}],
+                "$slice": -COMPLETED_REQUESTS_KEPT
+            }}
+        add_to_outbox(update, COHORT_STATS)
+
+        completed = await semester_store.complete(student, current, graded, following, carried, update)
+        invalidate_user(student["reg_no"])
+        if completed:
+            background_tasks.add_task(dispatch_followups, jobs, student["_id"])
+            return result
+
+        # The snapshot was stale: look at the stored document and decide
+        student = await students.get(student["_id"], PRIVATE_FIELDS)
+        replay = _completed_result(student, idempotency_key)
+        if replay is not None:
+            return replay
+        if student.get("current_semester", 1) != current_sem_num:
+            raise HTTPException(status_code=409, detail="Semester has already been completed")
+        # Subjects changed concurrently; plan again from the fresh document
+
+    raise HTTPException(status_code=409, detail="Semester changed while completing, please retry")
+
+@router.get("/users/me/history", response_model=List[Semester])
+async def get_academic_history(current_user: dict = Depends(history_user)):
+    return _versioned_response(await semester_store.get_history(current_user), current_user)
+
+@router.get("/users/me/gpa", response_model=GPAResponse)
+async def get_gpa(current_user: dict = Depends(gpa_user), students: StudentRepository = Depends(get_student_repository)):
+    totals = current_user.get("gpa_totals")
+    if totals is None:
+        # Backfill documents written before GPA fields were maintained
+        semesters = await semester_store.load_history(current_user["_id"])
+        totals = rebuild_totals(semesters)
+        last_sgpa = None
+        current_sem_num = current_user.get("current_semester", 1)
+        for sem in semesters:
+            if sem['semester_number'] == current_sem_num - 1:
+                last_sgpa = calculate_sgpa(sem['subjects'])
+        fields = gpa_fields(totals, last_sgpa)
+        await students.update(current_user["_id"], fields)
+        invalidate_user(current_user["reg_no"])
+        current_user = {**current_user, **fields}
+
+    return {
+        "cgpa": current_user.get("cgpa"),
+        "last_sgpa": current_user.get("last_sgpa"),
+        "total_credits": totals["credits"]
+    }
+
+@router.post("/users/me/plan", response_model=PlanResponse)
+async def plan_semester(request: PlanRequest, current_user: dict = Depends(plan_user)):
+    # Least demanding grades for the ungraded subjects that reach target_cgpa
+    if request.subjects is not None:
+        subjects = [subject.model_dump() for subject in request.subjects]
+    else:
+        sem = await semester_store.get_semester(current_user, current_user.get("current_semester", 1))
+        subjects = sem['subjects'] if sem is not None else []
+    return plan_grades(await _gpa_totals(current_user), subjects, request.target_cgpa, request.limit)
@@ -0,0 +1,235 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app.database import db
+from app.repositories import get_student_repository
+
+# Where a student's semesters and subjects live:
+#   embedded - a "semesters" array on the student document (the original layout)
+#   split    - one document per (student_id, semester_number) in the semesters
+#              collection, with only summary fields left on the student
+# In split mode, students that migrate_semesters.py has not moved yet are still
+# read and written in the embedded layout, so the mode can be switched first
+# and the data migrated while the app serves traffic.
+SEMESTER_STORAGE = os.getenv("SEMESTER_STORAGE", "embedded")
+SPLIT_STORAGE = SEMESTER_STORAGE == "split"
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 200))
+# Passes over students written to while their batch was being moved
+MIGRATION_ATTEMPTS = 3
+
+# A semester document in the shape of models.Semester
+SEMESTER_FIELDS = {"_id": 0, "semester_number": 1, "subjects": 1, "sgpa": 1}
+
+def is_split(student: dict) -> bool:
+    # student must have been loaded with "semesters" in its projection; split
+    # documents have no such field
+    return SPLIT_STORAGE and student.get("semesters") is None
+
+def _find(semesters: List[dict], number: int) -> Optional[dict]:
+    return next((sem for sem in semesters if sem["semester_number"] == number), None)
+
+def semester_documents(student_id: ObjectId, semesters: List[dict]) -> List[dict]:
+    return [{"student_id": student_id, **sem} for sem in semesters]
+
+async def _split_history(student_id: ObjectId) -> List[dict]:
+    return await db.semesters.find({"student_id": student_id}, SEMESTER_FIELDS).sort("semester_number", 1).to_list(None)
+
+async def get_semester(student: dict, number: int) -> Optional[dict]:
+    if not is_split(student):
+        return _find(student.get("semesters") or [], number)
+    return await db.semesters.find_one({"student_id": student["_id"], "semester_number": number}, SEMESTER_FIELDS)
+
+async def get_history(student: dict) -> List[dict]:
+    if not is_split(student):
+        return student.get("semesters") or []
+    return await _split_history(student["_id"])
+
+async def load_history(student_id: ObjectId) -> List[dict]:
+    # For callers whose projection left the semesters out
+    stored = await get_student_repository().get(student_id, {"semesters": 1})
+    return await get_history(stored)
+
+async def add_subject(student: dict, number: int, subject: dict, sgpa: float, summary: dict):
+    # Appends a subject to semester `number`, creating the semester if needed,
+    # and sets the student's summary fields
+    if is_split(student):
+        await db.semesters.update_one(
+            {"student_id": student["_id"], "semester_number": number},
+            {"$push": {"subjects": subject}, "$set": {"sgpa": sgpa}},
+            upsert=True
+        )
+        await db.students.update_one({"_id": student["_id"]}, {"$set": summary, "$inc": {"version": 1}})
+    elif _find(student.get("semesters") or [], number) is None:
+        await db.students.update_one(
+            {"_id": student["_id"]},
+            {
+                "$push": {"semesters": {"semester_number": number, "subjects": [subject], "sgpa": sgpa}},
+                "$set": summary,
+                "$inc": {"version": 1}
+            }
+        )
+    else:
+        await db.students.update_one(
+            {"_id": student["_id"], "semesters.semester_number": number},
+            {
+                "$push": {"semesters.$.subjects": subject},
+                "$set": {"semesters.$.sgpa": sgpa, **summary},
+                "$inc": {"version": 1}
+            }
+        )
+
+async def completion_window(student: dict, number: int):
+    # The semester being completed and the one after it (either may be None)
+    if not is_split(student):
+        semesters = student.get("semesters") or []
+        return _find(semesters, number), _find(semesters, number + 1)
+    found = await db.semesters.find(
+        {"student_id": student["_id"], "semester_number": {"$in": [number, number + 1]}}, SEMESTER_FIELDS
+    ).to_list(2)
+    return _find(found, number), _find(found, number + 1)
+
+async def complete(student: dict, current: dict, graded: dict, following: Optional[dict], carried: List[dict], update: dict) -> bool:
+    # Writes a planned completion: `graded` replaces `current`, `following` is
+    # the next semester with `carried` already appended. `update` is the
+    # student update that advances current_semester. Returns False when the
+    # student changed since `current` was read and the plan must be redone.
+    number = current["semester_number"]
+    if not is_split(student):
+        semesters = [sem for sem in student.get("semesters") or [] if sem["semester_number"] not in (number, number + 1)]
+        semesters += [graded] + ([following] if following else [])
+        update["$set"]["semesters"] = sorted(semesters, key=lambda sem: sem["semester_number"])
+        outcome = await db.students.update_one(
+            {
+                "_id": student["_id"],
+                "current_semester": number,
+                "semesters": {"$elemMatch": {
+                    "semester_number": number,
+                    "subjects": {"$size": len(current["subjects"])}
+                }}
+            },
+            update
+        )
+        return outcome.matched_count == 1
+
+    # Split layout: the semester documents are written first, each write
+    # idempotent, and the student update is the commit point. A retry after a
+    # crash in between replays the same writes and then commits.
+    graded_outcome = await db.semesters.update_one(
+        {"student_id": student["_id"], "semester_number": number, "subjects": {"$size": len(current["subjects"])}},
+        {"$set": {"subjects": graded["subjects"], "sgpa": graded["sgpa"]}}
+    )
+    if graded_outcome.matched_count == 0:
+        return False
+    if carried:
+        try:
+            # carried_from marks the semesters whose failures were already carried over
+            await db.semesters.update_one(
+                {"student_id": student["_id"], "semester_number": number + 1, "carried_from": {"$ne": number}},
+                {"$push": {"subjects": {"$each": carried}}, "$addToSet": {"carried_from": number}, "$setOnInsert": {"sgpa": None}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The next semester exists and already holds them
+            pass
+    outcome = await db.students.update_one(
+        {"_id": student["_id"], "current_semester": number, "version": student.get("version")},
+        update
+    )
+    return outcome.matched_count == 1
+
+async def _move_to_split(students: List[dict]) -> int:
+    moved = 0
+    for _ in range(MIGRATION_ATTEMPTS):
+        pending = [s for s in students if s.get("semesters") is not None]
+        if not pending:
+            break
+        requests = [
+            ReplaceOne({"student_id": doc["student_id"], "semester_number": doc["semester_number"]}, doc, upsert=True)
+            for s in pending
+            for doc in semester_documents(s["_id"], s["semesters"])
+        ]
+        if requests:
+            await db.semesters.bulk_write(requests, ordered=False)
+        # The embedded copy is dropped only if the student was not written meanwhile
+        result = await db.students.bulk_write([
+            UpdateOne({"_id": s["_id"], "version": s.get("version")}, {"$unset": {"semesters": ""}, "$inc": {"version": 1}})
+            for s in pending
+        ], ordered=False)
+        moved += result.modified_count
+        students = await db.students.find({"_id": {"$in": [s["_id"] for s in pending]}}, {"semesters": 1, "version": 1}).to_list(None)
+    return moved
+
+async def _move_to_embedded(students: List[dict]) -> int:
+    # Not guarded against split-layout writes landing mid-batch; pause writes
+    # (or run in embedded mode) when moving back
+    moved = 0
+    for _ in range(MIGRATION_ATTEMPTS):
+        pending = [s["_id"] for s in students if not s.get("embedded")]
+        versions = {s["_id"]: s.get("version") for s in students}
+        grouped: Dict[ObjectId, List[dict]] = {}
+        async for doc in db.semesters.find({"student_id": {"$in": pending}}).sort("semester_number", 1):
+            grouped.setdefault(doc["student_id"], []).append({field: doc.get(field) for field in ("semester_number", "subjects", "sgpa")})
+        if not grouped:
+            break
+        result = await db.students.bulk_write([
+            UpdateOne(
+                {"_id": student_id, "semesters": {"$exists": False}, "version": versions[student_id]},
+                {"$set": {"semesters": semesters}, "$inc": {"version": 1}}
+            )
+            for student_id, semesters in grouped.items()
+        ], ordered=False)
+        moved += result.modified_count
+        students = await db.students.find(
+            {"_id": {"$in": list(grouped)}}, {"version": 1, "embedded": {"$isArray": "$semesters"}}
+        ).to_list(None)
+    return moved
+
+async def migrate_semesters(target: str, batch_size: int = MIGRATION_BATCH_SIZE, restart: bool = False, progress=None) -> dict:
+    # Moves every student to the target layout ("split" or "embedded") in _id
+    # order. The last finished batch is checkpointed, so an interrupted run
+    # resumes where it stopped; each batch is safe to repeat.
+    checkpoint_id = f"semesters:{target}"
+    checkpoint = None if restart else await db.migrations.find_one({"_id": checkpoint_id})
+    last_id = checkpoint["last_id"] if checkpoint else None
+    report = {"target": target, "scanned": 0, "moved": 0, "resumed_after": str(last_id) if last_id else None}
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        if target == "split":
+            projection = {"semesters": 1, "version": 1}
+        else:
+            projection = {"version": 1, "embedded": {"$isArray": "$semesters"}}
+        batch = await db.students.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        if target == "split":
+            moved = await _move_to_split(batch)
+        else:
+            moved = await _move_to_embedded(batch)
+            # Split copies of students now embedded, including any left by an interrupted run
+            embedded = await db.students.find(
+                {"_id": {"$in": [s["_id"] for s in batch]}, "semesters": {"$exists": True}}, {"_id": 1}
+            ).to_list(None)
+            await db.semesters.delete_many({"student_id": {"$in": [s["_id"] for s in embedded]}})
+
+        last_id = batch[-1]["_id"]
+        report["scanned"] += len(batch)
+        report["moved"] += moved
+        await db.migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}, "$inc": {"moved": moved}},
+            upsert=True
+        )
+        if progress:
+            progress(report)
+
+    # Students still in the other layout, e.g. written to on every attempt
+    if target == "split":
+        report["remaining"] = await db.students.count_documents({"semesters": {"$exists": True}})
+    else:
+        report["remaining"] = len(await db.semesters.aggregate([{"$group": {"_id": "$student_id"}}]).to_list(None))
+    return report
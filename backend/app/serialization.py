@@ -0,0 +1,34 @@
+from typing import Any
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+def _default(value: Any):
+    # orjson handles datetimes natively; ObjectIds are the only BSON type the routes return
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(JSONResponse):
+    # orjson rendering; the app's default response class
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+# StudentResponse fields, read straight from the stored document
+STUDENT_RESPONSE_FIELDS = ("name", "reg_no", "email", "current_semester", "batch", "semesters", "cgpa", "last_sgpa")
+
+def student_payload(student: dict) -> dict:
+    # Documents written by this backend already match StudentResponse (semesters
+    # and subjects are stored from Subject/Semester.model_dump()), so the fields
+    # are copied instead of validated. student["id"] is the _id string computed
+    # once when the principal was loaded.
+    payload = {"_id": student.get("id") or str(student["_id"])}
+    for field in STUDENT_RESPONSE_FIELDS:
+        payload[field] = student.get(field)
+    if payload["semesters"] is None:
+        payload["semesters"] = []
+    return payload
@@ -0,0 +1,139 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+from app.metrics import Counter
+
+T = TypeVar("T")
+
+COALESCED = Counter("advisr_singleflight_coalesced_total", "Calls that joined an identical call already in flight", ["group"])
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution of the work and
+    # all receive its result or exception. The work runs as its own task, so a
+    # caller that goes away (e.g. a closed connection) does not cancel it for
+    # the others.
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            COALESCED.inc(group=self.name)
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+class _Broadcast:
+    # One run of a stream, replayed to every subscriber from the first item
+
+    def __init__(self, start: Callable[[], Awaitable[AsyncIterator[T]]]):
+        self.items: List[T] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.abandoned = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.ready = asyncio.get_running_loop().create_future()
+        self.task = asyncio.ensure_future(self._run(start))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def changed(self):
+        await self._changed.wait()
+
+    async def _run(self, start):
+        try:
+            source = await start()
+        except asyncio.CancelledError:
+            self.ready.cancel()
+            self.done = True
+            raise
+        except Exception as e:
+            # Raised to every caller through ready
+            self.ready.set_exception(e)
+            self.done = True
+            return
+        self.ready.set_result(None)
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+                if not self.subscribers:
+                    # Everyone went away; stop pulling from the source
+                    self.abandoned = True
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            await source.aclose()
+
+class _Subscription:
+
+    def __init__(self, broadcast: _Broadcast):
+        self.broadcast = broadcast
+        self.position = 0
+        self.closed = False
+        broadcast.subscribers += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        broadcast = self.broadcast
+        while self.position >= len(broadcast.items):
+            if broadcast.done:
+                if broadcast.error is not None:
+                    raise broadcast.error
+                raise StopAsyncIteration
+            await broadcast.changed()
+        self.position += 1
+        return broadcast.items[self.position - 1]
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            self.broadcast.subscribers -= 1
+
+class StreamFlight:
+    # SingleFlight for streamed work. start() prepares the stream and returns
+    # its async iterator; concurrent calls with the same key share one start()
+    # and one run of the stream, and each gets every item from the first.
+    # Errors from start() reach every caller before their stream begins. The
+    # stream stops once the last subscriber has closed its iterator.
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, _Broadcast] = {}
+
+    async def join(self, key: Hashable, start: Callable[[], Awaitable[AsyncIterator[T]]]) -> AsyncIterator[T]:
+        broadcast = self._in_flight.get(key)
+        if broadcast is None or broadcast.abandoned:
+            broadcast = _Broadcast(start)
+            self._in_flight[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._forget(key, broadcast))
+        else:
+            COALESCED.inc(group=self.name)
+        subscription = _Subscription(broadcast)
+        try:
+            await asyncio.shield(broadcast.ready)
+        except BaseException:
+            await subscription.aclose()
+            raise
+        return subscription
+
+    def _forget(self, key: Hashable, broadcast: _Broadcast):
+        if self._in_flight.get(key) is broadcast:
+            del self._in_flight[key]
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
@@ -0,0 +1,130 @@
+import os
+import re
+import json
+import hashlib
+import importlib
+from datetime import datetime
+from typing import List, Sequence, Tuple
+import numpy as np
+
+# Embedding index over the resource catalog. Rows of the matrix are unit
+# vectors, so a dot product is the cosine similarity. The matrix is an .npy
+# file opened with mmap_mode, so workers share the OS page cache instead of
+# each holding a copy.
+#
+#   <index dir>/embeddings.npy   float32 (documents x dimensions)
+#   <index dir>/documents.json   catalog entries, in row order
+#   <index dir>/manifest.json    embedder, dimensions and catalog digest
+
+# Words that carry no topic; matching on them would rank everything alike
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in into is it its me my "
+    "of on or should so that the their them then there these this to was what when where "
+    "which who why will with you your about get want need help".split()
+)
+_token = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+def _stem(word: str) -> str:
+    # Crude suffix stripping so "failed"/"fail" and "structures"/"structure" meet
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+class HashingEmbedder:
+    # Fully offline embedder: word unigrams and bigrams hashed into a fixed
+    # number of signed buckets (the "hashing trick"), sublinear term
+    # frequency, L2-normalized. Lexical rather than semantic, but needs no model
+    # files. Any object with name, dimensions and embed(texts) can replace it.
+
+    def __init__(self, dimensions: int = 2048):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def _features(self, text: str) -> List[str]:
+        words = [_stem(word) for word in _token.findall(text.lower()) if word not in STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                matrix[row, digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        return normalize(matrix)
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def load_embedder(spec: str, dimensions: int):
+    # "hashing", or "package.module:factory" for a local model; the factory is
+    # called with no arguments and returns an object with name, dimensions and embed
+    if spec == "hashing":
+        return HashingEmbedder(dimensions)
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+def document_text(entry: dict) -> str:
+    # What gets embedded for a catalog entry
+    return " ".join(str(entry.get(field) or "") for field in ("title", "provider", "topics", "description"))
+
+def catalog_digest(entries: List[dict]) -> str:
+    return hashlib.sha256(json.dumps(entries, sort_keys=True).encode()).hexdigest()[:16]
+
+def build_index(entries: List[dict], directory: str, embedder, batch_size: int = 256) -> dict:
+    # Embeds every catalog entry and writes the index files. Files are written
+    # under temporary names and renamed, so a running worker never opens a
+    # half-written index.
+    os.makedirs(directory, exist_ok=True)
+    matrix = np.lib.format.open_memmap(
+        os.path.join(directory, "embeddings.npy.tmp"), mode="w+", dtype=np.float32,
+        shape=(len(entries), embedder.dimensions)
+    )
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        matrix[start:start + len(batch)] = embedder.embed([document_text(entry) for entry in batch])
+    matrix.flush()
+    del matrix
+
+    manifest = {
+        "embedder": embedder.name,
+        "dimensions": embedder.dimensions,
+        "documents": len(entries),
+        "catalog_digest": catalog_digest(entries),
+        "built_at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+    for name, content in (("documents.json", entries), ("manifest.json", manifest)):
+        with open(os.path.join(directory, f"{name}.tmp"), "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False, indent=1 if name == "manifest.json" else None)
+    # The manifest goes last: a reader that sees it sees the matching matrix
+    for name in ("embeddings.npy", "documents.json", "manifest.json"):
+        os.replace(os.path.join(directory, f"{name}.tmp"), os.path.join(directory, name))
+    return manifest
+
+class VectorIndex:
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(directory, "documents.json"), encoding="utf-8") as f:
+            self.documents = json.load(f)
+        self.matrix = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        if self.matrix.shape != (len(self.documents), self.manifest["dimensions"]):
+            raise ValueError(f"Index in {directory} is inconsistent: {self.matrix.shape} for {len(self.documents)} documents")
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Top-k rows by cosine similarity for each query vector (one per row),
+        # best first: returns (indices, scores), both (queries x k)
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+        k = min(k, self.matrix.shape[0])
+        if k == 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        scores = queries @ self.matrix.T
+        # argpartition finds the k best in linear time; only those k are sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
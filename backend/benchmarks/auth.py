@@ -0,0 +1,80 @@
+import json
+import asyncio
+import argparse
+import statistics
+import time
+from datetime import timedelta
+from app.revocation import get_revocation_list
+from app.auth import create_access_token, _decode_token, verify_token, token_cache
+
+# Per-request token verification cost: decoding and checking the JWT signature
+# on every request (the previous behaviour) versus the verified-token cache,
+# with and without revocation checks.
+#
+#   python -m benchmarks.auth [--tokens 1000] [--requests 50000] [--output results.json]
+
+def make_tokens(count: int) -> list:
+    return [
+        create_access_token({"sub": f"BENCH{n:05d}"}, expires_delta=timedelta(minutes=30))
+        for n in range(count)
+    ]
+
+async def per_request_us(verify, tokens: list, requests: int) -> list:
+    # Cycles through the tokens, as many users making requests would
+    samples = []
+    for i in range(requests):
+        token = tokens[i % len(tokens)]
+        started = time.perf_counter()
+        await verify(token)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+async def decode_every_time(token: str):
+    return _decode_token(token)
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_us": round(statistics.fmean(samples), 2),
+        "p50_us": round(samples[len(samples) // 2], 2),
+        "p99_us": round(samples[int(len(samples) * 0.99)], 2),
+    }
+
+async def run(tokens: int, requests: int) -> dict:
+    issued = make_tokens(tokens)
+    results = {"decode_every_request": summarize(await per_request_us(decode_every_time, issued, requests))}
+
+    token_cache.clear()
+    results["token_cache"] = summarize(await per_request_us(verify_token, issued, requests))
+
+    # A populated revocation list: one logged-out token and a password change per 10 users
+    revocation_list = get_revocation_list()
+    if revocation_list is not None:
+        expires = time.time() + 1800
+        for n in range(0, tokens, 10):
+            await revocation_list.revoke_user(f"OTHER{n:05d}", time.time(), expires)
+            await revocation_list.revoke_token(f"logged-out-{n}".encode(), expires)
+        results["token_cache_with_revocations"] = summarize(await per_request_us(verify_token, issued, requests))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Token verification microbenchmark")
+    parser.add_argument("--tokens", type=int, default=1000, help="distinct tokens in rotation")
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--output", help="save results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.tokens, args.requests))
+    baseline = results["decode_every_request"]["mean_us"]
+    print(f"{'path':<32}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'speedup':>9}")
+    for name, r in results.items():
+        print(f"{name:<32}{r['mean_us']:>10.2f}{r['p50_us']:>10.2f}{r['p99_us']:>10.2f}{baseline / r['mean_us']:>8.1f}x")
+    print(f"\ntoken cache: {token_cache.stats()}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"tokens": args.tokens, "requests": args.requests, "results": results}, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import sys
+import json
+import random
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Gemini REST API (generateContent and
+# streamGenerateContent) that injects latency and errors, for exercising the
+# app's timeouts, hedging and circuit breaker without calling Google:
+#
+#   python -m benchmarks.fake_gemini --port 8790 --latency 0.3 --slow-rate 0.05 --slow-latency 8 --error-rate 0.1
+#   GEMINI_API_ENDPOINT=http://127.0.0.1:8790 GEMINI_API_KEY=fake uvicorn app.main:app
+#
+# Faults can be changed while it runs, e.g. to simulate an outage and recovery:
+#
+#   curl -X PUT 127.0.0.1:8790/_faults -d '{"error_rate": 1}'
+
+DEFAULT_FAULTS = {
+    "latency": 0.2,         # seconds before answering (or before the first streamed chunk)
+    "slow_rate": 0.0,       # share of requests that take slow_latency instead
+    "slow_latency": 5.0,
+    "error_rate": 0.0,      # share of requests answered with error_status
+    "error_status": 503,
+    "chunk_delay": 0.02,    # seconds between streamed chunks
+    "reply": "This is a reply from the fake Gemini server.",
+}
+
+_STATUS_NAMES = {400: "INVALID_ARGUMENT", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}
+
+class Faults:
+
+    def __init__(self, **overrides):
+        self._values = {**DEFAULT_FAULTS, **overrides}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def get(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def update(self, changes: dict) -> dict:
+        with self._lock:
+            self._values.update({k: v for k, v in changes.items() if k in DEFAULT_FAULTS})
+            return dict(self._values)
+
+    def draw(self):
+        # (faults, delay, error status or None) for one request
+        faults = self.get()
+        with self._lock:
+            self.requests += 1
+        delay = faults["slow_latency"] if random.random() < faults["slow_rate"] else faults["latency"]
+        status = faults["error_status"] if random.random() < faults["error_rate"] else None
+        return faults, delay, status
+
+def _candidate(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}]}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def faults(self) -> Faults:
+        return self.server.faults
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.startswith("/_faults"):
+            return self._send_json(200, {**self.faults.get(), "requests": self.faults.requests})
+        self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+    def do_PUT(self):
+        if self.path.startswith("/_faults"):
+            return self._send_json(200, self.faults.update(self._read_json()))
+        self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        self._read_json()
+        faults, delay, status = self.faults.draw()
+        time.sleep(delay)
+        if status is not None:
+            return self._send_json(status, {"error": {
+                "code": status, "message": "Injected failure", "status": _STATUS_NAMES.get(status, "UNKNOWN")
+            }})
+
+        if ":streamGenerateContent" in self.path:
+            # The SDK's REST transport reads the stream as one JSON array
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = faults["reply"].split(" ")
+            self._write_chunk(b"[")
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(faults["chunk_delay"])
+                text = word if i == 0 else " " + word
+                self._write_chunk((b"," if i else b"") + json.dumps(_candidate(text)).encode())
+            self._write_chunk(b"]")
+            self._write_chunk(b"")
+            return
+
+        if ":generateContent" in self.path:
+            return self._send_json(200, _candidate(faults["reply"]))
+        self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their deadline hang up before the answer; that is expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class FakeGeminiServer:
+    # Runs the server on a background thread, for scripts that drive it in-process
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **faults):
+        self.httpd = _Server((host, port), Handler)
+        self.httpd.faults = self.faults = Faults(**faults)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini REST server with injected latency and errors")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency", type=float, default=DEFAULT_FAULTS["latency"])
+    parser.add_argument("--slow-rate", type=float, default=DEFAULT_FAULTS["slow_rate"])
+    parser.add_argument("--slow-latency", type=float, default=DEFAULT_FAULTS["slow_latency"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_FAULTS["error_rate"])
+    parser.add_argument("--error-status", type=int, default=DEFAULT_FAULTS["error_status"])
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(
+        args.host, args.port, latency=args.latency, slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency, error_rate=args.error_rate, error_status=args.error_status
+    )
+    print(f"Fake Gemini listening on {server.url}; set GEMINI_API_ENDPOINT={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import time
+import asyncio
+import argparse
+from benchmarks.fake_gemini import DEFAULT_FAULTS, FakeGeminiServer
+from benchmarks.load_test import percentile
+
+# Runs the real Gemini client, wrapped in ResilientLLMClient, against the
+# fault-injecting fake server through a sequence of phases: healthy, a slow
+# tail (where hedging helps), a hang (deadlines fire and the breaker opens),
+# an outage (the trial call fails and the breaker stays open) and recovery
+# (the trial call succeeds and the breaker closes).
+#
+#   python -m benchmarks.llm_resilience [--calls 40] [--concurrency 4] [--timeout 1] [--hedge-percentile 90]
+
+PHASES = [
+    ("healthy", {}),
+    ("slow tail", {"slow_rate": 0.1, "slow_latency": 0.8}),
+    ("hang", {"latency": 3.0}),
+    ("outage", {"error_rate": 1.0}),
+    ("recovery", {}),
+    ("recovered", {}),
+]
+
+async def run_phase(llm, model, server, calls: int, concurrency: int) -> dict:
+    from app.circuit_breaker import CircuitOpen
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, outcomes = [], {}
+    upstream_before = server.faults.requests
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await llm.generate(model, "How do I prepare for exams?")
+                outcome = "ok"
+            except CircuitOpen:
+                outcome = "short_circuit"
+            except TimeoutError:
+                outcome = "timeout"
+            except Exception:
+                outcome = "error"
+            latencies.append(time.perf_counter() - started)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    ordered = sorted(latencies)
+    return {
+        "seconds": round(time.perf_counter() - started, 2),
+        "outcomes": outcomes,
+        "upstream_requests": server.faults.requests - upstream_before,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+        "breaker": llm.breaker.state,
+    }
+
+async def scenario(args):
+    server = FakeGeminiServer(latency=0.1).start()
+    # Read when app.llm is imported
+    os.environ["GEMINI_API_ENDPOINT"] = server.url
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    from app.circuit_breaker import CircuitBreaker
+    from app.llm import GeminiClient, ResilientLLMClient
+
+    llm = ResilientLLMClient(
+        GeminiClient(),
+        timeout=args.timeout,
+        hedge_percentile=args.hedge_percentile,
+        hedge_min_seconds=0.2,
+        hedge_min_samples=10,
+        breaker=CircuitBreaker("bench", args.breaker_failures, args.breaker_reset)
+    )
+    model = await llm.get_model("You are a test advisor.")
+
+    print(f"{'phase':<12}{'seconds':>9}{'upstream':>10}{'p50 ms':>9}{'p99 ms':>9}  {'breaker':<10}outcomes")
+    try:
+        for name, faults in PHASES:
+            server.faults.update({**DEFAULT_FAULTS, "latency": 0.1, **faults})
+            if llm.breaker.state == "open":
+                # Until the breaker lets a trial call through
+                await asyncio.sleep(args.breaker_reset)
+            result = await run_phase(llm, model, server, args.calls, args.concurrency)
+            outcomes = ", ".join(f"{k} {v}" for k, v in sorted(result["outcomes"].items()))
+            print(f"{name:<12}{result['seconds']:>9}{result['upstream_requests']:>10}{result['p50_ms']:>9}"
+                  f"{result['p99_ms']:>9}  {result['breaker']:<10}{outcomes}")
+    finally:
+        server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Timeouts, hedging and circuit breaking against a faulty fake Gemini")
+    parser.add_argument("--calls", type=int, default=40, help="generate calls per phase")
+    # The REST transport runs each call on a thread, so keep this near the executor size
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=1.0, help="per-call deadline in seconds")
+    parser.add_argument("--hedge-percentile", type=float, default=90, help="0 disables hedging")
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    parser.add_argument("--breaker-reset", type=float, default=2.0)
+    asyncio.run(scenario(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
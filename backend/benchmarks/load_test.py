@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from typing import Optional
+import httpx
+
+# Drives N concurrent simulated students through
+#   register -> login -> add subjects -> complete semester -> chat
+# and reports throughput and latency percentiles per route.
+#
+#   python -m benchmarks.load_test --students 50                      # in-process, ASGI transport
+#   python -m benchmarks.load_test --students 50 --target uvicorn     # local uvicorn over real HTTP
+#   python -m benchmarks.load_test --students 50 --url http://127.0.0.1:8000
+#
+# The first two modes run the app against a stand-in database (--mongo memory,
+# or a MongoDB URL) and a fake Gemini client, or the real one pointed at
+# --gemini-endpoint (e.g. benchmarks.fake_gemini); --url benchmarks a server
+# that is already running with whatever it is configured with.
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+PERCENTILES = (50, 95, 99)
+
+def install_database(database):
+    # app.database.db resolves against whichever client is installed
+    from app.database import use_client
+    use_client(database.client, database.name)
+
+def bench_database_name(run_id: str) -> str:
+    # A throwaway database per run, so real collections are never touched
+    return f"advisr_bench_{run_id}"
+
+def make_database(mongo: str, run_id: str):
+    if mongo == "memory":
+        from benchmarks.memory_mongo import MemoryClient
+        return MemoryClient().advisr_db
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.database import client_options
+    return AsyncIOMotorClient(mongo, **client_options())[bench_database_name(run_id)]
+
+async def drop_database(mongo: str, run_id: str):
+    if mongo == "memory":
+        return
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(mongo)
+    try:
+        await client.drop_database(bench_database_name(run_id))
+    finally:
+        client.close()
+
+def build_app(args, run_id: str):
+    if args.bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    if args.gemini_endpoint:
+        os.environ["GEMINI_API_ENDPOINT"] = args.gemini_endpoint
+        os.environ.setdefault("GEMINI_API_KEY", "fake")
+    else:
+        # Gemini is faked, so importing its SDK would only compete with the run for CPU
+        os.environ.setdefault("GEMINI_PRELOAD", "false")
+    if args.mongo == "memory":
+        install_database(make_database(args.mongo, run_id))
+    else:
+        # The app's lifespan opens the client from these, the way a worker does in production
+        os.environ["MONGODB_URL"] = args.mongo
+        os.environ["MONGODB_DATABASE"] = bench_database_name(run_id)
+    from app.main import app
+    from app.llm import FakeLLMClient, ResilientLLMClient, get_llm_client
+    from app.rate_limit import ChatRateLimiter, InMemoryRateLimitBackend, get_chat_rate_limiter
+
+    if not args.gemini_endpoint:
+        # Wrapped like the real client, so deadlines and the breaker are part of the measurement
+        llm = ResilientLLMClient(FakeLLMClient(latency=args.llm_latency))
+        app.dependency_overrides[get_llm_client] = lambda: llm
+    if not args.rate_limits:
+        # Simulated students share a handful of seconds; production limits would reject most chats
+        unlimited = ChatRateLimiter(InMemoryRateLimitBackend(), user_rate_per_minute=0, global_rate_per_minute=0)
+        app.dependency_overrides[get_chat_rate_limiter] = lambda: unlimited
+    return app
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, route: str, seconds: float, ok: bool):
+        self.samples.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, duration: float) -> dict:
+        routes = {}
+        for route, samples in self.samples.items():
+            ordered = sorted(samples)
+            routes[route] = {
+                "count": len(ordered),
+                "errors": self.errors.get(route, 0),
+                "throughput_rps": round(len(ordered) / duration, 2),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                **{f"p{p}_ms": round(percentile(ordered, p) * 1000, 2) for p in PERCENTILES},
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(total / duration, 2),
+            "routes": routes,
+        }
+
+class FlowError(Exception):
+    pass
+
+async def timed(client: httpx.AsyncClient, recorder: Recorder, route: str, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        recorder.add(route, time.perf_counter() - started, False)
+        raise FlowError(f"{route}: {e}")
+    recorder.add(route, time.perf_counter() - started, response.is_success)
+    if not response.is_success:
+        raise FlowError(f"{route}: {response.status_code} {response.text[:200]}")
+    return response
+
+async def student_flow(client: httpx.AsyncClient, recorder: Recorder, run_id: str, index: int, subjects: int):
+    reg_no = f"BENCH{run_id}{index:05d}"
+    password = "benchmark-password"
+    await timed(client, recorder, "POST /register", "POST", "/register", json={
+        "name": f"Benchmark Student {index}",
+        "reg_no": reg_no,
+        "email": f"{reg_no.lower()}@bench.example.com",
+        "password": password,
+    })
+
+    response = await timed(client, recorder, "POST /token", "POST", "/token", data={"username": reg_no, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    grades = {}
+    for n in range(subjects):
+        code = f"BM{n:03d}"
+        await timed(client, recorder, "POST /users/me/subjects", "POST", "/users/me/subjects", headers=headers, json={
+            "name": f"Benchmark Subject {n}", "code": code, "credits": 3 + n % 2
+        })
+        grades[code] = "ABCO"[(index + n) % 4]
+
+    await timed(client, recorder, "POST /users/me/complete-semester", "POST", "/users/me/complete-semester",
+                headers={**headers, "Idempotency-Key": f"{reg_no}-1"}, json=grades)
+
+    await timed(client, recorder, "POST /chat", "POST", "/chat", headers=headers,
+                json={"message": "Which subjects should I focus on next semester?"})
+
+async def run_students(client: httpx.AsyncClient, args, run_id: str) -> dict:
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency or args.students)
+    failures = []
+
+    async def one(index):
+        async with semaphore:
+            try:
+                await student_flow(client, recorder, run_id, index, args.subjects)
+            except FlowError as e:
+                failures.append(str(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.students)))
+    report = recorder.report(time.perf_counter() - started)
+    report["students_completed"] = args.students - len(failures)
+    report["failures"] = failures[:20]
+    return report
+
+async def benchmark(args) -> dict:
+    run_id = datetime.utcnow().strftime("%H%M%S%f")
+    limits = httpx.Limits(max_connections=args.concurrency or args.students)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+            return await run_students(client, args, run_id)
+
+    app = build_app(args, run_id)
+    try:
+        if args.target == "inprocess":
+            transport = httpx.ASGITransport(app=app)
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                    return await run_students(client, args, run_id)
+
+        import uvicorn
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            if serving.done():
+                serving.result()
+            await asyncio.sleep(0.05)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=timeout) as client:
+                return await run_students(client, args, run_id)
+        finally:
+            server.should_exit = True
+            await serving
+    finally:
+        await drop_database(args.mongo, run_id)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(result: dict):
+    summary = result["summary"]
+    print(f"\n{summary['requests']} requests in {summary['duration_s']}s "
+          f"({summary['throughput_rps']} req/s), {summary['errors']} errors, "
+          f"{summary['students_completed']}/{result['config']['students']} students completed")
+    print(f"\n{'route':<34}{'count':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for route, stats in summary["routes"].items():
+        print(f"{route:<34}{stats['count']:>7}{stats['throughput_rps']:>9}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}")
+    for failure in summary["failures"]:
+        print(f"  failed: {failure}")
+
+def print_comparison(result: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {baseline_path} (commit {baseline['meta'].get('commit')}):")
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"{'total throughput':<34}{change(result['summary']['throughput_rps'], baseline['summary']['throughput_rps']):>10}")
+    for route, stats in result["summary"]["routes"].items():
+        old = baseline["summary"]["routes"].get(route)
+        if old:
+            print(f"{route:<34}p95 {change(stats['p95_ms'], old['p95_ms']):>9}   p99 {change(stats['p99_ms'], old['p99_ms']):>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent student-flow benchmark for the Advisr backend")
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=0, help="students in flight at once (default: all)")
+    parser.add_argument("--subjects", type=int, default=6, help="subjects added per student")
+    parser.add_argument("--target", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--url", help="benchmark an already running server instead")
+    parser.add_argument("--port", type=int, default=8765, help="port for --target uvicorn")
+    parser.add_argument("--mongo", default="memory", help="'memory' or a MongoDB URL for a throwaway database")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake Gemini call")
+    parser.add_argument("--gemini-endpoint", help="use the real Gemini client against this endpoint instead")
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS (default: the app's setting)")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the app's chat rate limits")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="JSON results path (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    summary = asyncio.run(benchmark(args))
+    commit = git_commit()
+    result = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "summary": summary,
+    }
+
+    print_report(result)
+    if args.compare:
+        print_comparison(result, args.compare)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{commit or 'nocommit'}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,911 @@
+import math
+import copy
+import re
+from collections import namedtuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError, WriteError
+from pymongo.operations import InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany
+
+# In-process stand-in for the subset of Motor's API the backend uses, for
+# benchmarks and tests; install it with app.database.use_client. Documents
+# are deep-copied on the way in and out, like a BSON round trip, and unique
+# indexes are enforced so duplicate handling behaves as it does against mongod.
+# Equality lookups on _id and on single-field unique indexes are served from a
+# hash map so the store does not dominate benchmark timings as it grows.
+
+InsertOneResult = namedtuple("InsertOneResult", "inserted_id acknowledged")
+InsertManyResult = namedtuple("InsertManyResult", "inserted_ids acknowledged")
+UpdateResult = namedtuple("UpdateResult", "matched_count modified_count upserted_id acknowledged")
+DeleteResult = namedtuple("DeleteResult", "deleted_count acknowledged")
+BulkWriteResult = namedtuple(
+    "BulkWriteResult", "inserted_count matched_count modified_count deleted_count upserted_count acknowledged"
+)
+
+_MISSING = object()
+
+# ---------------------------------------------------------------- field paths
+
+def _get_path(doc, path):
+    # Returns the list of values at a dotted path, descending through arrays
+    values = [doc]
+    for part in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    next_values.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    next_values.append(value[int(part)])
+                else:
+                    for item in value:
+                        if isinstance(item, dict) and part in item:
+                            next_values.append(item[part])
+        values = next_values
+    return values
+
+def _get_single(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+# ---------------------------------------------------------------- matching
+
+def _type_order(value):
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 6
+    if isinstance(value, bool):
+        return 7
+    return 8
+
+def _compare(a, b):
+    ta, tb = _type_order(a), _type_order(b)
+    if ta != tb:
+        return (ta > tb) - (ta < tb)
+    if a is None:
+        return 0
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        return 0
+
+def _candidates(values):
+    # A field matches if the value itself or any element of an array value matches
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+def _match_operator(values, op, arg, doc_values_present):
+    if op == "$eq":
+        return any(c == arg for c in _candidates(values)) or (arg is None and not doc_values_present)
+    if op == "$ne":
+        return not _match_operator(values, "$eq", arg, doc_values_present)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        for c in _candidates(values):
+            if _type_order(c) != _type_order(arg):
+                continue
+            cmp = _compare(c, arg)
+            if (op == "$gt" and cmp > 0) or (op == "$gte" and cmp >= 0) or \
+               (op == "$lt" and cmp < 0) or (op == "$lte" and cmp <= 0):
+                return True
+        return False
+    if op == "$in":
+        return any(_match_operator(values, "$eq", item, doc_values_present) for item in arg)
+    if op == "$nin":
+        return not _match_operator(values, "$in", arg, doc_values_present)
+    if op == "$exists":
+        return doc_values_present == bool(arg)
+    if op == "$size":
+        return any(isinstance(v, list) and len(v) == arg for v in values)
+    if op == "$elemMatch":
+        for value in values:
+            if not isinstance(value, list):
+                continue
+            for item in value:
+                if isinstance(item, dict) and not any(k.startswith("$") for k in arg):
+                    if match(item, arg):
+                        return True
+                elif _match_condition([item], arg, True):
+                    return True
+        return False
+    if op == "$not":
+        return not _match_condition(values, arg, doc_values_present)
+    if op == "$regex":
+        pattern = re.compile(arg) if isinstance(arg, str) else arg
+        return any(isinstance(c, str) and pattern.search(c) for c in _candidates(values))
+    raise NotImplementedError(f"Query operator {op} is not supported by the in-memory store")
+
+def _match_condition(values, condition, present):
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        return all(_match_operator(values, op, arg, present) for op, arg in condition.items() if op != "$options")
+    return _match_operator(values, "$eq", condition, present)
+
+def match(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, doc):
+                return False
+        else:
+            values = _get_path(doc, key)
+            if not _match_condition(values, condition, bool(values)):
+                return False
+    return True
+
+def _positional_index(doc, query, array_path):
+    # Index of the first array element matched by the query, for the "$" operator
+    array = _get_single(doc, array_path)
+    if not isinstance(array, list):
+        return None
+    for key, condition in query.items():
+        if key.startswith(array_path + "."):
+            sub_path = key[len(array_path) + 1:]
+            for i, item in enumerate(array):
+                if _match_condition(_get_path(item, sub_path), condition, bool(_get_path(item, sub_path))):
+                    return i
+        elif key == array_path and isinstance(condition, dict) and "$elemMatch" in condition:
+            for i, item in enumerate(array):
+                if match(item, condition["$elemMatch"]):
+                    return i
+    return None
+
+# ---------------------------------------------------------------- expressions
+
+def evaluate(expr, doc, variables=None):
+    variables = variables or {}
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, _, rest = expr[2:].partition(".")
+        value = variables.get(name)
+        return _get_single(value, rest) if rest else value
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get_single(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, list):
+        return [evaluate(e, doc, variables) for e in expr]
+    if isinstance(expr, dict) and len(expr) == 1:
+        op, arg = next(iter(expr.items()))
+        if op.startswith("$"):
+            return _evaluate_operator(op, arg, doc, variables)
+    if isinstance(expr, dict):
+        return {k: evaluate(v, doc, variables) for k, v in expr.items()}
+    return expr
+
+def _evaluate_operator(op, arg, doc, variables):
+    if op == "$literal":
+        return arg
+    if op == "$filter":
+        # A null or missing input gives null, as in MongoDB
+        items = evaluate(arg["input"], doc, variables)
+        if items is None:
+            return None
+        name = arg.get("as", "this")
+        return [item for item in items if evaluate(arg["cond"], doc, {**variables, name: item})]
+    if op == "$map":
+        items = evaluate(arg["input"], doc, variables)
+        if items is None:
+            return None
+        name = arg.get("as", "this")
+        return [evaluate(arg["in"], doc, {**variables, name: item}) for item in items]
+    values = evaluate(arg, doc, variables) if isinstance(arg, list) else [evaluate(arg, doc, variables)]
+    if op == "$eq":
+        return values[0] == values[1]
+    if op == "$ne":
+        return values[0] != values[1]
+    if op == "$gt":
+        return _compare(values[0], values[1]) > 0
+    if op == "$gte":
+        return _compare(values[0], values[1]) >= 0
+    if op == "$lt":
+        return _compare(values[0], values[1]) < 0
+    if op == "$lte":
+        return _compare(values[0], values[1]) <= 0
+    if op == "$in":
+        return values[0] in values[1]
+    if op == "$and":
+        return all(values)
+    if op == "$or":
+        return any(values)
+    if op == "$add":
+        return sum(v or 0 for v in values)
+    if op == "$subtract":
+        return values[0] - values[1]
+    if op == "$multiply":
+        result = 1
+        for v in values:
+            result *= v
+        return result
+    if op == "$floor":
+        return None if values[0] is None else math.floor(values[0])
+    if op == "$divide":
+        return values[0] / values[1] if values[1] else None
+    if op == "$size":
+        return len(values[0] or [])
+    if op == "$ifNull":
+        return values[0] if values[0] is not None else values[1]
+    if op == "$cond":
+        if isinstance(arg, dict):
+            test, then, otherwise = arg["if"], arg["then"], arg["else"]
+        else:
+            test, then, otherwise = arg
+        return evaluate(then if evaluate(test, doc, variables) else otherwise, doc, variables)
+    if op == "$toString":
+        return str(values[0])
+    if op == "$isArray":
+        return isinstance(values[0], list)
+    raise NotImplementedError(f"Expression operator {op} is not supported by the in-memory store")
+
+# ---------------------------------------------------------------- projection
+
+def project(doc, projection):
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    inclusive = any(not (isinstance(v, (int, bool)) and not v) for v in fields.values())
+
+    if not inclusive:
+        result = copy.deepcopy(doc)
+        for path in fields:
+            _unset(result, path)
+        if not include_id:
+            result.pop("_id", None)
+        return result
+
+    result = {}
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    for path, spec in fields.items():
+        if isinstance(spec, dict) and "$slice" in spec:
+            value = _get_single(doc, path)
+            if isinstance(value, list):
+                n = spec["$slice"]
+                _set(result, path, value[n:] if n < 0 else value[:n])
+        elif isinstance(spec, dict) and "$elemMatch" in spec:
+            value = _get_single(doc, path)
+            if isinstance(value, list):
+                for item in value:
+                    if match(item, spec["$elemMatch"]):
+                        _set(result, path, [item])
+                        break
+        elif isinstance(spec, (dict, str)) and not isinstance(spec, bool):
+            _set(result, path, evaluate(spec, doc))
+        else:
+            value = _get_single(doc, path)
+            if value is not _MISSING:
+                _set(result, path, value)
+    return copy.deepcopy(result)
+
+# ---------------------------------------------------------------- updates
+
+def _set(doc, path, value):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    if isinstance(target, list):
+        index = int(parts[-1])
+        while len(target) <= index:
+            target.append(None)
+        target[index] = value
+    else:
+        target[parts[-1]] = value
+
+def _unset(doc, path):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        target = target.get(part) if isinstance(target, dict) else None
+        if target is None:
+            return
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+
+def _resolve_positional(path, doc, query):
+    if ".$." not in path and not path.endswith(".$"):
+        return path
+    array_path = path.split(".$")[0]
+    index = _positional_index(doc, query, array_path)
+    if index is None:
+        raise WriteError("The positional operator did not find the match needed from the query.", 2)
+    return path.replace(".$", f".{index}", 1)
+
+def apply_update(doc, update, query, inserting=False):
+    if isinstance(update, list):
+        # Aggregation pipeline update: $set/$addFields/$unset stages only
+        for stage in update:
+            (op, spec), = stage.items()
+            if op in ("$set", "$addFields"):
+                evaluated = {path: evaluate(expr, doc) for path, expr in spec.items()}
+                for path, value in evaluated.items():
+                    _set(doc, path, value)
+            elif op == "$unset":
+                for path in ([spec] if isinstance(spec, str) else spec):
+                    _unset(doc, path)
+            else:
+                raise NotImplementedError(f"Pipeline stage {op} is not supported in updates")
+        return
+
+    if not any(key.startswith("$") for key in update):
+        raise ValueError("update only works with $ operators")
+
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            path = _resolve_positional(path, doc, query)
+            current = _get_single(doc, path)
+            if op == "$set":
+                _set(doc, path, copy.deepcopy(arg))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                _set(doc, path, (0 if current is _MISSING else current) + arg)
+            elif op == "$min":
+                if current is _MISSING or _compare(arg, current) < 0:
+                    _set(doc, path, arg)
+            elif op == "$max":
+                if current is _MISSING or _compare(arg, current) > 0:
+                    _set(doc, path, arg)
+            elif op in ("$push", "$addToSet"):
+                array = [] if current is _MISSING else current
+                if isinstance(arg, dict) and "$each" in arg:
+                    items = arg["$each"]
+                else:
+                    items = [arg]
+                for item in copy.deepcopy(items):
+                    if op == "$addToSet" and item in array:
+                        continue
+                    array.append(item)
+                if isinstance(arg, dict) and "$slice" in arg:
+                    n = arg["$slice"]
+                    array = array[n:] if n < 0 else array[:n]
+                _set(doc, path, array)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    if isinstance(arg, dict):
+                        kept = [item for item in current if not (
+                            match(item, arg) if isinstance(item, dict) else _match_condition([item], arg, True)
+                        )]
+                    else:
+                        kept = [item for item in current if item != arg]
+                    _set(doc, path, kept)
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported by the in-memory store")
+
+def _upsert_seed(query):
+    seed = {}
+    for key, value in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(value, dict) and any(k.startswith("$") for k in value):
+            if "$eq" in value:
+                _set(seed, key, value["$eq"])
+            continue
+        _set(seed, key, copy.deepcopy(value))
+    return seed
+
+# ---------------------------------------------------------------- cursor
+
+class MemoryCursor:
+
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction or 1)]
+        self._sort = list(key_or_list)
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def _execute(self):
+        docs = [doc for doc in self._collection._candidates(self._query) if match(doc, self._query)]
+        if self._sort:
+            for key, direction in reversed(self._sort):
+                docs.sort(
+                    key=_SortKey.factory(key),
+                    reverse=direction == -1
+                )
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:abs(self._limit)]
+        return [project(copy.deepcopy(doc) if not self._projection else doc, self._projection) for doc in docs]
+
+    async def to_list(self, length=None):
+        results = self._execute()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        self._results = iter(self._execute())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._results)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def explain(self):
+        # Mirrors the shape verify_indexes.py reads
+        index = self._collection._index_for(self._query, self._sort)
+        stage = {"stage": "IXSCAN", "indexName": index} if index else {"stage": "COLLSCAN"}
+        return {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": stage}}}
+
+class _SortKey:
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return _compare(self.value, other.value) < 0
+
+    @classmethod
+    def factory(cls, key):
+        def extract(doc):
+            value = _get_single(doc, key)
+            return cls(None if value is _MISSING else value)
+        return extract
+
+class MemoryCommandCursor:
+
+    def __init__(self, results):
+        self._results = results
+        self._iter = None
+
+    async def to_list(self, length=None):
+        return self._results if length is None else self._results[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._results)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+# ---------------------------------------------------------------- collection
+
+class MemoryCollection:
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._docs = {}
+        self._unique = {}
+        self._unique_keys = {}
+        # partialFilterExpression of partial unique indexes
+        self._partial = {}
+        self._indexes = {"_id_": [("_id", 1)]}
+
+    # -- indexes
+
+    def _index_key(self, fields, doc):
+        key = []
+        for field, _ in fields:
+            value = _get_single(doc, field)
+            key.append(repr(None if value is _MISSING else value))
+        return tuple(key)
+
+    def _indexed(self, name, doc):
+        # A partial index only covers documents matching its filter
+        return name not in self._partial or match(doc, self._partial[name])
+
+    def _check_unique(self, doc, ignore_id=None):
+        for name, fields in self._unique.items():
+            if not self._indexed(name, doc):
+                continue
+            owner = self._unique_keys[name].get(self._index_key(fields, doc))
+            if owner is not None and owner != ignore_id:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {name}", 11000
+                )
+
+    def _store(self, doc, previous=None):
+        if previous is not None:
+            self._forget(previous)
+        self._docs[doc["_id"]] = doc
+        for name, fields in self._unique.items():
+            if self._indexed(name, doc):
+                self._unique_keys[name][self._index_key(fields, doc)] = doc["_id"]
+
+    def _forget(self, doc):
+        for name, fields in self._unique.items():
+            key = self._index_key(fields, doc)
+            if self._unique_keys[name].get(key) == doc["_id"]:
+                del self._unique_keys[name][key]
+
+    def _candidates(self, query):
+        # Documents that can match the query, narrowed by an _id or unique-key equality
+        query = query or {}
+        if "_id" in query and not isinstance(query["_id"], dict):
+            doc = self._docs.get(query["_id"])
+            return [doc] if doc is not None else []
+        for name, fields in self._unique.items():
+            field = fields[0][0]
+            if len(fields) == 1 and name not in self._partial and field in query and not isinstance(query[field], (dict, list)):
+                doc_id = self._unique_keys[name].get((repr(query[field]),))
+                return [self._docs[doc_id]] if doc_id is not None else []
+        return list(self._docs.values())
+
+    async def create_index(self, keys, unique=False, name=None, partialFilterExpression=None, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        keys = list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self._indexes[name] = keys
+        if unique and name not in self._unique:
+            self._unique[name] = keys
+            self._unique_keys[name] = {}
+            if partialFilterExpression:
+                self._partial[name] = partialFilterExpression
+            for doc in self._docs.values():
+                if self._indexed(name, doc):
+                    self._check_unique(doc, ignore_id=doc["_id"])
+                    self._unique_keys[name][self._index_key(keys, doc)] = doc["_id"]
+        return name
+
+    async def create_indexes(self, indexes, **kwargs):
+        names = []
+        for index in indexes:
+            document = index.document
+            names.append(await self.create_index(
+                list(document["key"].items()), unique=document.get("unique", False), name=document.get("name"),
+                partialFilterExpression=document.get("partialFilterExpression")
+            ))
+        return names
+
+    async def index_information(self):
+        return {name: {"key": keys} for name, keys in self._indexes.items()}
+
+    def _index_for(self, query, sort):
+        fields = [k for k in query if not k.startswith("$")]
+        if "$or" in query:
+            branches = [self._index_for(branch, None) for branch in query["$or"]]
+            return branches[0] if branches and all(branches) else None
+        for name, keys in self._indexes.items():
+            if keys[0][0] in fields:
+                return name
+        return None
+
+    # -- reads
+
+    async def find_one(self, filter=None, projection=None, *args, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        results = await MemoryCursor(self, filter, projection).limit(1).to_list(1)
+        return results[0] if results else None
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        cursor = MemoryCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def count_documents(self, filter, **kwargs):
+        return sum(1 for doc in self._candidates(filter) if match(doc, filter))
+
+    async def estimated_document_count(self, **kwargs):
+        return len(self._docs)
+
+    # -- writes
+
+    async def insert_one(self, document, *args, **kwargs):
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        stored = copy.deepcopy(document)
+        if stored["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        self._check_unique(stored)
+        self._store(stored)
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        ids = []
+        for document in documents:
+            ids.append((await self.insert_one(document)).inserted_id)
+        return InsertManyResult(ids, True)
+
+    def _write_one(self, filter, update, upsert, replace=False):
+        for doc in self._candidates(filter):
+            if match(doc, filter):
+                doc_id = doc["_id"]
+                updated = copy.deepcopy(doc)
+                if replace:
+                    updated = {"_id": doc_id, **copy.deepcopy(update)}
+                else:
+                    apply_update(updated, update, filter)
+                self._check_unique(updated, ignore_id=doc_id)
+                modified = updated != doc
+                self._store(updated, previous=doc)
+                return UpdateResult(1, int(modified), None, True), doc, updated
+        if upsert:
+            seed = _upsert_seed(filter)
+            if replace:
+                seed.update(copy.deepcopy(update))
+            else:
+                apply_update(seed, update, filter, inserting=True)
+            seed.setdefault("_id", ObjectId())
+            if seed["_id"] in self._docs:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+            self._check_unique(seed)
+            self._store(seed)
+            return UpdateResult(0, 0, seed["_id"], True), None, seed
+        return UpdateResult(0, 0, None, True), None, None
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        return self._write_one(filter, update, upsert)[0]
+
+    async def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        return self._write_one(filter, replacement, upsert, replace=True)[0]
+
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        matched = modified = 0
+        for doc in self._candidates(filter):
+            if match(doc, filter):
+                updated = copy.deepcopy(doc)
+                apply_update(updated, update, filter)
+                self._check_unique(updated, ignore_id=doc["_id"])
+                matched += 1
+                modified += int(updated != doc)
+                self._store(updated, previous=doc)
+        if not matched and upsert:
+            return (await self.update_one(filter, update, upsert=True))
+        return UpdateResult(matched, modified, None, True)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None,
+                                  upsert=False, return_document=ReturnDocument.BEFORE, **kwargs):
+        if sort:
+            candidates = await self.find(filter, sort=sort).limit(1).to_list(1)
+            if candidates:
+                filter = {"_id": candidates[0]["_id"]}
+        _, before, after = self._write_one(filter, update, upsert)
+        result = after if return_document == ReturnDocument.AFTER else before
+        return project(copy.deepcopy(result), projection) if result is not None else None
+
+    async def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        doc = await self.find_one(filter) if not sort else next(iter(await self.find(filter, sort=sort).limit(1).to_list(1)), None)
+        if doc is None:
+            return None
+        self._forget(self._docs.pop(doc["_id"]))
+        return project(doc, projection)
+
+    async def delete_one(self, filter, **kwargs):
+        for doc in self._candidates(filter):
+            if match(doc, filter):
+                self._forget(self._docs.pop(doc["_id"]))
+                return DeleteResult(1, True)
+        return DeleteResult(0, True)
+
+    async def delete_many(self, filter, **kwargs):
+        doomed = [doc["_id"] for doc in self._candidates(filter) if match(doc, filter)]
+        for doc_id in doomed:
+            self._forget(self._docs.pop(doc_id))
+        return DeleteResult(len(doomed), True)
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        counts = dict(inserted_count=0, matched_count=0, modified_count=0, deleted_count=0, upserted_count=0)
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    await self.insert_one(request._doc)
+                    counts["inserted_count"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    method = {
+                        UpdateOne: self.update_one, UpdateMany: self.update_many, ReplaceOne: self.replace_one
+                    }[type(request)]
+                    result = await method(request._filter, request._doc, upsert=bool(request._upsert))
+                    counts["matched_count"] += result.matched_count
+                    counts["modified_count"] += result.modified_count
+                    counts["upserted_count"] += int(result.upserted_id is not None)
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    method = self.delete_one if isinstance(request, DeleteOne) else self.delete_many
+                    counts["deleted_count"] += (await method(request._filter)).deleted_count
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": counts["inserted_count"]})
+        return BulkWriteResult(acknowledged=True, **counts)
+
+    # -- aggregation
+
+    def aggregate(self, pipeline, **kwargs):
+        docs = [copy.deepcopy(doc) for doc in self._docs.values()]
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$lookup":
+                docs = _stage_lookup(docs, spec, self.database)
+            else:
+                docs = _AGGREGATION_STAGES[op](docs, spec)
+        return MemoryCommandCursor(docs)
+
+# ---------------------------------------------------------------- aggregation
+
+def _stage_match(docs, spec):
+    return [doc for doc in docs if match(doc, spec)]
+
+def _stage_project(docs, spec):
+    return [project(doc, spec) for doc in docs]
+
+def _stage_add_fields(docs, spec):
+    for doc in docs:
+        for path, expr in spec.items():
+            _set(doc, path, evaluate(expr, doc))
+    return docs
+
+def _stage_unwind(docs, spec):
+    path = (spec if isinstance(spec, str) else spec["path"])[1:]
+    out = []
+    for doc in docs:
+        values = _get_single(doc, path)
+        if not isinstance(values, list):
+            continue
+        for value in values:
+            unwound = copy.deepcopy(doc)
+            _set(unwound, path, value)
+            out.append(unwound)
+    return out
+
+def _stage_group(docs, spec):
+    groups = {}
+    order = []
+    for doc in docs:
+        key = evaluate(spec["_id"], doc)
+        marker = repr(key)
+        if marker not in groups:
+            groups[marker] = {"_id": key}
+            order.append(marker)
+        group = groups[marker]
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expr), = accumulator.items()
+            value = evaluate(expr, doc)
+            if op == "$sum":
+                group[field] = group.get(field, 0) + (value or 0)
+            elif op == "$push":
+                group.setdefault(field, []).append(value)
+            elif op == "$addToSet":
+                bucket = group.setdefault(field, [])
+                if value not in bucket:
+                    bucket.append(value)
+            elif op == "$max":
+                group[field] = value if field not in group else max(group[field], value)
+            elif op == "$min":
+                group[field] = value if field not in group else min(group[field], value)
+            elif op == "$first":
+                group.setdefault(field, value)
+            elif op == "$last":
+                group[field] = value
+            else:
+                raise NotImplementedError(f"Accumulator {op} is not supported by the in-memory store")
+    return [groups[marker] for marker in order]
+
+def _stage_sort(docs, spec):
+    for key, direction in reversed(list(spec.items())):
+        docs.sort(key=_SortKey.factory(key), reverse=direction == -1)
+    return docs
+
+def _stage_limit(docs, spec):
+    return docs[:spec]
+
+def _stage_lookup(docs, spec, database):
+    # Equality form only: localField / foreignField
+    joined = {}
+    for other in database[spec["from"]]._docs.values():
+        joined.setdefault(_get_single(other, spec["foreignField"]), []).append(other)
+    for doc in docs:
+        matches = joined.get(_get_single(doc, spec["localField"]), [])
+        doc[spec["as"]] = [copy.deepcopy(other) for other in matches]
+    return docs
+
+_AGGREGATION_STAGES = {
+    "$match": _stage_match,
+    "$project": _stage_project,
+    "$addFields": _stage_add_fields,
+    "$set": _stage_add_fields,
+    "$unwind": _stage_unwind,
+    "$group": _stage_group,
+    "$sort": _stage_sort,
+    "$limit": _stage_limit,
+}
+
+# ---------------------------------------------------------------- database / client
+
+class MemoryDatabase:
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+    async def command(self, command, *args, **kwargs):
+        if command == "ping" or (isinstance(command, dict) and "ping" in command):
+            return {"ok": 1}
+        raise NotImplementedError(f"Command {command} is not supported by the in-memory store")
+
+class MemoryClient:
+
+    def __init__(self, *args, **kwargs):
+        self._databases = {}
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def close(self):
+        pass
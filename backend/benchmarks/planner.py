@@ -0,0 +1,84 @@
+import json
+import time
+import argparse
+import itertools
+import statistics
+from app.gpa import GRADE_POINTS, apply_subjects, calculate_cgpa
+from app.planner import PASSING_GRADES, plan_grades
+
+# What-if planner cost against the number of ungraded subjects: the search
+# over credit-weighted point totals in app/planner.py, and enumerating every
+# grade combination (6^n) for as many subjects as that stays bearable.
+#
+#   python -m benchmarks.planner [--max-subjects 14] [--naive-limit 8] [--target 8.5]
+
+def make_totals() -> dict:
+    history = [
+        {"code": f"OLD{n:02d}", "credits": 3 + n % 2, "grade": ["A", "B+", "A+", "B", "O"][n % 5]}
+        for n in range(30)
+    ]
+    return apply_subjects({"credits": 0, "points": 0, "subjects": {}}, history)
+
+def make_subjects(count: int) -> list:
+    return [{"name": f"Subject {n}", "code": f"SUB{n:02d}", "credits": 2 + n % 3, "grade": None} for n in range(count)]
+
+def naive_plan(totals: dict, subjects: list, target: float):
+    # Lowest point total over every combination that meets the target
+    best = None
+    for combo in itertools.product(PASSING_GRADES, repeat=len(subjects)):
+        points = sum(GRADE_POINTS[grade] * sub["credits"] for sub, grade in zip(subjects, combo))
+        if best is not None and points >= best[0]:
+            continue
+        graded = [{**sub, "grade": grade} for sub, grade in zip(subjects, combo)]
+        if (calculate_cgpa(apply_subjects(totals, graded)) or 0) >= target:
+            best = (points, combo)
+    return best
+
+def median_ms(func, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e3)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="What-if GPA planner benchmark")
+    parser.add_argument("--max-subjects", type=int, default=14)
+    parser.add_argument("--naive-limit", type=int, default=8, help="largest subject count to enumerate naively")
+    parser.add_argument("--target", type=float, default=8.5)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--output", help="save results as JSON")
+    args = parser.parse_args()
+
+    totals = make_totals()
+    results = []
+    print(f"{'subjects':>9}{'combinations':>14}{'planner ms':>12}{'naive ms':>11}")
+    for count in range(1, args.max_subjects + 1):
+        subjects = make_subjects(count)
+        plan = plan_grades(totals, subjects, args.target)
+        result = {
+            "subjects": count,
+            "combinations": len(PASSING_GRADES) ** count,
+            "planner_ms": round(median_ms(lambda: plan_grades(totals, subjects, args.target), args.repeats), 3),
+            "naive_ms": None,
+        }
+        if count <= args.naive_limit:
+            result["naive_ms"] = round(median_ms(lambda: naive_plan(totals, subjects, args.target), 1), 1)
+            best = naive_plan(totals, subjects, args.target)
+            # Both searches must agree on the least total
+            assert plan["achievable"] == (best is not None)
+            if best is not None:
+                grades = plan["plans"][0]["grades"]
+                assert sum(GRADE_POINTS[grades[sub["code"]]] * sub["credits"] for sub in subjects) == best[0]
+        results.append(result)
+        naive = result["naive_ms"] if result["naive_ms"] is not None else "-"
+        print(f"{count:>9}{result['combinations']:>14}{result['planner_ms']:>12}{naive:>11}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
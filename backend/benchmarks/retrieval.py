@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from app.vector_index import HashingEmbedder, VectorIndex, build_index
+from app.chat_history import estimate_tokens
+from app.retrieval import format_resources
+
+# Resource retrieval cost against catalog size: embedding one chat message and
+# a top-k cosine search over a memory-mapped index built from a synthetic
+# catalog, plus the tokens the retrieved snippets add to a prompt.
+#
+#   python -m benchmarks.retrieval [--sizes 1000,10000,100000] [--top-k 3] [--output results.json]
+
+WORDS = (
+    "algorithm array graph tree heap hashing sorting database sql normalization transaction index "
+    "process thread scheduling deadlock memory paging network routing tcp protocol compiler parsing "
+    "automata grammar machine learning regression classification neural probability statistics "
+    "matrix eigenvalue calculus python java pointer recursion dynamic programming greedy"
+).split()
+QUERIES = [
+    "I failed data structures, how do I clear it?",
+    "best resources for dbms normalization",
+    "help me prepare for operating systems deadlock questions",
+    "I want to learn machine learning",
+]
+
+def synthetic_catalog(size: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"doc-{n}",
+            "title": " ".join(rng.sample(WORDS, 3)).title(),
+            "provider": "Synthetic",
+            "topics": " ".join(rng.sample(WORDS, 6)),
+            "description": " ".join(rng.choices(WORDS, k=40)),
+        }
+        for n in range(size)
+    ]
+
+def median_us(func, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Resource index retrieval benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="catalog sizes, comma separated")
+    parser.add_argument("--dimensions", type=int, default=2048)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--output", help="save results as JSON")
+    args = parser.parse_args()
+
+    embedder = HashingEmbedder(args.dimensions)
+    results = []
+    print(f"{'documents':>10}{'index MB':>10}{'build s':>9}{'embed us':>10}{'search us':>11}{'snippet tokens':>16}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            catalog = synthetic_catalog(size)
+            started = time.perf_counter()
+            build_index(catalog, directory, embedder)
+            build_seconds = time.perf_counter() - started
+            index = VectorIndex(directory)
+
+            vectors = embedder.embed(QUERIES)
+            embed_us = median_us(lambda: embedder.embed(QUERIES[:1]), args.repeats)
+            search_us = median_us(lambda: index.search(vectors[:1], args.top_k), args.repeats)
+            rows, _ = index.search(vectors, args.top_k)
+            snippet_tokens = statistics.mean(
+                estimate_tokens(format_resources([index.documents[i] for i in row])) for row in rows
+            )
+            result = {
+                "documents": size,
+                "index_mb": round(os.path.getsize(os.path.join(directory, "embeddings.npy")) / 2**20, 1),
+                "build_s": round(build_seconds, 2),
+                "embed_us": round(embed_us, 1),
+                "search_us": round(search_us, 1),
+                "snippet_tokens": round(snippet_tokens, 1),
+            }
+            del index
+        results.append(result)
+        print(f"{size:>10}{result['index_mb']:>10}{result['build_s']:>9}{result['embed_us']:>10}"
+              f"{result['search_us']:>11}{result['snippet_tokens']:>16}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
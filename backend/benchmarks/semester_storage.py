@@ -0,0 +1,136 @@
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import bson
+from bson import ObjectId
+from benchmarks.load_test import install_database, make_database
+from app import semesters as semester_store
+from app.auth import CURRENT_SEMESTER_ONLY
+
+# Read and update cost of the embedded and split semester layouts as a
+# student's history grows: the queries behind GET /users/me/subjects,
+# GET /users/me/history and POST /users/me/subjects, plus the size of the
+# student document each one has to load.
+#
+#   python -m benchmarks.semester_storage [--mongo memory|mongodb://...] [--max-semesters 16] [--subjects 8]
+#
+# Against a real MongoDB the numbers include document fetch and BSON decoding;
+# the in-memory store only approximates them.
+
+GRADES = ["O", "A+", "A", "B+", "B", "C", "F"]
+
+def make_semesters(count: int, subjects: int) -> list:
+    return [
+        {
+            "semester_number": n,
+            "subjects": [
+                {"name": f"Subject {n}.{s}", "code": f"SUB{n:02d}{s:02d}", "credits": 3 + s % 2,
+                 "grade": GRADES[(n + s) % 7] if n < count else None}
+                for s in range(subjects)
+            ],
+            "sgpa": 7.9 if n < count else None,
+        }
+        for n in range(1, count + 1)
+    ]
+
+async def seed(database, layout: str, semesters: int, subjects: int) -> ObjectId:
+    student_id = ObjectId()
+    history = make_semesters(semesters, subjects)
+    student = {
+        "_id": student_id, "name": "Benchmark Student", "reg_no": f"BENCH-{student_id}",
+        "email": f"{student_id}@example.com", "current_semester": semesters, "batch": "2024",
+        "cgpa": 7.9, "last_sgpa": 7.9, "gpa_totals": {"points": 0, "credits": 0}, "version": 1,
+        "hashed_password": "x" * 60,
+    }
+    if layout == "embedded":
+        student["semesters"] = history
+    elif history:
+        await database.semesters.insert_many(semester_store.semester_documents(student_id, history))
+    await database.students.insert_one(student)
+    return student_id
+
+async def timed(operation, repeats: int) -> float:
+    # Median microseconds per call
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await operation()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+async def measure(database, layout: str, semesters: int, subjects: int, repeats: int) -> dict:
+    semester_store.SPLIT_STORAGE = layout == "split"
+    student_id = await seed(database, layout, semesters, subjects)
+
+    async def current_semester():
+        student = await database.students.find_one(
+            {"_id": student_id}, {"current_semester": 1, "version": 1, "semesters": CURRENT_SEMESTER_ONLY}
+        )
+        return await semester_store.get_semester(student, student["current_semester"])
+
+    async def history():
+        student = await database.students.find_one({"_id": student_id}, {"semesters": 1, "version": 1})
+        return await semester_store.get_history(student)
+
+    added = 0
+
+    async def add_subject():
+        nonlocal added
+        added += 1
+        student = await database.students.find_one(
+            {"_id": student_id},
+            {"current_semester": 1, "last_sgpa": 1, "gpa_totals": 1, "semesters": CURRENT_SEMESTER_ONLY}
+        )
+        subject = {"name": "Elective", "code": f"EL{added:04d}", "credits": 3, "grade": None}
+        await semester_store.add_subject(student, student["current_semester"], subject, None, {"cgpa": 7.9})
+
+    stored = await database.students.find_one({"_id": student_id})
+    result = {
+        "layout": layout,
+        "semesters": semesters,
+        "student_bytes": len(bson.encode(stored)),
+        "current_semester_us": round(await timed(current_semester, repeats), 1),
+        "history_us": round(await timed(history, repeats), 1),
+        "add_subject_us": round(await timed(add_subject, repeats), 1),
+    }
+    assert len(await history()) == semesters
+    return result
+
+async def run(args) -> list:
+    database = make_database(args.mongo, f"semesters_{int(time.time())}")
+    install_database(database)
+    await database.semesters.create_index([("student_id", 1), ("semester_number", 1)], unique=True)
+    results = []
+    try:
+        for semesters in range(1, args.max_semesters + 1):
+            for layout in ("embedded", "split"):
+                results.append(await measure(database, layout, semesters, args.subjects, args.repeats))
+    finally:
+        if args.mongo != "memory":
+            await database.client.drop_database(database.name)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded vs split semester storage benchmark")
+    parser.add_argument("--mongo", default="memory", help="'memory' or a MongoDB URL for a throwaway database")
+    parser.add_argument("--max-semesters", type=int, default=16)
+    parser.add_argument("--subjects", type=int, default=8, help="subjects per semester")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--output", help="save results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'layout':<10}{'semesters':>10}{'doc bytes':>11}{'current us':>12}{'history us':>12}{'add us':>10}")
+    for r in results:
+        print(f"{r['layout']:<10}{r['semesters']:>10}{r['student_bytes']:>11}"
+              f"{r['current_semester_us']:>12}{r['history_us']:>12}{r['add_subject_us']:>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import json
+import timeit
+import argparse
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from app.models import StudentResponse, Semester
+from app.serialization import dumps, student_payload
+from pydantic import TypeAdapter
+
+# Serialization cost of /users/me and /users/me/history against history size:
+# the previous path (pydantic validation + jsonable_encoder + json.dumps, as
+# FastAPI does with a response_model) versus the trusted orjson path.
+#
+#   python -m benchmarks.serialization [--subjects 8] [--max-semesters 12] [--output results.json]
+
+GRADES = ["O", "A+", "A", "B+", "B", "C", "F"]
+_semesters_adapter = TypeAdapter(list[Semester])
+
+def make_student(semesters: int, subjects: int) -> dict:
+    _id = ObjectId()
+    return {
+        "_id": _id,
+        "id": str(_id),
+        "name": "Benchmark Student",
+        "reg_no": "BENCH00001",
+        "email": "bench@example.com",
+        "current_semester": semesters + 1,
+        "batch": "2024",
+        "cgpa": 8.12,
+        "last_sgpa": 8.4,
+        "semesters": [
+            {
+                "semester_number": n,
+                "subjects": [
+                    {"name": f"Subject {n}.{s}", "code": f"SUB{n:02d}{s:02d}", "credits": 3 + s % 2, "grade": GRADES[(n + s) % 7]}
+                    for s in range(subjects)
+                ],
+                "sgpa": 7.9,
+            }
+            for n in range(1, semesters + 1)
+        ],
+    }
+
+def _json_render(content) -> bytes:
+    # starlette.responses.JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def validated_profile(student: dict) -> bytes:
+    model = StudentResponse.model_validate(student)
+    return _json_render(jsonable_encoder(model.model_dump(by_alias=True)))
+
+def validated_history(student: dict) -> bytes:
+    semesters = _semesters_adapter.validate_python(student["semesters"])
+    return _json_render(jsonable_encoder([s.model_dump() for s in semesters]))
+
+def fast_profile(student: dict) -> bytes:
+    return dumps(student_payload(student))
+
+def fast_history(student: dict) -> bytes:
+    return dumps(student["semesters"])
+
+CASES = [
+    ("/users/me", validated_profile, fast_profile),
+    ("/users/me/history", validated_history, fast_history),
+]
+
+def measure(func, student: dict) -> float:
+    # Microseconds per call, best of 3 repeats of at least 0.2s each
+    timer = timeit.Timer(lambda: func(student))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization microbenchmark")
+    parser.add_argument("--subjects", type=int, default=8, help="subjects per semester")
+    parser.add_argument("--max-semesters", type=int, default=12)
+    parser.add_argument("--output", help="save results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'route':<20}{'semesters':>10}{'bytes':>8}{'validated us':>14}{'fast us':>10}{'speedup':>9}")
+    for route, validated, fast in CASES:
+        for semesters in range(1, args.max_semesters + 1):
+            student = make_student(semesters, args.subjects)
+            # Both paths must produce the same JSON
+            assert json.loads(validated(student)) == json.loads(fast(student)), route
+            slow_us = measure(validated, student)
+            fast_us = measure(fast, student)
+            size = len(fast(student))
+            results.append({
+                "route": route, "semesters": semesters, "subjects": args.subjects, "bytes": size,
+                "validated_us": round(slow_us, 2), "fast_us": round(fast_us, 2), "speedup": round(slow_us / fast_us, 2)
+            })
+            print(f"{route:<20}{semesters:>10}{size:>8}{slow_us:>14.1f}{fast_us:>10.1f}{slow_us / fast_us:>8.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Cold-start check for the container: imports app.main in fresh interpreters
+# with -X importtime, reports the slowest modules and exits non-zero when the
+# median import time exceeds the budget.
+#
+#   python -m benchmarks.startup [--runs 5] [--budget-ms 1200] [--top 15] [--output startup.json]
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 1200))
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_line = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def import_profile() -> dict:
+    # One cold import of app.main: {module: (self_us, cumulative_us, depth)} plus process wall time
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    code = "import time; t = time.perf_counter(); import app.main; print((time.perf_counter() - t) * 1000)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _line.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return {"import_ms": float(result.stdout.strip().splitlines()[-1]), "modules": modules}
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import time check")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--output", help="save per-module timings as JSON")
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    import_ms = statistics.median(p["import_ms"] for p in profiles)
+
+    # Median cumulative time per module across runs
+    names = set().union(*(p["modules"] for p in profiles))
+    modules = {}
+    for name in names:
+        samples = [p["modules"][name] for p in profiles if name in p["modules"]]
+        modules[name] = {
+            "self_ms": round(statistics.median(s[0] for s in samples) / 1000, 2),
+            "cumulative_ms": round(statistics.median(s[1] for s in samples) / 1000, 2),
+            "depth": samples[0][2],
+        }
+
+    # Direct imports of app modules and third-party packages; the tree below them is in --output
+    shallow = [(name, m) for name, m in modules.items() if m["depth"] <= 1]
+    shallow.sort(key=lambda item: item[1]["cumulative_ms"], reverse=True)
+    print(f"{'module':<40}{'cumulative ms':>15}{'self ms':>10}")
+    for name, m in shallow[:args.top]:
+        print(f"{'  ' * m['depth'] + name:<40}{m['cumulative_ms']:>15}{m['self_ms']:>10}")
+
+    print(f"\nimport app.main: median {import_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"import_ms": import_ms, "budget_ms": args.budget_ms, "modules": modules}, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if import_ms > args.budget_ms:
+        print("Cold start is over budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import time
+from app.retrieval import RAG_INDEX_DIR, RAG_EMBEDDER, RAG_DIMENSIONS
+from app.vector_index import build_index, load_embedder, VectorIndex
+
+# Builds the chat resource index from a JSON Lines catalog, fully offline.
+# One entry per line: id, title, provider, url (optional), topics, description.
+#
+#   python build_rag_index.py [data/resource_catalog.jsonl] [--out data/rag_index] [--embedder hashing]
+#   python build_rag_index.py --query "how do I prepare for DBMS"
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "resource_catalog.jsonl")
+
+def read_catalog(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for row, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            missing = [field for field in ("id", "title", "description") if not entry.get(field)]
+            if missing:
+                raise SystemExit(f"{path}:{row}: missing {', '.join(missing)}")
+            entries.append(entry)
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the chat resource index")
+    parser.add_argument("catalog", nargs="?", default=CATALOG_PATH)
+    parser.add_argument("--out", default=RAG_INDEX_DIR)
+    parser.add_argument("--embedder", default=RAG_EMBEDDER, help="'hashing' or package.module:factory")
+    parser.add_argument("--dimensions", type=int, default=RAG_DIMENSIONS, help="for the hashing embedder")
+    parser.add_argument("--query", action="append", help="search the built index (repeatable)")
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    embedder = load_embedder(args.embedder, args.dimensions)
+    if not args.query:
+        entries = read_catalog(args.catalog)
+        started = time.perf_counter()
+        manifest = build_index(entries, args.out, embedder)
+        print(f"Indexed {manifest['documents']} entries with {manifest['embedder']} in {time.perf_counter() - started:.2f}s -> {args.out}")
+        return
+
+    index = VectorIndex(args.out)
+    indices, scores = index.search(embedder.embed(args.query), args.top_k)
+    for query, rows, row_scores in zip(args.query, indices, scores):
+        print(query)
+        for i, score in zip(rows, row_scores):
+            print(f"  {score:.3f}  {index.documents[i]['title']}")
+
+if __name__ == "__main__":
+    main()
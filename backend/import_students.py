@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import json
+from app.importer import ndjson_records, csv_records, import_students, IMPORT_BATCH_SIZE
+
+# Imports a cohort straight into MONGODB_URL, same format as POST /admin/import
+
+async def read_lines(path):
+    # Line endings are kept for the CSV reader, as iter_lines does
+    with open(path, encoding="utf-8", newline="") as f:
+        for line in f:
+            yield line
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bulk import students from CSV or NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    lines = read_lines(args.path)
+    records = ndjson_records(lines) if file_format == "ndjson" else csv_records(lines)
+    report = await import_students(records, batch_size=args.batch_size)
+
+    for error in report["errors"]:
+        print(f"row {error['row']} ({error['reg_no']}): {error['error']}")
+    print(json.dumps({k: v for k, v in report.items() if k != "errors"}))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,27 @@
+import argparse
+import asyncio
+import json
+from app.semesters import migrate_semesters, MIGRATION_BATCH_SIZE
+
+# Moves students between the embedded and split semester layouts in MONGODB_URL.
+# Interrupted runs resume from the last finished batch; --restart rescans everything.
+#
+# To split: deploy with SEMESTER_STORAGE=split, then run --to split.
+# To go back: run --to embedded with writes paused, then deploy with
+# SEMESTER_STORAGE=embedded.
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrate student semesters between storage layouts")
+    parser.add_argument("--to", dest="target", choices=["split", "embedded"], required=True)
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    def progress(report):
+        print(f"scanned {report['scanned']}, moved {report['moved']}", flush=True)
+
+    report = await migrate_semesters(args.target, batch_size=args.batch_size, restart=args.restart, progress=progress)
+    print(json.dumps(report))
+
+if __name__ == "__main__":
+    asyncio.run(main())
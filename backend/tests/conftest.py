@@ -0,0 +1,102 @@
+import os
+import sys
+import httpx
+import pytest
+
+# Tests run from backend/ or the repository root, against mongomock-motor
+# and fake Gemini clients; nothing leaves the process
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("GEMINI_PRELOAD", "false")
+os.environ.setdefault("JOB_WORKERS", "0")
+
+from app import semesters as semester_store  # noqa: E402
+from app.auth import principal_cache  # noqa: E402
+from app.database import use_client, db, ensure_indexes  # noqa: E402
+from app.main import app  # noqa: E402
+from mongomock.aggregate import _Parser  # noqa: E402
+from mongomock.collection import BulkOperationBuilder, Collection  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+def _without_sort(add):
+    # pymongo 4.11+ passes sort= to bulk update/replace operations; mongomock predates it
+    def wrapper(self, *args, sort=None, **kwargs):
+        return add(self, *args, **kwargs)
+    return wrapper
+
+BulkOperationBuilder.add_update = _without_sort(BulkOperationBuilder.add_update)
+BulkOperationBuilder.add_replace = _without_sort(BulkOperationBuilder.add_replace)
+
+_copy_only_fields = Collection._copy_only_fields
+
+def _copy_with_expressions(self, doc, fields, container):
+    # find() projections may use aggregation expressions (MongoDB 4.4+), e.g.
+    # auth.CURRENT_SEMESTER_ONLY; mongomock only evaluates them in aggregate()
+    expressions = {
+        field: value for field, value in (fields or {}).items()
+        if isinstance(value, dict) and not set(value) <= {"$elemMatch", "$slice"}
+    }
+    if not expressions:
+        return _copy_only_fields(self, doc, fields, container)
+    projected = _copy_only_fields(self, doc, {**fields, **{field: 1 for field in expressions}}, container)
+    for field, expression in expressions.items():
+        try:
+            projected[field] = _Parser(doc, ignore_missing_keys=True).parse(expression)
+        except KeyError:
+            # MongoDB evaluates expressions over missing fields to null
+            projected[field] = None
+    return projected
+
+Collection._copy_only_fields = _copy_with_expressions
+
+_update = Collection._update
+
+def _update_positional(self, spec, document, *args, **kwargs):
+    # mongomock resolves "array.$" only from an $elemMatch in the filter; MongoDB
+    # also takes a dotted condition such as {"semesters.semester_number": 2}
+    positional = {
+        path.split(".$", 1)[0] for fields in document.values() if isinstance(fields, dict) for path in fields if ".$" in path
+    }
+    for key in list(spec):
+        array, _, field = key.partition(".")
+        if field and array in positional and array not in spec:
+            condition = spec[key]
+            spec = {k: v for k, v in spec.items() if k != key}
+            spec[array] = {"$elemMatch": {field: condition}}
+    return _update(self, spec, document, *args, **kwargs)
+
+Collection._update = _update_positional
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def memory_db():
+    # A fresh, empty database per test, with no students cached from the last one
+    use_client(AsyncMongoMockClient(), "advisr_test")
+    principal_cache.clear()
+    return db
+
+@pytest.fixture
+async def api(memory_db):
+    # The app over memory_db; the lifespan (job workers, preloads) does not run
+    await ensure_indexes()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.fixture
+def sign_up(api):
+    # Registers a student and returns the headers of a signed-in session
+    async def sign_up(reg_no="R1", **fields):
+        student = {"name": "Student", "reg_no": reg_no, "email": f"{reg_no.lower()}@example.com", "password": "secret"}
+        assert (await api.post("/register", json={**student, **fields})).status_code == 201
+        token = (await api.post("/token", data={"username": reg_no, "password": "secret"})).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return sign_up
+
+@pytest.fixture(params=["embedded", "split"])
+def layout(request, monkeypatch):
+    # Runs a test under both semester layouts; new students start in the configured one
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", request.param == "split")
+    return request.param
@@ -0,0 +1,110 @@
+import pytest
+from bson import ObjectId
+from app import auth
+from app.analytics import COUNTED_FIELD, rebuild_cohort_stats, summarize
+from app.database import ensure_indexes
+from app.followups import COHORT_REBUILD, backfill_cohort_stats, record_cohort_stats
+from app.jobs import JobQueue, job_key
+from app.gpa import gpa_fields, rebuild_totals
+
+pytestmark = pytest.mark.anyio
+
+def _subject(code, credits, grade):
+    return {"code": code, "name": code, "credits": credits, "grade": grade}
+
+async def _student(memory_db, batch, semesters, current_semester):
+    # Stored GPA fields cover every graded subject, including the current semester's
+    student = {
+        "_id": ObjectId(), "reg_no": str(ObjectId()), "batch": batch, "current_semester": current_semester,
+        "semesters": semesters, "version": 1, **gpa_fields(rebuild_totals(semesters), None)
+    }
+    await memory_db.students.insert_one(student)
+    return student
+
+async def _histograms(memory_db):
+    return {doc["_id"]: {k: v for k, v in doc["cgpa_histogram"].items() if v} async for doc in memory_db.cohort_stats.find({})}
+
+async def test_rebuild_matches_incremental_histogram(memory_db):
+    students = [
+        # A grade entered in the current semester moves the stored cgpa (8.0 -> 9.0)
+        await _student(memory_db, "2022", [
+            {"semester_number": 1, "subjects": [_subject("CS101", 4, "A")]},
+            {"semester_number": 2, "subjects": [_subject("CS201", 4, "O")]},
+        ], current_semester=2),
+        await _student(memory_db, "2022", [
+            {"semester_number": 1, "subjects": [_subject("CS101", 4, "F"), _subject("MA101", 4, "B")]},
+            {"semester_number": 2, "subjects": [_subject("CS101", 4, "A+"), _subject("MA201", 3, None)]},
+        ], current_semester=3),
+        await _student(memory_db, "2023", [
+            {"semester_number": 1, "subjects": [_subject("CS101", 4, None)]},
+        ], current_semester=1),
+    ]
+    assert students[0]["cgpa"] == 9.0
+
+    for student in students:
+        await record_cohort_stats(student["_id"], {})
+    incremental = await _histograms(memory_db)
+    # Completed semesters only: 8.0 for the first student, 7.5 for the second
+    assert incremental["2022"] == incremental["all"] == {"75": 1, "80": 1}
+
+    await memory_db.cohort_stats.delete_many({})
+    await rebuild_cohort_stats()
+    assert await _histograms(memory_db) == incremental
+
+async def test_uncounted_student_is_counted_from_the_start(memory_db):
+    # Completed two semesters before cohort stats existed, then a third
+    student = await _student(memory_db, "2022", [
+        {"semester_number": 1, "subjects": [_subject("CS101", 4, "A")]},
+        {"semester_number": 2, "subjects": [_subject("CS201", 4, "O")]},
+        {"semester_number": 3, "subjects": [_subject("CS301", 4, "B")]},
+    ], current_semester=4)
+    await record_cohort_stats(student["_id"], {})
+    await record_cohort_stats(student["_id"], {})
+    # Added to the bucket of the final CGPA only, never taken out of one it was not in
+    assert (await _histograms(memory_db))["all"] == {"80": 1}
+    stats = await memory_db.cohort_stats.find_one({"_id": "all"})
+    assert stats["grades"] == {"A": 1, "O": 1, "B": 1}
+    assert (await memory_db.students.find_one({"_id": student["_id"]}))[COUNTED_FIELD] == 3
+
+async def test_rebuild_marks_students_counted(memory_db):
+    student = await _student(memory_db, "2022", [
+        {"semester_number": 1, "subjects": [_subject("CS101", 4, "A")]},
+        {"semester_number": 2, "subjects": [_subject("CS201", 4, "O")]},
+    ], current_semester=2)
+    await rebuild_cohort_stats()
+    assert (await memory_db.students.find_one({"_id": student["_id"]}))[COUNTED_FIELD] == 1
+
+    # Completing semester 2 counts it alone, moving the student from 8.0 to 9.0
+    await memory_db.students.update_one({"_id": student["_id"]}, {"$set": {"current_semester": 3}})
+    await record_cohort_stats(student["_id"], {})
+    assert (await _histograms(memory_db))["all"] == {"90": 1}
+    assert (await memory_db.cohort_stats.find_one({"_id": "all"}))["grades"] == {"A": 1, "O": 1}
+
+async def test_backfill_runs_once(memory_db):
+    await ensure_indexes()
+    queue = JobQueue(workers=0)
+    student = await _student(memory_db, "2022", [{"semester_number": 1, "subjects": [_subject("CS101", 4, "A")]}], 2)
+    await backfill_cohort_stats(queue)
+    await backfill_cohort_stats(queue)
+    assert await memory_db.jobs.count_documents({"key": job_key(COHORT_REBUILD, None)}) == 1
+
+    assert await queue.run_one()
+    assert (await _histograms(memory_db))["all"] == {"80": 1}
+    assert (await memory_db.students.find_one({"_id": student["_id"]}))[COUNTED_FIELD] == 1
+    await backfill_cohort_stats(queue)
+    assert not await queue.run_one()
+
+async def test_import_queues_a_rebuild(api, memory_db, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", "admin-key")
+    body = b'{"reg_no": "R1", "name": "Jane", "email": "j@example.com", "password": "secret123", "current_semester": 2, "batch": "2022", ' \
+        b'"semesters": [{"semester_number": 1, "subjects": [{"name": "CS101", "code": "CS101", "credits": 4, "grade": "A"}]}]}\n'
+    response = await api.post("/admin/import", content=body, headers={"X-Admin-Key": "admin-key"})
+    assert response.json()["inserted"] == 1
+
+    assert await JobQueue(workers=0).run_one()
+    assert (await _histograms(memory_db))["2022"] == {"80": 1}
+
+def test_summary_keeps_negative_buckets():
+    # Drifted counters show up in the totals rather than being hidden
+    summary = summarize({"cgpa_histogram": {"80": 2, "75": -1, "90": 0}}, "all")
+    assert summary["students"] == 1
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import pytest
+from passlib.hash import bcrypt
+from app import auth
+from app.auth import CurrentUser, principal_cache
+from app.main import app, lifespan
+from app.repositories import InMemoryStudentRepository, MongoStudentRepository, get_student_repository, use_student_repository
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def students():
+    previous = get_student_repository()
+    repository = InMemoryStudentRepository()
+    use_student_repository(repository)
+    principal_cache.clear()
+    yield repository
+    use_student_repository(previous)
+    principal_cache.clear()
+
+async def test_cached_principal_is_not_shared_between_requests(students):
+    await students.create({"reg_no": "R1", "email": "r1@example.com", "name": "Student", "version": 1})
+    dependency = CurrentUser({"name": 1})
+
+    first = await dependency.load("R1")
+    first["name"] = "Changed by one request"
+    first["extra"] = True
+
+    second = await dependency.load("R1")
+    assert second["name"] == "Student" and "extra" not in second
+    assert second["id"] == str(second["_id"])
+
+async def test_nested_changes_do_not_leak_into_the_next_request(students):
+    subjects = [{"code": "CS101", "name": "Programming", "credits": 4, "grade": None}]
+    await students.create({
+        "reg_no": "R1", "email": "r1@example.com", "version": 1,
+        "semesters": [{"semester_number": 1, "subjects": subjects, "sgpa": None}]
+    })
+    dependency = CurrentUser({"semesters": 1})
+
+    # Filled from the repository, then served from the cache
+    for _ in range(2):
+        user = await dependency.load("R1")
+        user["semesters"][0]["subjects"][0]["grade"] = "A"
+        user["semesters"][0]["subjects"].append({"code": "MA101", "name": "Maths", "credits": 3, "grade": None})
+        user["semesters"].append({"semester_number": 2, "subjects": [], "sgpa": None})
+
+    semesters = (await dependency.load("R1"))["semesters"]
+    assert semesters == [{"semester_number": 1, "subjects": subjects, "sgpa": None}]
+
+async def test_login_upgrades_a_hash_with_another_cost(students, api):
+    legacy = bcrypt.using(rounds=auth.BCRYPT_ROUNDS + 1).hash("secret")
+    student_id = await students.create({"reg_no": "R1", "email": "r1@example.com", "hashed_password": legacy, "version": 1})
+    response = await api.post("/token", data={"username": "R1", "password": "secret"})
+    assert response.status_code == 200
+
+    stored = (await students.get(student_id))["hashed_password"]
+    assert stored != legacy and bcrypt.from_string(stored).rounds == auth.BCRYPT_ROUNDS
+    assert auth.pwd_context.verify("secret", stored)
+    # Not a change to the profile, so ETags stay valid
+    assert (await students.get(student_id))["version"] == 1
+
+async def test_saturated_hash_pool_returns_503(students, api, monkeypatch):
+    await students.create({"reg_no": "R1", "email": "r1@example.com", "hashed_password": auth.pwd_context.hash("secret")})
+    monkeypatch.setattr(auth, "PASSWORD_HASH_MAX_PENDING", 1)
+    release = threading.Event()
+    busy = asyncio.ensure_future(auth._run_in_hash_pool("verify", release.wait))
+    await asyncio.sleep(0.01)
+    try:
+        response = await api.post("/token", data={"username": "R1", "password": "secret"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+        await busy
+
+    # Once the backlog has drained logins go through again
+    assert (await api.post("/token", data={"username": "R1", "password": "secret"})).status_code == 200
+
+async def test_concurrent_duplicate_registrations_create_one_student(memory_db, api):
+    # Both pass the existence check; the unique index decides
+    previous = get_student_repository()
+    use_student_repository(MongoStudentRepository(memory_db))
+    try:
+        form = {"name": "Student", "reg_no": "R1", "email": "r1@example.com", "password": "secret"}
+        responses = await asyncio.gather(*(api.post("/register", json=form) for _ in range(5)))
+    finally:
+        use_student_repository(previous)
+    assert sorted(response.status_code for response in responses) == [201, 400, 400, 400, 400]
+    assert await memory_db.students.count_documents({"reg_no": "R1"}) == 1
+
+async def test_startup_fails_when_the_indexes_cannot_be_built(memory_db, monkeypatch):
+    async def failing_create_indexes(self, indexes):
+        raise RuntimeError("E11000 duplicate key error collection: students index: reg_no_1")
+
+    monkeypatch.setattr(type(memory_db.students), "create_indexes", failing_create_indexes)
+    with pytest.raises(RuntimeError):
+        async with lifespan(app):
+            pass
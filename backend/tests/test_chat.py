@@ -0,0 +1,248 @@
+import asyncio
+import json
+import httpx
+import pytest
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi import BackgroundTasks
+from app.circuit_breaker import CircuitBreaker
+from app.llm import FakeLLMClient, ResilientLLMClient, get_llm_client
+from app.main import app
+from app.models import ChatMessage
+from app.rate_limit import ChatRateLimiter, InMemoryRateLimitBackend, get_chat_rate_limiter
+from app.response_cache import ResponseCache, InMemoryResponseCacheBackend, get_response_cache
+from app.retrieval import Retriever, get_retriever
+from app.routes.chat import (
+    FALLBACK_RESPONSE, CHAT_SESSION_IDLE_SECONDS, _answer, _answer_stream, _is_standalone, chat_stream_flight, chat_user,
+    prompt_cache
+)
+
+pytestmark = pytest.mark.anyio
+
+class FailingLLMClient(FakeLLMClient):
+
+    async def generate(self, model, contents) -> str:
+        self.calls += 1
+        raise RuntimeError("503 Service Unavailable")
+
+@pytest.fixture
+def student():
+    prompt_cache.clear()
+    return {"_id": ObjectId(), "reg_no": "R1", "name": "Student", "current_semester": 1, "semesters": [], "version": 1}
+
+@pytest.fixture
+def chat(memory_db, tmp_path):
+    # _answer with in-memory dependencies; no resource index in tmp_path
+    response_cache = ResponseCache(InMemoryResponseCacheBackend())
+    rate_limiter = ChatRateLimiter(InMemoryRateLimitBackend())
+    retriever = Retriever(directory=str(tmp_path))
+
+    async def ask(student, text, client, bypass_cache=False, breaker=None):
+        llm = ResilientLLMClient(client, hedge_percentile=0, breaker=breaker)
+        message = ChatMessage(message=text, bypass_cache=bypass_cache)
+        return await _answer(message, BackgroundTasks(), student, llm, response_cache, rate_limiter, retriever)
+
+    async def ask_stream(student, text, client):
+        llm = ResilientLLMClient(client, hedge_percentile=0)
+        message = ChatMessage(message=text)
+        return await chat_stream_flight.join(
+            (student["reg_no"], text, False),
+            lambda: _answer_stream(message, BackgroundTasks(), student, llm, response_cache, rate_limiter, retriever)
+        )
+
+    ask.stream = ask_stream
+    return ask
+
+class BrokenRetriever(Retriever):
+
+    async def retrieve(self, message):
+        raise RuntimeError("resource index unreadable")
+
+@pytest.fixture
+def stream_api(memory_db, student, tmp_path):
+    # POST /chat/stream through the app, with in-memory dependencies
+    async def post(client, retriever=None):
+        overrides = {
+            chat_user: lambda: student,
+            get_llm_client: lambda: ResilientLLMClient(client, hedge_percentile=0),
+            get_response_cache: lambda: ResponseCache(InMemoryResponseCacheBackend()),
+            get_chat_rate_limiter: lambda: ChatRateLimiter(InMemoryRateLimitBackend()),
+            get_retriever: lambda: retriever or Retriever(directory=str(tmp_path)),
+        }
+        app.dependency_overrides.update(overrides)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as api:
+            return await api.post("/chat/stream", json={"message": "Any tips?"})
+
+    yield post
+    app.dependency_overrides.clear()
+
+def _events(body):
+    # (event, data) pairs from a text/event-stream body
+    events = []
+    for block in body.split("\n\n")[:-1]:
+        event, data = block.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    assert body.endswith("\n\n")
+    return events
+
+async def _read(tokens, limit=None):
+    parts = []
+    try:
+        async for text in tokens:
+            parts.append(text)
+            if len(parts) == limit:
+                break
+    finally:
+        await tokens.aclose()
+    return "".join(parts)
+
+async def test_response_cache_hit_and_miss():
+    cache = ResponseCache(InMemoryResponseCacheBackend())
+    assert await cache.get("How do I raise my CGPA?", "R1:1") is None
+
+    await cache.set("How do I raise my CGPA?", "R1:1", "Study more.")
+    # Normalized: case and punctuation do not matter
+    assert await cache.get("how do i raise my cgpa", "R1:1") == "Study more."
+    # Another fingerprint misses
+    assert await cache.get("How do I raise my CGPA?", "R2:1") is None
+    assert await cache.get("How do I raise my CGPA?", "R1:2") is None
+    assert cache.backend.stats()["hits"] >= 1
+
+def test_is_standalone():
+    now = datetime.utcnow()
+    assert _is_standalone([])
+    assert not _is_standalone([{"role": "model", "text": "Hi", "created_at": now}])
+    idle = now - timedelta(seconds=CHAT_SESSION_IDLE_SECONDS + 1)
+    assert _is_standalone([{"role": "model", "text": "Hi", "created_at": idle}])
+
+async def test_standalone_question_is_answered_from_cache(chat, student, memory_db):
+    client = FakeLLMClient("Attend every lab.")
+    assert await chat(student, "Any tips?", client) == {"response": "Attend every lab."}
+    assert client.calls == 1
+
+    # While the conversation is recent the question may be a follow-up
+    await chat(student, "Any tips?", client)
+    assert client.calls == 2
+
+    # Once it has gone idle the cached answer is used
+    idle = datetime.utcnow() - timedelta(seconds=CHAT_SESSION_IDLE_SECONDS + 1)
+    await memory_db.chat_messages.update_many({}, {"$set": {"created_at": idle}})
+    assert await chat(student, "any tips", client) == {"response": "Attend every lab."}
+    assert client.calls == 2
+    # The cached answer is still stored as a turn pair
+    assert await memory_db.chat_messages.count_documents({"student_id": student["_id"]}) == 6
+
+async def test_bypass_cache_calls_gemini(chat, student):
+    client = FakeLLMClient("Attend every lab.")
+    await chat(student, "Any tips?", client)
+    await chat(student, "Any tips?", client, bypass_cache=True)
+    assert client.calls == 2
+
+async def test_client_error_returns_fallback(chat, student, memory_db):
+    client = FailingLLMClient()
+    assert await chat(student, "Any tips?", client) == {"response": FALLBACK_RESPONSE}
+    assert client.calls == 1
+    # Nothing is stored, so the question is not answered from the fallback later
+    assert await memory_db.chat_messages.count_documents({}) == 0
+    assert await chat(student, "Any tips?", FakeLLMClient("Attend every lab.")) == {"response": "Attend every lab."}
+
+async def test_open_breaker_returns_fallback_without_calling(chat, student):
+    client = FailingLLMClient()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=60)
+    await chat(student, "Any tips?", client, breaker=breaker)
+    assert breaker.state == "open"
+
+    assert await chat(student, "Any tips?", client, breaker=breaker) == {"response": FALLBACK_RESPONSE}
+    assert client.calls == 1
+
+async def test_duplicate_streams_share_one_generation(chat, student, memory_db):
+    client = FakeLLMClient("Start with the previous papers.", latency=0.05)
+    first, second = await asyncio.gather(chat.stream(student, "Any tips?", client), chat.stream(student, "Any tips?", client))
+    assert await asyncio.gather(_read(first), _read(second)) == ["Start with the previous papers."] * 2
+    assert client.calls == 1
+    assert await memory_db.chat_messages.count_documents({"student_id": student["_id"]}) == 2
+    assert len(chat_stream_flight) == 0
+
+async def test_stream_continues_for_remaining_duplicates(chat, student, memory_db):
+    client = FakeLLMClient("Start with the previous papers.", latency=0.05)
+    leaver, stayer = await asyncio.gather(chat.stream(student, "Any tips?", client), chat.stream(student, "Any tips?", client))
+    assert await _read(leaver, limit=1) == "Start"
+    assert await _read(stayer) == "Start with the previous papers."
+    assert await memory_db.chat_messages.count_documents({"student_id": student["_id"]}) == 2
+
+async def test_stream_stops_when_every_duplicate_has_gone(chat, student, memory_db):
+    client = FakeLLMClient("Start with the previous papers.", latency=0.05)
+    tokens = await chat.stream(student, "Any tips?", client)
+    assert await _read(tokens, limit=1) == "Start"
+    await asyncio.sleep(0.05)
+    # Incomplete answers are not stored
+    assert await memory_db.chat_messages.count_documents({}) == 0
+    assert len(chat_stream_flight) == 0
+
+async def test_stream_endpoint_sends_tokens_then_done(stream_api, student, memory_db):
+    response = await stream_api(FakeLLMClient("Start with the previous papers."))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    assert events[-1] == ("done", {})
+    assert all(event == "token" for event, _ in events[:-1])
+    assert "".join(data["text"] for _, data in events[:-1]) == "Start with the previous papers."
+    assert await memory_db.chat_messages.count_documents({"student_id": student["_id"]}) == 2
+
+async def test_stream_endpoint_sends_the_fallback_on_a_gemini_error(stream_api, memory_db):
+    class FailingStream(FakeLLMClient):
+        async def stream(self, model, contents):
+            yield "Start"
+            raise RuntimeError("503 Service Unavailable")
+
+    response = await stream_api(FailingStream())
+    assert response.status_code == 200
+    assert _events(response.text) == [("token", {"text": "Start"}), ("error", {"text": FALLBACK_RESPONSE})]
+    assert await memory_db.chat_messages.count_documents({}) == 0
+
+async def test_stream_endpoint_sends_the_fallback_on_a_setup_error(stream_api, memory_db):
+    client = FakeLLMClient("Start with the previous papers.")
+    response = await stream_api(client, retriever=BrokenRetriever())
+    assert response.status_code == 200
+    assert _events(response.text) == [("error", {"text": FALLBACK_RESPONSE})]
+    assert client.calls == 0
+
+def _classmate(student, **fields):
+    return {**student, "_id": ObjectId(), "reg_no": str(ObjectId()), "name": "Classmate", **fields}
+
+async def test_students_with_the_same_profile_share_answers(chat, student):
+    client = FakeLLMClient("Attend every lab.")
+    student = {**student, "batch": "2022", "current_semester": 3}
+    assert await chat(student, "Any tips for labs?", client) == {"response": "Attend every lab."}
+
+    # Different name, grades and version; same batch and semester
+    classmate = _classmate(student, version=7, semesters=[{"semester_number": 1, "subjects": [], "sgpa": 9.1}])
+    assert await chat(classmate, "any tips for labs", client) == {"response": "Attend every lab."}
+    assert client.calls == 1
+
+    # Another semester or batch is another profile
+    await chat(_classmate(student, current_semester=4), "Any tips for labs?", client)
+    await chat(_classmate(student, batch="2023"), "Any tips for labs?", client)
+    assert client.calls == 3
+
+async def test_shared_answers_are_generated_without_the_record(chat, student):
+    class RecordingLLMClient(FakeLLMClient):
+        async def generate(self, model, contents):
+            self.prompts.append((model, contents))
+            return await super().generate(model, contents)
+
+    client = RecordingLLMClient("Attend every lab.")
+    client.prompts = []
+    await chat({**student, "name": "Asha", "batch": "2022"}, "Any tips for labs?", client)
+    model, contents = client.prompts[0]
+    assert "Asha" not in model and "2022" in model
+    assert len(contents) == 1
+
+async def test_questions_about_the_record_are_not_shared(chat, student):
+    client = FakeLLMClient("Your CS101 grade is the weakest.")
+    await chat(student, "What is my weakest subject?", client)
+    await chat(_classmate(student), "What is my weakest subject?", client)
+    await chat(_classmate(student), "What do I need for a 9 CGPA?", client)
+    await chat(_classmate(student), "What do I need for a 9 CGPA?", client)
+    assert client.calls == 4
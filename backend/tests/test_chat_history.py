@@ -0,0 +1,82 @@
+import pytest
+from bson import ObjectId
+from app import chat_history
+from app.chat_history import append_turns, fold_into_summary, load_context
+from app.llm import FakeLLMClient, ResilientLLMClient
+
+pytestmark = pytest.mark.anyio
+
+class CountingLLMClient(FakeLLMClient):
+
+    def __init__(self, reply: str = "Summary."):
+        super().__init__(reply)
+        self.models = 0
+
+    async def get_model(self, system_instruction: str):
+        self.models += 1
+        return system_instruction
+
+async def _conversation(student_id, pairs: int):
+    for i in range(pairs):
+        await append_turns(student_id, f"question {i}", f"answer {i}")
+
+async def test_overflow_pages_up_from_the_summary(memory_db, monkeypatch):
+    # Only the newest 4 turns are read and 2 fit the budget; 20 turns are pending
+    monkeypatch.setattr(chat_history, "CHAT_RECENT_TURNS_LIMIT", 4)
+    monkeypatch.setattr(chat_history, "CHAT_CONTEXT_TOKEN_BUDGET", 8)
+    monkeypatch.setattr(chat_history, "CHAT_SUMMARY_BATCH_TURNS", 6)
+    student_id = ObjectId()
+    await _conversation(student_id, 10)
+    # A summary short enough to leave the window its two turns
+    llm = ResilientLLMClient(CountingLLMClient("Sum."), hedge_percentile=0)
+
+    summary_doc, window, overflow = await load_context(student_id)
+    assert [turn["text"] for turn in window] == ["question 9", "answer 9"]
+    assert [turn["text"] for turn in overflow] == ["question 0", "answer 0", "question 1", "answer 1", "question 2", "answer 2"]
+
+    # Each fold takes the next oldest batch until only the window is left
+    folded = []
+    while overflow:
+        folded += [turn["text"] for turn in overflow]
+        await fold_into_summary(student_id, summary_doc, overflow, llm)
+        summary_doc, window, overflow = await load_context(student_id)
+    assert folded == [f"{role} {i}" for i in range(9) for role in ("question", "answer")]
+    assert [turn["text"] for turn in window] == ["question 9", "answer 9"]
+
+async def test_concurrent_folds_apply_once(memory_db, monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_CONTEXT_TOKEN_BUDGET", 8)
+    student_id = ObjectId()
+    await _conversation(student_id, 3)
+    summary_doc, _, overflow = await load_context(student_id)
+    assert summary_doc is None and len(overflow) == 4
+
+    await fold_into_summary(student_id, summary_doc, overflow, ResilientLLMClient(FakeLLMClient("First."), hedge_percentile=0))
+    # A second message read the same state before the first fold was written
+    await fold_into_summary(student_id, summary_doc, overflow, ResilientLLMClient(FakeLLMClient("Second."), hedge_percentile=0))
+    stored = await memory_db.chat_summaries.find_one({"student_id": student_id})
+    assert stored["summary"] == "First."
+
+    await append_turns(student_id, "question 3", "answer 3")
+    summary_doc, _, overflow = await load_context(student_id)
+    assert [turn["text"] for turn in overflow] == ["question 2", "answer 2"]
+    stale = dict(summary_doc)
+    await fold_into_summary(student_id, summary_doc, overflow, ResilientLLMClient(FakeLLMClient("Third."), hedge_percentile=0))
+    await fold_into_summary(student_id, stale, overflow, ResilientLLMClient(FakeLLMClient("Fourth."), hedge_percentile=0))
+    stored = await memory_db.chat_summaries.find_one({"student_id": student_id})
+    assert stored["summary"] == "Third." and stored["summarized_until"] == overflow[-1]["_id"]
+
+async def test_summary_model_is_cached_per_client(memory_db, monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_CONTEXT_TOKEN_BUDGET", 8)
+    client = CountingLLMClient()
+    llm = ResilientLLMClient(client, hedge_percentile=0)
+    for i in range(3):
+        student_id = ObjectId()
+        await _conversation(student_id, 2)
+        summary_doc, _, overflow = await load_context(student_id)
+        await fold_into_summary(student_id, summary_doc, overflow, llm)
+    assert client.calls == 3 and client.models == 1
+
+    # Another client builds its own
+    other = CountingLLMClient()
+    await fold_into_summary(student_id, None, overflow, ResilientLLMClient(other, hedge_percentile=0))
+    assert other.models == 1
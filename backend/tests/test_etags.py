@@ -0,0 +1,51 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+READS = ("/users/me", "/users/me/subjects", "/users/me/history")
+
+async def _add(api, headers, code):
+    response = await api.post("/users/me/subjects", json={"name": code, "code": code, "credits": 4}, headers=headers)
+    assert response.status_code == 200
+
+@pytest.mark.parametrize("path", READS)
+async def test_matching_etag_returns_304_without_a_body(api, sign_up, layout, path):
+    headers = await sign_up()
+    first = await api.get(path, headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    repeat = await api.get(path, headers={**headers, "If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    assert repeat.headers["ETag"] == etag
+    # Listed among other tags, or as *
+    assert (await api.get(path, headers={**headers, "If-None-Match": f'"other", {etag}'})).status_code == 304
+    assert (await api.get(path, headers={**headers, "If-None-Match": "*"})).status_code == 304
+
+@pytest.mark.parametrize("path", READS)
+async def test_every_write_changes_the_etag(api, sign_up, layout, path):
+    headers = await sign_up()
+    etags = [(await api.get(path, headers=headers)).headers["ETag"]]
+
+    await _add(api, headers, "CS101")
+    etags.append((await api.get(path, headers=headers)).headers["ETag"])
+    response = await api.post("/users/me/complete-semester", json={"CS101": "A"}, headers=headers)
+    assert response.status_code == 200
+    etags.append((await api.get(path, headers=headers)).headers["ETag"])
+    assert len(set(etags)) == 3
+
+    # The tag from before the writes no longer matches: the new document comes back
+    stale = await api.get(path, headers={**headers, "If-None-Match": etags[0]})
+    assert stale.status_code == 200
+    assert stale.headers["ETag"] == etags[-1]
+    assert stale.json() == (await api.get(path, headers=headers)).json()
+
+@pytest.mark.parametrize("path", READS)
+async def test_weak_or_mismatched_validators_return_200(api, sign_up, path):
+    headers = await sign_up()
+    etag = (await api.get(path, headers=headers)).headers["ETag"]
+    for validator in (f"W/{etag}", '"not-the-etag"', etag.strip('"')):
+        response = await api.get(path, headers={**headers, "If-None-Match": validator})
+        assert response.status_code == 200
+        assert response.headers["ETag"] == etag
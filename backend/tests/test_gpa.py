@@ -0,0 +1,74 @@
+from app.gpa import apply_subjects, calculate_cgpa, calculate_sgpa, empty_totals, rebuild_totals
+
+def test_ungraded_subjects_do_not_count():
+    subjects = [
+        {"code": "CS101", "credits": 4, "grade": "A"},
+        {"code": "MA101", "credits": 3, "grade": None},
+    ]
+    assert calculate_sgpa(subjects) == 8.0
+    assert calculate_sgpa([{"code": "MA101", "credits": 3, "grade": None}]) is None
+
+def test_failed_subjects_count_in_sgpa_but_not_cgpa():
+    subjects = [{"code": "CS101", "credits": 4, "grade": "A"}, {"code": "MA101", "credits": 4, "grade": "F"}]
+    assert calculate_sgpa(subjects) == 4.0
+    assert calculate_cgpa(apply_subjects(empty_totals(), subjects)) == 8.0
+
+def test_codes_are_stored_as_safe_field_names():
+    totals = apply_subjects(empty_totals(), [{"code": "CS.101", "credits": 3, "grade": "O"}, {"code": "$MA", "credits": 3, "grade": "B"}])
+    assert set(totals["subjects"]) == {"CS_101", "_MA"}
+
+    # A later pass of the same code replaces the earlier one
+    totals = apply_subjects(totals, [{"code": "CS.101", "credits": 3, "grade": "C"}])
+    assert (totals["credits"], calculate_cgpa(totals)) == (6, 5.5)
+
+def test_rebuild_matches_incremental():
+    history = [
+        {"semester_number": 2, "subjects": [{"code": "CS.1", "credits": 4, "grade": "A+"}]},
+        {"semester_number": 1, "subjects": [{"code": "CS.1", "credits": 4, "grade": "F"}, {"code": "PH", "credits": 2, "grade": None}]},
+    ]
+    incremental = apply_subjects(apply_subjects(empty_totals(), history[1]["subjects"], 1), history[0]["subjects"], 2)
+    assert rebuild_totals(history) == incremental
+
+def _graded(code, credits, grade):
+    return {"code": code, "credits": credits, "grade": grade}
+
+def _incremental(writes):
+    # (semester, subjects) in the order the routes apply them: add_subject, then complete_semester
+    totals = empty_totals()
+    for semester_number, subjects in writes:
+        totals = apply_subjects(totals, subjects, semester_number)
+    return totals
+
+def test_failing_a_subject_added_with_a_grade_matches_rebuild():
+    totals = _incremental([(1, [_graded("CS101", 4, "A")]), (1, [_graded("CS101", 4, "F"), _graded("MA101", 3, "B")])])
+    history = [{"semester_number": 1, "subjects": [_graded("CS101", 4, "F"), _graded("MA101", 3, "B")]}]
+    assert totals == rebuild_totals(history)
+    assert (totals["credits"], calculate_cgpa(totals)) == (3, 6.0)
+
+def test_regrade_within_a_semester_matches_rebuild():
+    totals = _incremental([(1, [_graded("CS101", 4, "A")]), (1, [_graded("CS101", 4, "B")])])
+    assert totals == rebuild_totals([{"semester_number": 1, "subjects": [_graded("CS101", 4, "B")]}])
+    assert calculate_cgpa(totals) == 6.0
+
+def test_retake_matches_rebuild():
+    # Failed, then passed the next semester
+    totals = _incremental([(1, [_graded("CS101", 4, "F")]), (2, [_graded("CS101", 4, "A")])])
+    history = [
+        {"semester_number": 1, "subjects": [_graded("CS101", 4, "F")]},
+        {"semester_number": 2, "subjects": [_graded("CS101", 4, "A")]},
+    ]
+    assert totals == rebuild_totals(history)
+    assert calculate_cgpa(totals) == 8.0
+
+    # Passed, retaken with a grade entered early, then failed: the first pass counts again
+    totals = _incremental([(1, [_graded("CS101", 4, "B")]), (3, [_graded("CS101", 4, "O")]), (3, [_graded("CS101", 4, "F")])])
+    history = [
+        {"semester_number": 1, "subjects": [_graded("CS101", 4, "B")]},
+        {"semester_number": 3, "subjects": [_graded("CS101", 4, "F")]},
+    ]
+    assert totals == rebuild_totals(history)
+    assert calculate_cgpa(totals) == 6.0
+
+    # A failed retake in a later semester keeps the earlier pass
+    totals = _incremental([(1, [_graded("CS101", 4, "B")]), (2, [_graded("CS101", 4, "F")])])
+    assert calculate_cgpa(totals) == 6.0
@@ -0,0 +1,92 @@
+import threading
+import pytest
+from bson import ObjectId
+from app import importer, semesters as semester_store
+from app.auth import hash_passwords, pwd_context
+from app.database import ensure_indexes
+from app.importer import ImportRowError, csv_records, import_students, iter_lines
+
+pytestmark = pytest.mark.anyio
+
+HEADER = b"reg_no,name,email,password,current_semester,batch,semester_number,subject_code,subject_name,credits,grade\r\n"
+
+async def _chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+async def _records(data: bytes):
+    return [record async for record in csv_records(iter_lines(_chunks(data)))]
+
+async def test_quoted_fields_span_chunks_and_lines():
+    records = await _records(
+        HEADER
+        + b'R1,"Doe, Jane",j@example.com,secret123,2,2022,1,CS101,"Intro\r\nto ""CS""",4,A\r\n'
+        + b"\r\n"
+        + b"R2,Bob,b@example.com,secret123,1,2022,,,,,\r\n"
+    )
+    assert [row for row, _ in records] == [2, 5]
+    first = records[0][1]
+    assert first["name"] == "Doe, Jane"
+    assert first["semesters"][1]["subjects"][0]["name"] == 'Intro\r\nto "CS"'
+    assert records[1][1]["semesters"] == {}
+
+async def test_semester_numbers_group_as_integers():
+    records = await _records(
+        HEADER
+        + b"R1,Jane,j@example.com,secret123,2,2022,1,CS101,Intro,4,A\n"
+        + b"R1,Jane,j@example.com,secret123,2,2022,01,CS102,Data,3,B\n"
+        + b"R1,Jane,j@example.com,secret123,2,2022,,CS201,Algorithms,3,\n"
+    )
+    semesters = records[0][1]["semesters"]
+    assert sorted(semesters) == [1, 2]
+    assert [sub["code"] for sub in semesters[1]["subjects"]] == ["CS101", "CS102"]
+    # Without semester_number the (CSV string) current semester is used
+    assert [sub["code"] for sub in semesters[2]["subjects"]] == ["CS201"]
+
+async def test_unterminated_quote_is_a_row_error():
+    records = await _records(HEADER + b'R1,"Jane\n')
+    assert len(records) == 1 and isinstance(records[0][1], ImportRowError)
+
+async def test_csv_import_writes_students(memory_db):
+    report = await import_students(csv_records(iter_lines(_chunks(
+        HEADER
+        + b'R1,"Doe, Jane",j@example.com,secret123,2,2022,1,CS101,Intro,4,A\n'
+        + b"R1,Doe Jane,j@example.com,secret123,2,2022,1,CS102,Data,3,B\n"
+        + b"R2,Bob,not-an-email,secret123,1,2022,,,,,\n"
+    ))))
+    assert report["inserted"] == 1 and [error["reg_no"] for error in report["errors"]] == ["R2"]
+    stored = await memory_db.students.find_one({"reg_no": "R1"})
+    assert len(stored["semesters"]) == 1 and len(stored["semesters"][0]["subjects"]) == 2
+    assert pwd_context.verify("secret123", stored["hashed_password"])
+
+async def test_student_whose_semesters_fail_is_not_inserted(memory_db, monkeypatch):
+    await ensure_indexes()
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", True)
+    # R2 is given an _id that already has a semester 1, so its semester insert fails
+    ids = [ObjectId(), ObjectId()]
+    await memory_db.semesters.insert_one({"student_id": ids[1], "semester_number": 1, "subjects": [], "sgpa": None})
+    monkeypatch.setattr(importer, "ObjectId", iter(ids).__next__)
+
+    report = await import_students(csv_records(iter_lines(_chunks(
+        HEADER
+        + b"R1,Jane,j@example.com,secret123,2,2022,1,CS101,Intro,4,A\n"
+        + b"R2,Bob,b@example.com,secret123,2,2022,1,CS101,Intro,4,B\n"
+    ))))
+    assert report["inserted"] == 1
+    assert [(error["reg_no"], error["error"].startswith("Could not write semesters")) for error in report["errors"]] == [("R2", True)]
+    assert [s["reg_no"] async for s in memory_db.students.find({})] == ["R1"]
+    assert await memory_db.semesters.count_documents({"student_id": ids[0]}) == 1
+    # Nothing is left under R2's _id
+    assert await memory_db.semesters.count_documents({"student_id": ids[1]}) == 0
+
+async def test_hash_passwords_uses_the_import_pool(monkeypatch):
+    threads = []
+    original = pwd_context.hash
+
+    def hash(password):
+        threads.append(threading.current_thread().name)
+        return original(password)
+
+    monkeypatch.setattr(pwd_context, "hash", hash)
+    await hash_passwords(["first", "second"])
+    assert len(threads) == 2 and all(name.startswith("bcrypt-import") for name in threads)
@@ -0,0 +1,103 @@
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from app.database import ensure_indexes
+from app.followups import COHORT_STATS
+from app.jobs import OUTBOX_FIELD, JobQueue, add_to_outbox, get_job_queue, job_key
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+class ContendedJobs:
+    # A jobs collection where another process always inserts the waiting job first
+
+    def __init__(self):
+        self.attempts = 0
+
+    async def update_one(self, *args, **kwargs):
+        self.attempts += 1
+        raise DuplicateKeyError("E11000 duplicate key error")
+
+class ContendedQueue(JobQueue):
+
+    def __init__(self):
+        super().__init__(workers=0)
+        self.jobs = ContendedJobs()
+
+    @property
+    def collection(self):
+        return self.jobs
+
+async def test_enqueue_merges_into_the_waiting_job(memory_db):
+    await ensure_indexes()
+    queue = JobQueue(workers=0)
+    student_id = ObjectId()
+    await queue.enqueue(COHORT_STATS, student_id, {"from_semester": 3})
+    await queue.enqueue(COHORT_STATS, student_id, {"from_semester": 2})
+    jobs = await memory_db.jobs.find({"key": job_key(COHORT_STATS, student_id)}).to_list(None)
+    assert len(jobs) == 1 and jobs[0]["payload"] == {"from_semester": 2}
+
+async def test_enqueue_raises_when_it_keeps_losing_the_insert():
+    queue = ContendedQueue()
+    with pytest.raises(DuplicateKeyError):
+        await queue.enqueue(COHORT_STATS, ObjectId())
+    assert queue.jobs.attempts == 2
+
+async def _complete_semester(api, headers):
+    await api.post("/users/me/subjects", json={"name": "CS101", "code": "CS101", "credits": 4}, headers=headers)
+    response = await api.post("/users/me/complete-semester", json={"CS101": "A"}, headers=headers)
+    assert response.status_code == 200
+
+async def _outbox(memory_db):
+    return (await memory_db.students.find_one({"reg_no": "R1"})).get(OUTBOX_FIELD)
+
+async def test_completion_queues_cohort_stats_after_responding(api, sign_up, memory_db, layout):
+    headers = await sign_up()
+    await api.post("/users/me/subjects", json={"name": "MA101", "code": "MA101", "credits": 3}, headers=headers)
+    # Adding subjects needs no follow-up work
+    assert await memory_db.jobs.count_documents({}) == 0
+
+    await _complete_semester(api, headers)
+    student = await memory_db.students.find_one({"reg_no": "R1"})
+    jobs = await memory_db.jobs.find({}).to_list(None)
+    assert [job["key"] for job in jobs] == [job_key(COHORT_STATS, student["_id"])]
+    # Moved out of the outbox once queued
+    assert student[OUTBOX_FIELD] == []
+
+async def test_failed_dispatch_is_left_to_the_sweep(api, sign_up, memory_db, layout):
+    headers = await sign_up()
+    app.dependency_overrides[get_job_queue] = ContendedQueue
+    try:
+        # The completion is committed, with its job in the outbox
+        await _complete_semester(api, headers)
+    finally:
+        app.dependency_overrides.pop(get_job_queue)
+    assert [entry["type"] for entry in await _outbox(memory_db)] == [COHORT_STATS]
+    assert await memory_db.jobs.count_documents({}) == 0
+
+    queue = JobQueue(workers=0)
+    # Entries younger than the grace period are left to the request's own dispatch
+    assert await queue.sweep_outbox() == 0
+    assert await queue.sweep_outbox(older_than=0) == 1
+    assert await _outbox(memory_db) == []
+    assert await memory_db.jobs.count_documents({"type": COHORT_STATS}) == 1
+
+async def test_dispatch_keeps_entries_added_meanwhile(memory_db):
+    await ensure_indexes()
+    student_id = (await memory_db.students.insert_one({"reg_no": "R1", OUTBOX_FIELD: []})).inserted_id
+
+    class RacingQueue(JobQueue):
+        async def enqueue(self, job_type, student_id, merge=None):
+            # Another completion stores its job while this one is being queued
+            if not self.raced:
+                self.raced = True
+                await memory_db.students.update_one({"_id": student_id}, add_to_outbox({}, COHORT_STATS))
+            await super().enqueue(job_type, student_id, merge)
+
+    queue = RacingQueue(workers=0)
+    queue.raced = False
+    await memory_db.students.update_one({"_id": student_id}, add_to_outbox({}, COHORT_STATS))
+    assert await queue.dispatch(student_id) == 1
+    assert len(await _outbox(memory_db)) == 1
+    assert await queue.dispatch(student_id) == 1
+    assert await _outbox(memory_db) == []
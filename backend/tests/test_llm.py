@@ -0,0 +1,151 @@
+import asyncio
+import time
+import pytest
+from app.circuit_breaker import CircuitBreaker, CircuitOpen
+from app.llm import FakeLLMClient, ResilientLLMClient
+
+pytestmark = pytest.mark.anyio
+
+class ScriptedLLMClient(FakeLLMClient):
+    # Each call takes the next (latency, error) from the script, then the last one forever
+
+    def __init__(self, *script):
+        super().__init__("ok")
+        self.script = list(script)
+
+    def _next(self):
+        return self.script.pop(0) if len(self.script) > 1 else self.script[0]
+
+    async def generate(self, model, contents) -> str:
+        self.calls += 1
+        latency, error = self._next()
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return f"reply {self.calls}"
+
+    async def stream(self, model, contents):
+        self.calls += 1
+        latency, error = self._next()
+        yield "first"
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        yield " second"
+
+FAST = (0.0, None)
+FAIL = (0.0, RuntimeError("503 Service Unavailable"))
+
+def _llm(client, **options):
+    options = {"timeout": 1.0, "stream_idle_timeout": 1.0, "hedge_percentile": 0, **options}
+    options.setdefault("breaker", CircuitBreaker("test", failure_threshold=2, reset_seconds=0.1))
+    return ResilientLLMClient(client, **options)
+
+async def test_deadline_fires_and_counts_as_a_failure():
+    llm = _llm(ScriptedLLMClient((5.0, None)), timeout=0.05)
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        await llm.generate("model", "hello")
+    assert time.perf_counter() - started < 1.0
+    assert llm.breaker._failures == 1
+
+async def test_breaker_opens_after_consecutive_failures():
+    client = ScriptedLLMClient(FAIL)
+    llm = _llm(client)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await llm.generate("model", "hello")
+    assert llm.breaker.state == "open"
+
+    # Fails fast without reaching the provider
+    with pytest.raises(CircuitOpen):
+        await llm.generate("model", "hello")
+    assert client.calls == 2
+
+async def test_bad_input_does_not_open_the_breaker():
+    llm = _llm(ScriptedLLMClient((0.0, ValueError("blocked by safety settings"))))
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await llm.generate("model", "hello")
+    assert llm.breaker.state == "closed"
+
+async def test_half_open_trial_failure_reopens():
+    client = ScriptedLLMClient(FAIL, FAIL, (0.05, RuntimeError("still down")))
+    llm = _llm(client)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await llm.generate("model", "hello")
+    await asyncio.sleep(0.12)
+
+    # One trial call goes through; others fail fast while it runs
+    trial = asyncio.ensure_future(llm.generate("model", "hello"))
+    await asyncio.sleep(0)
+    assert llm.breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        await llm.generate("model", "hello")
+    with pytest.raises(RuntimeError):
+        await trial
+    assert llm.breaker.state == "open" and client.calls == 3
+
+async def test_half_open_trial_success_recovers():
+    client = ScriptedLLMClient(FAIL, FAIL, FAST)
+    llm = _llm(client)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await llm.generate("model", "hello")
+    with pytest.raises(CircuitOpen):
+        await llm.generate("model", "hello")
+
+    await asyncio.sleep(0.12)
+    assert await llm.generate("model", "hello") == "reply 3"
+    assert llm.breaker.state == "closed"
+    assert await llm.generate("model", "hello") == "reply 4"
+
+async def test_hedge_is_sent_after_the_percentile():
+    # Ten fast calls set the hedge delay; then the first attempt hangs and the hedge answers
+    client = ScriptedLLMClient(*[(0.01, None)] * 10, (5.0, None), (0.01, None))
+    llm = _llm(client, hedge_percentile=90, hedge_min_samples=10, hedge_min_seconds=0.02)
+    assert llm.hedge_delay() is None
+    for _ in range(10):
+        await llm.generate("model", "hello")
+    delay = llm.hedge_delay()
+    assert 0.02 <= delay < 0.5
+
+    started = time.perf_counter()
+    assert await llm.generate("model", "hello") == "reply 12"
+    assert time.perf_counter() - started < 1.0
+    assert client.calls == 12
+
+async def test_no_hedge_for_calls_faster_than_the_percentile():
+    client = ScriptedLLMClient((0.01, None))
+    llm = _llm(client, hedge_percentile=90, hedge_min_samples=5, hedge_min_seconds=0.2)
+    for _ in range(6):
+        await llm.generate("model", "hello")
+    assert client.calls == 6
+
+async def test_stream_idle_timeout():
+    client = ScriptedLLMClient((5.0, None))
+    llm = _llm(client, stream_idle_timeout=0.05)
+    received = []
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        async for text in llm.stream("model", "hello"):
+            received.append(text)
+    assert received == ["first"]
+    assert time.perf_counter() - started < 1.0
+    assert llm.breaker._failures == 1
+
+async def test_stream_closed_early_releases_the_trial():
+    client = ScriptedLLMClient(FAIL, FAIL, FAST)
+    llm = _llm(client)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await llm.generate("model", "hello")
+    await asyncio.sleep(0.12)
+
+    # The client goes away during the trial stream; the next call may try again
+    tokens = llm.stream("model", "hello")
+    assert await tokens.__anext__() == "first"
+    await tokens.aclose()
+    assert [text async for text in llm.stream("model", "hello")] == ["first", " second"]
+    assert llm.breaker.state == "closed"
@@ -0,0 +1,33 @@
+import asyncio
+import logging
+import pytest
+from app import main
+from app.main import app, lifespan
+
+pytestmark = pytest.mark.anyio
+
+def _fail(message):
+    def load(*args):
+        raise RuntimeError(message)
+    return load
+
+async def _start_and_stop():
+    async with lifespan(app):
+        # Let the executor finish the preloads and their callbacks run
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+
+async def test_failed_sdk_preload_is_logged(memory_db, monkeypatch, caplog):
+    monkeypatch.setattr(main, "GEMINI_PRELOAD", True)
+    monkeypatch.setattr(main, "load_sdk", _fail("no module named google.generativeai"))
+    monkeypatch.setattr(main.get_retriever(), "load", lambda: None)
+    with caplog.at_level(logging.ERROR, logger="app.main"):
+        await _start_and_stop()
+    assert "Gemini SDK preload failed: RuntimeError('no module named google.generativeai')" in caplog.messages
+
+async def test_failed_index_load_is_logged(memory_db, monkeypatch, caplog):
+    monkeypatch.setattr(main, "GEMINI_PRELOAD", False)
+    monkeypatch.setattr(main.get_retriever(), "load", _fail("numpy is not installed"))
+    with caplog.at_level(logging.ERROR, logger="app.main"):
+        await _start_and_stop()
+    assert "Resource index load failed: RuntimeError('numpy is not installed')" in caplog.messages
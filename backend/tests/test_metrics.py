@@ -0,0 +1,35 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app import auth
+from app.main import app
+from app.metrics import SlowRequestProfiler
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", "admin-key")
+    monkeypatch.setattr(auth, "METRICS_API_KEY", "scrape-key")
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+async def test_metrics_require_a_key(client):
+    async with client:
+        assert (await client.get("/metrics")).status_code == 403
+        assert (await client.get("/metrics", headers={"X-Admin-Key": "wrong"})).status_code == 403
+        assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 403
+
+        scraped = await client.get("/metrics", headers={"Authorization": "Bearer scrape-key"})
+        assert scraped.status_code == 200 and "advisr_http_request_duration_seconds" in scraped.text
+        assert (await client.get("/metrics", headers={"X-Admin-Key": "admin-key"})).status_code == 200
+
+async def test_profiler_reports_while_sampling(caplog):
+    # A busy sampler must not break the report of a request ending under it
+    profiler = SlowRequestProfiler(threshold=0.0, interval=0.0005)
+    with caplog.at_level("WARNING", logger="app.metrics"):
+        for i in range(20):
+            token = profiler.begin()
+            await asyncio.to_thread(time.sleep, 0.005)
+            profiler.end(token, 0.01, f"GET /slow/{i}")
+    assert sum("Slow request GET /slow/" in record.message for record in caplog.records) == 20
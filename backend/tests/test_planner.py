@@ -0,0 +1,105 @@
+import itertools
+import pytest
+from app.gpa import GRADE_POINTS, apply_subjects, calculate_cgpa, empty_totals
+from app.planner import PASSING_GRADES, describe_plan, plan_grades, target_from_message
+
+def _subject(code, credits, grade=None):
+    return {"code": code, "name": code, "credits": credits, "grade": grade}
+
+def _totals(*subjects):
+    # gpa_totals after one completed semester
+    return apply_subjects(empty_totals(), list(subjects), 1)
+
+def _cgpa_with(totals, subjects, grades):
+    graded = [{**sub, "grade": grades.get(sub["code"], sub["grade"])} for sub in subjects]
+    return calculate_cgpa(apply_subjects(totals, graded, 2))
+
+def _least_points(totals, subjects, target):
+    # Every combination of passing grades, for checking the search
+    planned = [sub for sub in subjects if sub["grade"] is None]
+    best = None
+    for combo in itertools.product(PASSING_GRADES, repeat=len(planned)):
+        grades = {sub["code"]: grade for sub, grade in zip(planned, combo)}
+        cgpa = _cgpa_with(totals, subjects, grades)
+        points = sum(GRADE_POINTS[grade] * sub["credits"] for sub, grade in zip(planned, combo))
+        if cgpa is not None and cgpa >= target and (best is None or points < best[0]):
+            best = (points, cgpa)
+    return best
+
+TOTALS = _totals(_subject("CS101", 4, "A"), _subject("MA101", 3, "B+"))
+SUBJECTS = [_subject("CS201", 4), _subject("MA201", 3), _subject("PH201", 2), _subject("EN201", 1, "O")]
+
+@pytest.mark.parametrize("target", [5.0, 7.0, 7.5, 8.0, 8.6, 9.0])
+def test_plans_reach_the_target_with_least_effort(target):
+    plan = plan_grades(TOTALS, SUBJECTS, target, limit=5)
+    points, cgpa = _least_points(TOTALS, SUBJECTS, target)
+    assert plan["achievable"] and 1 <= len(plan["plans"]) <= 5
+    for option in plan["plans"]:
+        assert set(option["grades"]) == {"CS201", "MA201", "PH201"}
+        assert option["cgpa"] == _cgpa_with(TOTALS, SUBJECTS, option["grades"]) >= target
+        assert sum(GRADE_POINTS[grade] * sub["credits"] for sub in SUBJECTS for code, grade in option["grades"].items() if code == sub["code"]) == points
+    assert plan["plans"][0]["cgpa"] == cgpa
+    assert plan["min_cgpa"] <= plan["plans"][0]["cgpa"] <= plan["max_cgpa"]
+
+def test_retaking_a_passed_subject_replaces_its_grade():
+    totals = _totals(_subject("CS101", 4, "C"), _subject("MA101", 4, "O"))
+    plan = plan_grades(totals, [_subject("CS101", 4)], 9.0)
+    # 7.5 now; an O in the retake replaces the C
+    assert (plan["current_cgpa"], plan["max_cgpa"]) == (7.5, 10.0)
+    assert plan["plans"][0] == {"cgpa": 9.0, "grades": {"CS101": "A"}}
+
+def test_unreachable_target():
+    plan = plan_grades(TOTALS, SUBJECTS, 9.8)
+    assert _least_points(TOTALS, SUBJECTS, 9.8) is None
+    assert (plan["achievable"], plan["plans"]) == (False, [])
+    assert plan["max_cgpa"] == _cgpa_with(TOTALS, SUBJECTS, {"CS201": "O", "MA201": "O", "PH201": "O"}) < 9.8
+    assert "Not reachable this semester" in describe_plan(plan, SUBJECTS)
+
+def test_zero_remaining_credits():
+    graded = [_subject("CS201", 4, "B")]
+    current = calculate_cgpa(apply_subjects(TOTALS, graded, 2))
+
+    # Nothing left to plan: the CGPA is what it is
+    met = plan_grades(TOTALS, graded, current)
+    assert (met["achievable"], met["plans"]) == (True, [{"cgpa": current, "grades": {}}])
+    assert met["min_cgpa"] == met["max_cgpa"] == current
+    missed = plan_grades(TOTALS, graded, current + 0.5)
+    assert (missed["achievable"], missed["plans"]) == (False, [])
+    assert "no ungraded subjects" in describe_plan(missed, graded)
+
+    # A new student with no credits at all has no CGPA to meet even a target of 0
+    empty = plan_grades(empty_totals(), [], 0)
+    assert (empty["current_cgpa"], empty["achievable"], empty["plans"]) == (None, False, [])
+
+def test_plans_are_limited():
+    subjects = [_subject(f"EL{n}", 3) for n in range(6)]
+    plan = plan_grades(empty_totals(), subjects, 7.5, limit=2)
+    assert len(plan["plans"]) == 2
+    for option in plan["plans"]:
+        # 45 points over six subjects, none above an A
+        points = [GRADE_POINTS[grade] for grade in option["grades"].values()]
+        assert (option["cgpa"], sum(points), max(points)) == (7.5, 45, GRADE_POINTS["A"])
+
+@pytest.mark.parametrize("message, target", [
+    ("What do I need to get an 8.5 CGPA?", 8.5),
+    ("how can i reach 9 cgpa", 9.0),
+    ("Is a 10 GPA possible to achieve?", 10.0),
+    ("What is my CGPA?", None),
+    ("I need 3 more credits", None),
+])
+def test_target_from_message(message, target):
+    assert target_from_message(message) == target
+
+@pytest.mark.anyio
+async def test_plan_route(api, sign_up):
+    headers = await sign_up()
+    for code, credits in (("CS101", 4), ("MA101", 3)):
+        await api.post("/users/me/subjects", json={"name": code, "code": code, "credits": credits}, headers=headers)
+
+    # The current semester's subjects, or what-if ones from the request
+    plan = (await api.post("/users/me/plan", json={"target_cgpa": 8.0}, headers=headers)).json()
+    assert plan["achievable"] and set(plan["plans"][0]["grades"]) == {"CS101", "MA101"}
+    what_if = {"target_cgpa": 8.0, "subjects": [_subject("PH101", 2)]}
+    plan = (await api.post("/users/me/plan", json=what_if, headers=headers)).json()
+    assert plan["plans"] == [{"cgpa": 8.0, "grades": {"PH101": "A"}}]
+    assert (await api.post("/users/me/plan", json={"target_cgpa": 11}, headers=headers)).status_code == 422
@@ -0,0 +1,60 @@
+import pytest
+from app.repositories import DuplicateStudent, InMemoryStudentRepository, MongoStudentRepository, StudentRepository
+from app.rate_limit import RateLimitBackend
+from app.response_cache import ResponseCacheBackend
+from app.database import ensure_indexes
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(params=["mongo", "memory"])
+async def students(request, memory_db):
+    # Both implementations must behave the same way
+    if request.param == "memory":
+        return InMemoryStudentRepository()
+    await ensure_indexes()
+    return MongoStudentRepository(memory_db)
+
+def new_student(reg_no="R1", email="r1@example.com"):
+    return {"reg_no": reg_no, "email": email, "name": "Student", "hashed_password": "x", "version": 1,
+            "current_semester": 1, "semesters": []}
+
+async def test_create_and_read(students):
+    student_id = await students.create(new_student())
+    assert (await students.get(student_id))["reg_no"] == "R1"
+    assert (await students.get_by_reg_no("R1", {"hashed_password": 0})).get("hashed_password") is None
+    assert set(await students.get_by_reg_no("R1", {"version": 1})) == {"_id", "version"}
+    assert await students.get_by_reg_no("missing") is None
+
+async def test_duplicates_are_rejected(students):
+    await students.create(new_student())
+    assert await students.exists("R1", "other@example.com")
+    with pytest.raises(DuplicateStudent):
+        await students.create(new_student(email="r1@example.com", reg_no="R2"))
+
+async def test_login_prefers_reg_no(students):
+    await students.create(new_student("R1", "R2"))
+    await students.create(new_student("R2", "r2@example.com"))
+    assert (await students.find_for_login("R2"))["reg_no"] == "R2"
+    assert (await students.find_for_login("r2@example.com"))["reg_no"] == "R2"
+
+async def test_update_bumps_version_and_honours_guard(students):
+    student_id = await students.create(new_student())
+    assert await students.update(student_id, {"cgpa": 8.0})
+    student = await students.get(student_id)
+    assert (student["cgpa"], student["version"]) == (8.0, 2)
+
+    assert not await students.update(student_id, {"cgpa": 9.0}, version=1)
+    assert await students.update(student_id, {"cgpa": 9.0}, version=2)
+    assert await students.update(student_id, {"name": "Renamed"}, bump_version=False)
+    assert (await students.get(student_id))["version"] == 3
+
+async def test_returned_documents_are_copies(students):
+    student_id = await students.create(new_student())
+    (await students.get(student_id))["semesters"].append({"semester_number": 1})
+    assert (await students.get(student_id))["semesters"] == []
+
+@pytest.mark.parametrize("interface", [StudentRepository, ResponseCacheBackend, RateLimitBackend])
+def test_backends_must_implement_every_method(interface):
+    # A backend missing a method fails when it is built, not on the first request that needs it
+    with pytest.raises(TypeError):
+        type("Partial", (interface,), {})()
@@ -0,0 +1,96 @@
+import time
+import pytest
+from app import auth, revocation
+from app.auth import token_cache, token_digest
+from app.revocation import InMemoryRevocationList, RevocationList
+
+pytestmark = pytest.mark.anyio
+
+READS = ("/users/me", "/users/me/subjects", "/users/me/history", "/users/me/gpa")
+
+@pytest.fixture(autouse=True)
+def revocations(monkeypatch):
+    # A fresh list per test, and no claims cached by an earlier one
+    revocation_list = InMemoryRevocationList()
+    monkeypatch.setattr(revocation, "_revocation_list", revocation_list)
+    token_cache.clear()
+    yield revocation_list
+    token_cache.clear()
+
+def _token(headers):
+    return headers["Authorization"].removeprefix("Bearer ")
+
+async def _login(api, reg_no="R1", password="secret"):
+    token = (await api.post("/token", data={"username": reg_no, "password": password})).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+async def test_token_claims_are_decoded_once(api, sign_up, monkeypatch):
+    headers = await sign_up()
+    decoded = []
+    decode = auth._decode_token
+    monkeypatch.setattr(auth, "_decode_token", lambda token: decoded.append(token) or decode(token))
+    for path in READS + READS:
+        assert (await api.get(path, headers=headers)).status_code == 200
+    assert decoded == [_token(headers)]
+
+    token_cache.clear()
+    assert (await api.get("/users/me", headers=headers)).status_code == 200
+    assert decoded == [_token(headers)] * 2
+
+async def test_logout_revokes_the_token_everywhere(api, sign_up):
+    headers = await sign_up()
+    other_session = await _login(api)
+    for path in READS:
+        assert (await api.get(path, headers=headers)).status_code == 200
+    assert token_cache.peek(token_digest(_token(headers))) is not None
+
+    assert (await api.post("/logout", headers=headers)).status_code == 204
+    # Still cached as verified, and still rejected on every route
+    assert token_cache.peek(token_digest(_token(headers))) is not None
+    for path in READS:
+        assert (await api.get(path, headers=headers)).status_code == 401
+    add = await api.post("/users/me/subjects", json={"name": "CS101", "code": "CS101", "credits": 4}, headers=headers)
+    assert add.status_code == 401
+    assert (await api.post("/logout", headers=headers)).status_code == 401
+
+    # Only that token: the student's other session is unaffected
+    assert (await api.get("/users/me", headers=other_session)).status_code == 200
+
+async def test_password_change_revokes_earlier_tokens(api, sign_up):
+    headers = await sign_up()
+    other_session = await _login(api)
+    response = await api.post(
+        "/users/me/password", json={"current_password": "secret", "new_password": "changed"}, headers=headers
+    )
+    assert response.status_code == 200
+    new_session = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for old in (headers, other_session):
+        assert (await api.get("/users/me", headers=old)).status_code == 401
+    assert (await api.get("/users/me", headers=new_session)).status_code == 200
+    assert (await api.get("/users/me", headers=await _login(api, password="changed"))).status_code == 200
+
+async def test_revocations_are_kept_until_their_tokens_expire():
+    revocations = InMemoryRevocationList()
+    now = time.time()
+    await revocations.revoke_token(b"expired", now - 1)
+    await revocations.revoke_token(b"live", now + 60)
+    await revocations.revoke_user("R1", now, now + 60)
+    assert await revocations.is_revoked(b"live", "R2", now)
+    assert await revocations.is_revoked(b"other", "R1", now - 1)
+    assert not await revocations.is_revoked(b"other", "R1", now + 1)
+
+    # A later purge drops only the entry whose token has expired
+    revocations._next_purge = 0
+    await revocations.revoke_user("R1", now - 10, now + 30)
+    assert b"expired" not in revocations._tokens and b"live" in revocations._tokens
+    # Merging keeps the later cut-off and the later expiry
+    assert revocations._users["R1"] == (now, now + 60)
+
+def test_revocation_list_is_an_interface():
+    class Partial(RevocationList):
+        async def revoke_token(self, digest, expires_at):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,104 @@
+import pytest
+from app import semesters as semester_store
+from app.auth import principal_cache
+from app.semesters import migrate_semesters
+
+pytestmark = pytest.mark.anyio
+
+TOTALS = ("current_semester", "gpa_totals", "cgpa", "last_sgpa")
+
+async def _semester(api, headers, subjects, grades=None):
+    # Adds {code: credits} to the current semester, then completes it with grades
+    for code, credits in subjects.items():
+        response = await api.post("/users/me/subjects", json={"name": code, "code": code, "credits": credits}, headers=headers)
+        assert response.status_code == 200
+    if grades is not None:
+        assert (await api.post("/users/me/complete-semester", json=grades, headers=headers)).status_code == 200
+
+async def _snapshot(api, memory_db, reg_no, headers):
+    student = await memory_db.students.find_one({"reg_no": reg_no})
+    return (
+        (await api.get("/users/me", headers=headers)).json(),
+        (await api.get("/users/me/history", headers=headers)).json(),
+        (await api.get("/users/me/subjects", headers=headers)).json(),
+        (await api.get("/users/me/gpa", headers=headers)).json(),
+        {field: student.get(field) for field in TOTALS},
+    )
+
+async def _migrate(target):
+    report = await migrate_semesters(target, batch_size=2)
+    # The migration writes behind the app's back; drop principals cached before it
+    principal_cache.clear()
+    assert report["remaining"] == 0
+    return report
+
+async def test_round_trip_keeps_history_and_totals(api, sign_up, memory_db, monkeypatch):
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", False)
+    sessions = {reg_no: await sign_up(reg_no) for reg_no in ("R1", "R2", "R3")}
+    await _semester(api, sessions["R1"], {"CS101": 4, "MA101": 3}, {"CS101": "A", "MA101": "F"})
+    await _semester(api, sessions["R1"], {"CS201": 4}, {"CS201": "O", "MA101": "B"})
+    await _semester(api, sessions["R1"], {"CS301": 3})
+    await _semester(api, sessions["R2"], {"PH101": 2}, {"PH101": "C"})
+    before = {reg_no: await _snapshot(api, memory_db, reg_no, headers) for reg_no, headers in sessions.items()}
+
+    # Switch to split first, as in a deploy, then move the data
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", True)
+    # R3 never added a subject, so has no semesters to move
+    assert (await _migrate("split"))["moved"] == 2
+    assert await memory_db.students.count_documents({"semesters": {"$exists": True}}) == 0
+    assert await memory_db.semesters.count_documents({}) == 4
+    for reg_no, headers in sessions.items():
+        assert await _snapshot(api, memory_db, reg_no, headers) == before[reg_no]
+
+    # Back again while still in split mode, then switch the mode off
+    assert (await _migrate("embedded"))["moved"] == 2
+    assert await memory_db.semesters.count_documents({}) == 0
+    for reg_no, headers in sessions.items():
+        assert await _snapshot(api, memory_db, reg_no, headers) == before[reg_no]
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", False)
+    for reg_no, headers in sessions.items():
+        assert await _snapshot(api, memory_db, reg_no, headers) == before[reg_no]
+
+async def test_migration_is_idempotent(api, sign_up, memory_db, monkeypatch):
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", False)
+    headers = await sign_up()
+    await _semester(api, headers, {"CS101": 4}, {"CS101": "A"})
+    before = await _snapshot(api, memory_db, "R1", headers)
+
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", True)
+    await _migrate("split")
+    # A rerun from scratch finds nothing left to move
+    report = await migrate_semesters("split", restart=True)
+    assert (report["moved"], report["remaining"]) == (0, 0)
+    assert await memory_db.semesters.count_documents({}) == 1
+    principal_cache.clear()
+    assert await _snapshot(api, memory_db, "R1", headers) == before
+
+async def test_writes_after_migration_match_an_unmigrated_student(api, sign_up, memory_db, monkeypatch):
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", False)
+    first, second = {"CS101": 4, "MA101": 3}, {"CS201": 4}
+    grades = [{"CS101": "A", "MA101": "F"}, {"CS201": "B", "MA101": "A"}]
+
+    # The reference student does both semesters embedded
+    reference = await sign_up("R1")
+    await _semester(api, reference, first, grades[0])
+    await _semester(api, reference, second, grades[1])
+    await _semester(api, reference, {"PH301": 2})
+    expected = (await _snapshot(api, memory_db, "R1", reference))[1:]
+
+    # The other is moved to split between the two
+    migrated = await sign_up("R2")
+    await _semester(api, migrated, first, grades[0])
+    monkeypatch.setattr(semester_store, "SPLIT_STORAGE", True)
+    await _migrate("split")
+    await _semester(api, migrated, second, grades[1])
+    await _semester(api, migrated, {"PH301": 2})
+    assert "semesters" not in await memory_db.students.find_one({"reg_no": "R2"})
+    assert (await _snapshot(api, memory_db, "R2", migrated))[1:] == expected
+
+    # And back, reading the same in either mode
+    await _migrate("embedded")
+    for split in (True, False):
+        monkeypatch.setattr(semester_store, "SPLIT_STORAGE", split)
+        for reg_no, headers in (("R1", reference), ("R2", migrated)):
+            assert (await _snapshot(api, memory_db, reg_no, headers))[1:] == expected
@@ -0,0 +1,119 @@
+import asyncio
+import itertools
+import pytest
+from app import semesters as semester_store
+
+pytestmark = pytest.mark.anyio
+
+GRADES = {"CS101": "A", "MA101": "F"}
+
+async def _semester(api, headers, *codes):
+    for code in codes:
+        response = await api.post("/users/me/subjects", json={"name": code, "code": code, "credits": 4}, headers=headers)
+        assert response.status_code == 200
+
+async def _stored(memory_db, reg_no="R1"):
+    return await memory_db.students.find_one({"reg_no": reg_no})
+
+async def _history(api, headers):
+    return (await api.get("/users/me/history", headers=headers)).json()
+
+async def test_complete_semester(api, sign_up, layout, memory_db):
+    headers = await sign_up()
+    await _semester(api, headers, "CS101", "MA101")
+    response = await api.post("/users/me/complete-semester", json=GRADES, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"message": "Semester completed successfully", "next_semester": 2, "failed_carried_forward": 1}
+
+    student = await _stored(memory_db)
+    assert (student["current_semester"], student["cgpa"], student["last_sgpa"]) == (2, 8.0, 4.0)
+    assert await _history(api, headers) == [
+        {"semester_number": 1, "sgpa": 4.0, "subjects": [
+            {"name": "CS101", "code": "CS101", "credits": 4, "grade": "A"},
+            {"name": "MA101", "code": "MA101", "credits": 4, "grade": "F"},
+        ]},
+        {"semester_number": 2, "sgpa": None, "subjects": [{"name": "MA101", "code": "MA101", "credits": 4, "grade": None}]},
+    ]
+
+async def test_double_submit_completes_once(api, sign_up, layout, memory_db):
+    headers = await sign_up()
+    await _semester(api, headers, "CS101", "MA101")
+    responses = await asyncio.gather(*(
+        api.post("/users/me/complete-semester", json=GRADES, headers=headers) for _ in range(3)
+    ))
+    assert sorted(response.status_code for response in responses) == [200, 409, 409]
+
+    student = await _stored(memory_db)
+    assert (student["current_semester"], student["gpa_totals"]["credits"]) == (2, 4)
+    # The failed subject is carried over once
+    history = await _history(api, headers)
+    assert [sub["code"] for sub in history[1]["subjects"]] == ["MA101"]
+
+async def test_completed_semester_cannot_be_completed_again(api, sign_up, layout, memory_db):
+    headers = await sign_up()
+    await _semester(api, headers, "CS101", "MA101")
+    assert (await api.post("/users/me/complete-semester", json=GRADES, headers=headers)).status_code == 200
+    before = await _stored(memory_db)
+
+    # Semester 2 holds the carried subject; a retried request for semester 1 must not grade it
+    response = await api.post("/users/me/complete-semester", json=GRADES, headers=headers)
+    assert response.status_code == 409
+    after = await _stored(memory_db)
+    assert (after["current_semester"], after["gpa_totals"], after["version"]) == (2, before["gpa_totals"], before["version"])
+
+async def test_semester_changed_during_completion_returns_409(api, sign_up, layout, monkeypatch):
+    headers = await sign_up()
+    await _semester(api, headers, "CS101", "MA101")
+    complete = semester_store.complete
+    electives = (f"EL{n}" for n in itertools.count(101))
+
+    async def racing_complete(student, *args):
+        # Another request adds a subject between the read and the guarded write, every time
+        await _semester(api, headers, next(electives))
+        return await complete(student, *args)
+
+    monkeypatch.setattr(semester_store, "complete", racing_complete)
+    response = await api.post("/users/me/complete-semester", json=GRADES, headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Semester changed while completing, please retry"
+
+async def test_idempotency_key_replays_the_first_response(api, sign_up, layout, memory_db):
+    headers = {**await sign_up(), "Idempotency-Key": "complete-1"}
+    await _semester(api, headers, "CS101", "MA101")
+    first = await api.post("/users/me/complete-semester", json=GRADES, headers=headers)
+    stored = await _stored(memory_db)
+
+    # Sequential and concurrent retries get the original body and change nothing
+    retries = [await api.post("/users/me/complete-semester", json=GRADES, headers=headers)]
+    retries += await asyncio.gather(*(api.post("/users/me/complete-semester", json=GRADES, headers=headers) for _ in range(2)))
+    assert all((retry.status_code, retry.json()) == (200, first.json()) for retry in retries)
+
+    replayed = await _stored(memory_db)
+    for field in ("current_semester", "gpa_totals", "cgpa", "last_sgpa", "version"):
+        assert replayed[field] == stored[field]
+    assert len(await _history(api, headers)) == 2
+
+async def test_concurrent_requests_with_one_idempotency_key(api, sign_up, layout, memory_db):
+    headers = {**await sign_up(), "Idempotency-Key": "complete-1"}
+    await _semester(api, headers, "CS101", "MA101")
+    responses = await asyncio.gather(*(
+        api.post("/users/me/complete-semester", json=GRADES, headers=headers) for _ in range(3)
+    ))
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.text for response in responses}) == 1
+    assert (await _stored(memory_db))["current_semester"] == 2
+
+async def test_layouts_complete_the_same_way(api, sign_up, monkeypatch, memory_db):
+    results = {}
+    for reg_no, split in (("R1", False), ("R2", True)):
+        monkeypatch.setattr(semester_store, "SPLIT_STORAGE", split)
+        headers = await sign_up(reg_no)
+        await _semester(api, headers, "CS101", "MA101", "PH101")
+        response = await api.post("/users/me/complete-semester", json={**GRADES, "PH101": "O"}, headers=headers)
+        student = await _stored(memory_db, reg_no)
+        results[split] = (
+            response.json(), await _history(api, headers),
+            {field: student[field] for field in ("current_semester", "gpa_totals", "cgpa", "last_sgpa")}
+        )
+    assert "semesters" not in await _stored(memory_db, "R2")
+    assert results[False] == results[True]
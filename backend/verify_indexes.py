@@ -0,0 +1,65 @@
+import asyncio
+import sys
+from datetime import datetime
+from bson import ObjectId
+from app.database import db, ensure_indexes
+
+# One entry per query shape issued by the routes: (collection, filter, sort)
+SAMPLE_ID = ObjectId()
+NOW = datetime.utcnow()
+ROUTE_QUERIES = [
+    ("students", {"reg_no": "TEST001"}, None),
+    ("students", {"$or": [{"reg_no": "TEST001"}, {"email": "test@example.com"}]}, None),
+    ("students", {"_id": SAMPLE_ID}, None),
+    ("students", {"_id": SAMPLE_ID, "semesters.semester_number": 1}, None),
+    ("students", {"pending_jobs.at": {"$lte": NOW}}, None),
+    ("chat_messages", {"student_id": SAMPLE_ID}, [("_id", -1)]),
+    ("chat_messages", {"student_id": SAMPLE_ID, "_id": {"$gt": SAMPLE_ID}}, [("_id", -1)]),
+    ("chat_messages", {"student_id": SAMPLE_ID, "_id": {"$lt": SAMPLE_ID}}, [("_id", -1)]),
+    ("chat_summaries", {"student_id": SAMPLE_ID}, None),
+    ("semesters", {"student_id": SAMPLE_ID}, [("semester_number", 1)]),
+    ("semesters", {"student_id": SAMPLE_ID, "semester_number": 1}, None),
+    ("semesters", {"student_id": SAMPLE_ID, "semester_number": {"$in": [1, 2]}}, None),
+    ("jobs", {"key": f"cohort_stats:{SAMPLE_ID}", "state": "queued"}, None),
+    ("jobs", {"$or": [
+        {"state": "queued", "run_at": {"$lte": NOW}},
+        {"state": "running", "lease_until": {"$lte": NOW}},
+    ]}, [("run_at", 1)]),
+    ("jobs", {"state": "queued", "run_at": {"$lte": NOW}}, [("run_at", 1)]),
+]
+
+def find_stages(plan, stage):
+    # Walks a winning plan (classic or SBE layout) for the given stage name
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            yield plan
+        for value in plan.values():
+            yield from find_stages(value, stage)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from find_stages(item, stage)
+
+async def verify_indexes():
+    await ensure_indexes()
+
+    failures = 0
+    for collection, query, sort in ROUTE_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+
+        if any(find_stages(winning_plan, "COLLSCAN")):
+            failures += 1
+            print(f"COLLSCAN  {collection} {query}")
+        else:
+            print(f"OK        {collection} {query}")
+
+    if failures:
+        print(f"\n{failures} route queries fall back to a collection scan")
+        sys.exit(1)
+    print("\nAll route queries use an index")
+
+if __name__ == "__main__":
+    asyncio.run(verify_indexes())
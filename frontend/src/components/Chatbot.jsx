@@ -71,7 +71,11 @@ const Chatbot = () => {
             setMessages(prev => [...prev, botResponse]);
         } catch (error) {
             console.error("Chat error:", error);
-            setMessages(prev => [...prev, { role: 'assistant', content: "Sorry, I'm having trouble connecting to the server." }]);
+            // Rate limit responses explain how long to wait
+            const content = error.response?.status === 429
+                ? error.response.data.detail
+                : "Sorry, I'm having trouble connecting to the server.";
+            setMessages(prev => [...prev, { role: 'assistant', content }]);
         } finally {
             setIsLoading(false);
         }
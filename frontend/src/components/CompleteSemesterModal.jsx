@@ -8,12 +8,18 @@ const CompleteSemesterModal = ({ isOpen, onClose, subjects, onSemesterCompleted
     const [grades, setGrades] = useState({});
     const [loading, setLoading] = useState(false);
     const [mounted, setMounted] = useState(false);
+    const [idempotencyKey, setIdempotencyKey] = useState(null);
 
     useEffect(() => {
         setMounted(true);
         return () => setMounted(false);
     }, []);
 
+    // One key per opening of the modal, so retries and double-submits promote only once
+    useEffect(() => {
+        if (isOpen) setIdempotencyKey(crypto.randomUUID());
+    }, [isOpen]);
+
     const handleGradeChange = (code, grade) => {
         setGrades(prev => ({ ...prev, [code]: grade }));
     };
@@ -22,7 +28,9 @@ const CompleteSemesterModal = ({ isOpen, onClose, subjects, onSemesterCompleted
         e.preventDefault();
         setLoading(true);
         try {
-            await api.post('/users/me/complete-semester', grades);
+            await api.post('/users/me/complete-semester', grades, {
+                headers: { 'Idempotency-Key': idempotencyKey }
+            });
             onSemesterCompleted();
             onClose();
         } catch (error) {
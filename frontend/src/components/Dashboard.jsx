@@ -4,7 +4,6 @@ import { motion } from 'framer-motion';
 import { BookOpen, TrendingUp, Award, Clock, Plus, CheckCircle, History, Sparkles, ChevronRight } from 'lucide-react';
 import { useNavigate } from 'react-router-dom';
 import api from '../lib/api';
-import { calculateCGPA, calculateSGPA } from '../lib/calculations';
 import AddSubjectModal from './AddSubjectModal';
 import CompleteSemesterModal from './CompleteSemesterModal';
 
@@ -60,7 +59,6 @@ const Dashboard = () => {
     const { user } = useAuth();
     const navigate = useNavigate();
     const [subjects, setSubjects] = useState([]);
-    const [history, setHistory] = useState([]);
     const [cgpa, setCgpa] = useState(0);
     const [lastSemSgpa, setLastSemSgpa] = useState("N/A");
     const [loading, setLoading] = useState(true);
@@ -69,23 +67,16 @@ const Dashboard = () => {
 
     const fetchSubjects = async () => {
         try {
-            const [subjectsRes, historyRes] = await Promise.all([
+            const [subjectsRes, gpaRes] = await Promise.all([
                 api.get('/users/me/subjects'),
-                api.get('/users/me/history')
+                api.get('/users/me/gpa')
             ]);
             setSubjects(subjectsRes.data);
-            setHistory(historyRes.data);
-            setCgpa(calculateCGPA(historyRes.data));
 
-            // Calculate Last Sem SGPA
-            if (historyRes.data.length > 0) {
-                // Sort by semester number descending to find latest
-                const sortedHistory = [...historyRes.data].sort((a, b) => b.semester_number - a.semester_number);
-                const lastSem = sortedHistory[0];
-                setLastSemSgpa(calculateSGPA(lastSem.subjects));
-            } else {
-                setLastSemSgpa("N/A");
-            }
+            // SGPA/CGPA are maintained by the backend on every write
+            const { cgpa, last_sgpa } = gpaRes.data;
+            setCgpa(cgpa !== null ? cgpa.toFixed(2) : 0);
+            setLastSemSgpa(last_sgpa !== null ? last_sgpa.toFixed(2) : "N/A");
         } catch (error) {
             console.error("Failed to fetch data", error);
         } finally {
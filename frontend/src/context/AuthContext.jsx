@@ -55,6 +55,11 @@ export const AuthProvider = ({ children }) => {
     };
 
     const logout = () => {
+        // Revoke the token server-side; the local session ends either way
+        const token = localStorage.getItem('token');
+        if (token) {
+            api.post('/logout', null, { headers: { Authorization: `Bearer ${token}` } }).catch(() => {});
+        }
         setUser(null);
         localStorage.removeItem('token');
     };
@@ -11,13 +11,16 @@ export const getGradePoint = (grade) => {
     return gradeMap[grade] !== undefined ? gradeMap[grade] : 0;
 };
 
+const isGraded = (sub) => sub.grade !== null && sub.grade !== undefined && sub.grade !== '';
+
+// Only graded subjects count, as in calculate_sgpa in backend/app/gpa.py
 export const calculateSGPA = (subjects) => {
     if (!subjects || subjects.length === 0) return 0;
 
     let totalPoints = 0;
     let totalCredits = 0;
 
-    subjects.forEach(sub => {
+    subjects.filter(isGraded).forEach(sub => {
         const points = getGradePoint(sub.grade);
         totalPoints += points * sub.credits;
         totalCredits += sub.credits;
@@ -37,7 +40,7 @@ export const calculateCGPA = (history) => {
 
     history.forEach(sem => {
         sem.subjects.forEach(sub => {
-            if (sub.grade === 'F') {
+            if (sub.grade === 'F' || !isGraded(sub)) {
                 
                 return;
             }